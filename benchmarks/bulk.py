@@ -0,0 +1,58 @@
+"""throughput of encode_many / decode_many
+
+encodes and decodes a batch of compressed + encrypted BUS messages
+inline, with a thread pool and with a process pool, and reports
+messages per second and messages per second per core used
+
+    python -m benchmarks.bulk
+"""
+import os
+import time
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.bulk import encode_many, decode_many
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+CRYPTO_KEY = "ivf1NQSkQNogWYyr"
+
+
+def sample_messages(n: int) -> list:
+    return [HiveMessage(HiveMessageType.BUS,
+                        Message("recognizer_loop:utterance",
+                                {"utterances": [f"what is the weather like in city {i}"] * 4,
+                                 "lang": "en-us"},
+                                {"source": "audio", "destination": "skills",
+                                 "session": {"session_id": "default", "lang": "en-us",
+                                             "active_skills": [["skill-weather", i]]}}))
+            for i in range(n)]
+
+
+def _rate(n, elapsed, cores):
+    return {"msgs_per_sec": round(n / elapsed), "msgs_per_sec_per_core": round(n / elapsed / cores)}
+
+
+def run(n=20000, batch_size=256):
+    msgs = sample_messages(n)
+    cpus = os.cpu_count() or 1
+    modes = [("inline", 1, False), ("threads", cpus, False), ("processes", cpus, True)]
+    results = []
+    for name, workers, procs in modes:
+        kwargs = dict(crypto_key=CRYPTO_KEY, batch_size=batch_size,
+                      workers=workers, use_processes=procs)
+        start = time.perf_counter()
+        frames = list(encode_many(msgs, compressed=True, **kwargs))
+        enc = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = sum(1 for _ in decode_many(frames, **kwargs))
+        dec = time.perf_counter() - start
+        assert decoded == n
+        results.append({"mode": name, "workers": workers,
+                        "encode": _rate(n, enc, workers),
+                        "decode": _rate(n, dec, workers)})
+    return results
+
+
+if __name__ == "__main__":
+    for r in run():
+        print(r)
@@ -0,0 +1,194 @@
+"""cost of forwarding one OVOS bus message to the master
+
+simulates the local ovos bus emitting a raw "message" string addressed to
+the master and runs it through
+HiveMindSlaveInternalProtocol.handle_outgoing_mycroft -> HiveMessageBusClient.emit
+up to the final (compressed + encrypted) websocket payload
+
+reports time, peak transient memory and the number of json encode/decode
+calls, compression calls and Message/HiveMessage objects built per message
+
+--compare also runs the legacy chain the client used before forwarded
+messages were encoded once (deserialize -> serialize -> Message -> serialize,
+compressing twice in auto mode), so both sides of the comparison are measured
+on the same machine
+
+    python -m benchmarks.forwarding
+    python -m benchmarks.forwarding --compare
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+from ovos_bus_client.message import Message
+
+from bitstring import BitArray
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.identity import NodeIdentity
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.protocol import HiveMindSlaveInternalProtocol
+from hivemind_bus_client.serialization import _TYPE2INT
+from hivemind_bus_client.util import cast2bytes, encrypt_bin
+
+
+class _FakeIdentityFile(dict):
+    path = "/dev/null"
+
+
+class _FakeSocket:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, payload, opcode=None):
+        self.sent += len(payload)
+
+
+class _FakeProtocol:
+    binarize = True
+
+
+def offline_client(compress=True, binarize=True, crypto_key="ivf1NQSkQNogWYyr"):
+    """ a HiveMessageBusClient that never touches the network """
+    identity = NodeIdentity(_FakeIdentityFile())
+    bus = HiveMessageBusClient(key="bench", password="bench", identity=identity,
+                               crypto_key=crypto_key, compress=compress,
+                               binarize=binarize)
+    bus.client = _FakeSocket()
+    bus.protocol = _FakeProtocol()
+    bus.connected_event.set()
+    return bus
+
+
+def forwarded_message(node_id="master") -> str:
+    return Message("speak", {"utterance": "the weather today is sunny with a chance of hive",
+                             "expect_response": False, "lang": "en-us"},
+                   {"destination": [node_id], "source": "audio",
+                    "session": {"session_id": "default", "lang": "en-us",
+                                "active_skills": [["skill-weather", 1.0]]},
+                    "site_id": "living_room"}).serialize()
+
+
+# the pre-optimization path, kept here to reproduce the comparison
+def _legacy_bitstring_v1(hive_type, payload, compressed):
+    s = BitArray()
+    s.append('uint:1=1')
+    s.append('uint:1=0')
+    s.append(f'uint:5={_TYPE2INT.get(hive_type, 11)}')
+    s.append(f'uint:1={int(bool(compressed))}')
+    hivemeta = cast2bytes({}, compressed)
+    s.append(f'uint:8={len(hivemeta)}')
+    s.append(hivemeta)
+    if hasattr(payload, "serialize"):
+        payload = payload.serialize()
+    s.append(cast2bytes(payload, compressed))
+    while len(s) % 8 != 0:
+        s.insert('uint:1=0', 0)
+    return s
+
+
+def legacy_forward(bus: HiveMessageBusClient, raw: str, node_id: str = "master"):
+    """ HiveMindSlaveInternalProtocol.handle_outgoing_mycroft -> emit as they used to be """
+    message = Message.deserialize(raw)
+    peers = message.context.get("destination")
+    if not isinstance(peers, list):
+        peers = [peers]
+    if node_id not in peers:
+        return
+    hmessage = HiveMessage(HiveMessageType.BUS, payload=message.serialize())
+    ctxt = dict(hmessage.payload.context)
+    ctxt.setdefault("source", bus.useragent)
+    ctxt.setdefault("platform", bus.useragent)
+    ctxt.setdefault("destination", "HiveMind")
+    hmessage.payload.context = ctxt  # assigned to a throwaway Message, as it was
+    bus.internal_bus.emit(hmessage.payload)
+    if bus.binarize:
+        if bus.compress is None:  # auto, built both ways
+            unc = _legacy_bitstring_v1(hmessage.msg_type, hmessage.payload, False)
+            comp = _legacy_bitstring_v1(hmessage.msg_type, hmessage.payload, True)
+            bitstr = unc if len(unc) <= len(comp) else comp
+        else:
+            bitstr = _legacy_bitstring_v1(hmessage.msg_type, hmessage.payload, bus.compress)
+        ws_payload = encrypt_bin(bus.crypto_key, bitstr.bytes) if bus.crypto_key else bitstr.bytes
+    else:
+        ws_payload = hmessage.serialize()
+        if bus.crypto_key:
+            from hivemind_bus_client.util import encrypt_as_json
+            ws_payload = encrypt_as_json(bus.crypto_key, ws_payload)
+    bus.client.send(ws_payload)
+
+
+@contextmanager
+def count_calls():
+    """ count the expensive calls made inside the block """
+    counts = Counter()
+    patched = [(json, "dumps"), (json, "loads"), (zlib, "compress"),
+               (Message, "__init__"), (HiveMessage, "__init__")]
+    originals = [getattr(obj, name) for obj, name in patched]
+
+    def wrap(label, func):
+        def wrapper(*args, **kwargs):
+            counts[label] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    for (obj, name), func in zip(patched, originals):
+        label = f"{getattr(obj, '__name__', obj)}.{name}"
+        setattr(obj, name, wrap(label, func))
+    try:
+        yield counts
+    finally:
+        for (obj, name), func in zip(patched, originals):
+            setattr(obj, name, func)
+
+
+def run(n=2000, compress=True, binarize=True, legacy=False):
+    bus = offline_client(compress=compress, binarize=binarize)
+    if legacy:
+        def forward(raw):
+            legacy_forward(bus, raw)
+    else:
+        forward = HiveMindSlaveInternalProtocol(hm_bus=bus, node_id="master").handle_outgoing_mycroft
+    raw = forwarded_message()
+
+    for _ in range(50):  # warmup, fill caches
+        forward(raw)
+
+    with count_calls() as counts:
+        forward(raw)
+
+    tracemalloc.start()
+    forward(raw)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(n):
+        forward(raw)
+    elapsed = time.perf_counter() - start
+    return {"path": "legacy" if legacy else "current",
+            "compress": compress, "binarize": binarize,
+            "us_per_msg": round(elapsed / n * 1e6, 1),
+            "peak_bytes_per_msg": peak,
+            "calls_per_msg": dict(counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cost of forwarding one bus message to the master")
+    parser.add_argument("--compare", action="store_true",
+                        help="also measure the legacy serialize -> loads -> serialize chain")
+    parser.add_argument("-n", type=int, default=2000, help="messages per timing run")
+    args = parser.parse_args()
+    for compress in (True, None, False):
+        for binarize in (True, False):
+            print(run(args.n, compress=compress, binarize=binarize))
+            if args.compare:
+                print(run(args.n, compress=compress, binarize=binarize, legacy=True))
+
+
+if __name__ == "__main__":
+    main()
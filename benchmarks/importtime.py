@@ -0,0 +1,74 @@
+"""import time budget, keeps the cli and the package import cheap
+
+every entry is imported in a fresh interpreter with `python -X importtime`,
+the check fails if the cumulative import time goes over its budget or if
+the import pulls in one of the heavy dependencies it is supposed to defer
+
+    python -m benchmarks.importtime             # exit code 1 if a budget is exceeded
+    python -m benchmarks.importtime --scale 2   # slow CI runners
+
+budgets are generous (a laptop measures a small fraction of them),
+the forbidden module list is what actually catches regressions
+"""
+import argparse
+import subprocess
+import sys
+
+# heavy dependencies, only loaded by code that needs them
+HEAVY = ("ovos_bus_client", "ovos_config", "json_database", "poorman_handshake",
+         "pgpy", "websocket", "pyee", "bitstring", "Cryptodome")
+
+# module -> (budget in ms, heavy modules it must not import)
+BUDGETS = {
+    # `hivemind-client --help` and the click group of every command
+    "hivemind_bus_client.scripts": (150, HEAVY),
+    # the package itself, HiveMessageBusClient etc. are resolved on first access
+    "hivemind_bus_client": (50, HEAVY),
+    # json_database is only imported once the default identity file is opened
+    "hivemind_bus_client.identity": (50, HEAVY),
+}
+
+
+def measure(module: str) -> tuple:
+    """ (cumulative import time in ms, top level packages imported) of module """
+    code = (f"import sys, {module}\n"
+            f"print(','.join(sorted({{m.split('.')[0] for m in sys.modules}})))")
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         capture_output=True, text=True, check=True)
+    cumulative = 0
+    for line in out.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1])
+    return cumulative / 1000, set(out.stdout.strip().split(","))
+
+
+def check(scale: float = 1.0) -> list:
+    """ list of (module, problem) for every budget exceeded """
+    failures = []
+    for module, (budget, forbidden) in BUDGETS.items():
+        ms, imported = measure(module)
+        print(f"{module}: {ms:.1f} ms (budget {budget * scale:.0f} ms)")
+        if ms > budget * scale:
+            failures.append((module, f"{ms:.1f} ms > {budget * scale:.0f} ms"))
+        heavy = sorted(imported.intersection(forbidden))
+        if heavy:
+            failures.append((module, f"imports {', '.join(heavy)}"))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hivemind_bus_client import time budget")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply every budget, for slow machines (default: 1)")
+    args = parser.parse_args()
+    failures = check(args.scale)
+    for module, problem in failures:
+        print(f"OVER BUDGET {module}: {problem}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
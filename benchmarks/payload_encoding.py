@@ -0,0 +1,84 @@
+"""size and speed of the v2 payload encodings on realistic OVOS messages
+
+compares json, json + zlib, msgpack and msgpack + zlib v2 frames
+(before encryption), the msgpack numbers are reported for both the
+pure python packer and the optional msgpack package when installed
+
+    python -m benchmarks.payload_encoding
+"""
+import base64
+import time
+
+from ovos_bus_client.message import Message
+
+import hivemind_bus_client.packing as packing
+from hivemind_bus_client.message import HiveMessageType
+from hivemind_bus_client.serialization import get_bitstring, decode_bitstring
+
+SESSION = {"session_id": "default", "lang": "en-us", "pipeline": [
+    "converse", "padatious_high", "adapt_high", "fallback_high",
+    "common_qa", "padatious_medium", "adapt_medium", "fallback_medium",
+    "padatious_low", "adapt_low", "fallback_low"],
+           "active_skills": [["skill-weather", 1714000000.5], ["skill-date-time", 1714000001.2]],
+           "utterance_states": {}, "site_id": "living_room", "system_unit": "metric"}
+
+
+def sample_messages() -> dict:
+    audio = bytes(range(256)) * 64  # 16 KiB of "audio"
+    return {
+        "speak": Message("speak", {"utterance": "it is sunny, 23 degrees", "lang": "en-us",
+                                   "expect_response": False},
+                         {"source": "skill-weather", "destination": ["audio"]}),
+        "utterance": Message("recognizer_loop:utterance",
+                             {"utterances": ["what is the weather like today"], "lang": "en-us"},
+                             {"source": "audio", "destination": "skills", "session": SESSION}),
+        "numeric": Message("ovos.sensor.readings",
+                           {"temperature": [21.5 + i / 10 for i in range(64)],
+                            "timestamps": [1714000000 + i for i in range(64)]},
+                           {"source": "sensor"}),
+        "audio_b64": Message("ovos.audio.chunk",
+                             {"audio": base64.b64encode(audio).decode("utf-8"), "rate": 16000},
+                             {"source": "mic"}),
+        "audio_raw": Message("ovos.audio.chunk",
+                             {"audio": audio, "rate": 16000},
+                             {"source": "mic"}),
+    }
+
+
+def _time(func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return round((time.perf_counter() - start) / n * 1e6, 1)
+
+
+def run(n=2000):
+    results = []
+    accelerated = packing._msgpack
+    backends = [("json", None, "json"), ("msgpack-py", None, "msgpack")]
+    if accelerated is not None:
+        backends.append(("msgpack-c", accelerated, "msgpack"))
+    try:
+        for name, msg in sample_messages().items():
+            for label, backend, encoding in backends:
+                if encoding == "json" and isinstance(msg.data.get("audio"), bytes):
+                    continue  # raw bytes are not json serializable
+                packing._msgpack = backend
+                for compressed in (False, True):
+                    def enc():
+                        return get_bitstring(HiveMessageType.BUS, msg, compressed=compressed,
+                                             proto_version=2, payload_encoding=encoding)
+
+                    frame = enc()
+                    results.append({"message": name, "encoding": label,
+                                    "zlib": compressed, "bytes": len(frame),
+                                    "encode_us": _time(enc, n),
+                                    "decode_us": _time(lambda: decode_bitstring(frame), n)})
+    finally:
+        packing._msgpack = accelerated
+    return results
+
+
+if __name__ == "__main__":
+    for r in run():
+        print(r)
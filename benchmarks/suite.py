@@ -0,0 +1,249 @@
+"""benchmark suite, serialization, crypto, dispatch and end to end throughput
+
+micro-benchmarks report microseconds per operation (best of a few
+repeats), the loopback benchmarks run a HiveMessageBusClient against
+the in-package MockHiveMaster and report messages per second and
+p50/p99 round trip latency
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json  # exit code 1 on regressions
+    python -m benchmarks.suite --only bitstring --quick
+
+results are compared by us_per_op (lower is better) and msgs_per_sec (higher is better),
+anything more than --threshold (default 15%) worse than the baseline is a regression
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from threading import Event
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.decorators import on_mycroft_message, on_hive_message
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.serialization import get_bitstring, decode_bitstring
+from hivemind_bus_client.util import encrypt_bin, decrypt_bin, encrypt_as_json, decrypt_from_json
+from hivemind_bus_client.version import VERSION_MAJOR, VERSION_MINOR, VERSION_BUILD
+
+from benchmarks.forwarding import offline_client
+
+CRYPTO_KEY = "ivf1NQSkQNogWYyr"
+PASSWORD = "benchmark-password-that-is-long-enough"
+
+PAYLOAD_SIZES = {"small": 32, "medium": 1024, "large": 32 * 1024}
+
+
+def _message(size: int) -> Message:
+    text = ("the quick brown fox jumps over the lazy dog " * (size // 44 + 1))[:size]
+    return Message("speak", {"utterance": text, "lang": "en-us"},
+                   {"source": "skills", "destination": ["audio"],
+                    "session": {"session_id": "default", "lang": "en-us"}})
+
+
+def timeit(func, number: int, repeat: int = 3) -> dict:
+    """ best of repeat runs of number calls """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    us = best / number * 1e6
+    return {"us_per_op": round(us, 3), "ops_per_sec": round(1e6 / us)}
+
+
+def bench_bitstring(n):
+    results = {}
+    for size_name, size in PAYLOAD_SIZES.items():
+        msg = _message(size)
+        for proto in (1, 2):
+            for compressed in (False, True):
+                name = f"v{proto}.{size_name}.{'zlib' if compressed else 'raw'}"
+
+                def enc():
+                    return get_bitstring(HiveMessageType.BUS, msg, compressed=compressed,
+                                         proto_version=proto, versioned=proto > 1)
+
+                frame = enc()
+                results[f"get_bitstring.{name}"] = timeit(enc, n)
+                results[f"decode_bitstring.{name}"] = timeit(lambda: decode_bitstring(frame), n)
+    return results
+
+
+def bench_crypto(n):
+    results = {}
+    for size_name, size in PAYLOAD_SIZES.items():
+        data = bytes(size)
+        ciphertext = encrypt_bin(CRYPTO_KEY, data)
+        results[f"encrypt_bin.{size_name}"] = timeit(lambda: encrypt_bin(CRYPTO_KEY, data), n)
+        results[f"decrypt_bin.{size_name}"] = timeit(lambda: decrypt_bin(CRYPTO_KEY, ciphertext), n)
+        text = HiveMessage(HiveMessageType.BUS, _message(size)).serialize()
+        enc = encrypt_as_json(CRYPTO_KEY, text)
+        results[f"encrypt_as_json.{size_name}"] = timeit(lambda: encrypt_as_json(CRYPTO_KEY, text), n)
+        results[f"decrypt_from_json.{size_name}"] = timeit(lambda: decrypt_from_json(CRYPTO_KEY, enc), n)
+    return results
+
+
+def bench_message(n):
+    msg = _message(PAYLOAD_SIZES["medium"])
+    as_dict = {"type": msg.msg_type, "data": msg.data, "context": msg.context}
+    bus_msg = HiveMessage(HiveMessageType.BUS, msg)
+    nested = HiveMessage(HiveMessageType.BROADCAST, bus_msg.as_dict)
+    return {
+        "HiveMessage.from_message": timeit(lambda: HiveMessage(HiveMessageType.BUS, msg), n),
+        "HiveMessage.from_dict": timeit(lambda: HiveMessage(HiveMessageType.BUS, as_dict), n),
+        "HiveMessage.payload.bus": timeit(lambda: bus_msg.payload, n),
+        "HiveMessage.payload.broadcast": timeit(lambda: nested.payload, n),
+        "HiveMessage.serialize": timeit(bus_msg.serialize, n),
+    }
+
+
+def bench_dispatch(n):
+    """ cost of delivering one received BUS message to N decorated handlers """
+    results = {}
+    message = HiveMessage(HiveMessageType.BUS, _message(PAYLOAD_SIZES["small"]))
+    for fan_out in (1, 10, 100):
+        bus = offline_client()
+        for _ in range(fan_out):
+            on_mycroft_message(payload_type="speak", bus=bus)(lambda m: None)
+            on_hive_message(HiveMessageType.BUS, bus=bus)(lambda m: None)
+        results[f"dispatch.handlers_{fan_out}"] = timeit(
+            lambda: bus._handle_hive_protocol(message), max(n // fan_out, 10))
+    return results
+
+
+def _loopback(n, binarize, compress, payload_encoding="json", context_delta=False):
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+    from hivemind_bus_client.mock import MockHiveMaster
+    from benchmarks.forwarding import _FakeIdentityFile
+
+    with MockHiveMaster(password=PASSWORD, payload_encoding=payload_encoding,
+                        context_delta=context_delta) as master:
+        bus = HiveMessageBusClient("bench", password=PASSWORD, port=master.port,
+                                   identity=NodeIdentity(_FakeIdentityFile()),
+                                   binarize=binarize, compress=compress)
+        bus.connect()
+        sent, rtts = {}, []
+        done = Event()
+
+        def handle_echo(message):
+            seq = message.payload.data.get("seq")
+            if seq in sent:
+                rtts.append(time.perf_counter() - sent.pop(seq))
+                if len(rtts) >= n:
+                    done.set()
+
+        bus.on(HiveMessageType.BUS, handle_echo)
+        msg = _message(PAYLOAD_SIZES["small"])
+        start = time.perf_counter()
+        for seq in range(n):
+            sent[seq] = time.perf_counter()
+            bus.emit(Message(msg.msg_type, dict(msg.data, seq=seq), dict(msg.context)))
+        done.wait(60)
+        elapsed = time.perf_counter() - start
+        bus.close()
+
+    rtts.sort()
+    return {"msgs_per_sec": round(len(rtts) / elapsed),
+            "lost": n - len(rtts),
+            "p50_ms": round(rtts[len(rtts) // 2] * 1000, 3) if rtts else None,
+            "p99_ms": round(rtts[int(len(rtts) * 0.99)] * 1000, 3) if rtts else None}
+
+
+def bench_loopback(n):
+    n = max(n // 10, 100)
+    return {
+        "loopback.json": _loopback(n, binarize=False, compress=False),
+        "loopback.binarized": _loopback(n, binarize=True, compress=None),
+        "loopback.binarized.msgpack_delta": _loopback(n, binarize=True, compress=None,
+                                                      payload_encoding="msgpack",
+                                                      context_delta=True),
+    }
+
+
+BENCHMARKS = {
+    "bitstring": bench_bitstring,
+    "crypto": bench_crypto,
+    "message": bench_message,
+    "dispatch": bench_dispatch,
+    "loopback": bench_loopback,
+}
+
+
+def run(only=None, n=2000) -> dict:
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        print(f"running {name}...", file=sys.stderr)
+        results.update(bench(n))
+    return {"meta": {"version": f"{VERSION_MAJOR}.{VERSION_MINOR}.{VERSION_BUILD}",
+                     "python": platform.python_version(),
+                     "platform": platform.platform(),
+                     "time": time.time()},
+            "results": results}
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.15) -> list:
+    """ list of (name, metric, baseline, current, change) that got worse than threshold """
+    regressions = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            continue
+        for metric, higher_is_better in (("us_per_op", False), ("msgs_per_sec", True)):
+            if not base.get(metric) or cur.get(metric) is None:
+                continue
+            change = (cur[metric] - base[metric]) / base[metric]
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append((name, metric, base[metric], cur[metric], change))
+    return regressions
+
+
+def metric_summary(current: dict, baseline: dict) -> str:
+    ratios = [current["results"][k]["us_per_op"] / v["us_per_op"]
+              for k, v in baseline["results"].items()
+              if v.get("us_per_op") and k in current["results"]]
+    if not ratios:
+        return "n/a"
+    return f"{statistics.median(ratios):.2f}x baseline time per op"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hivemind_bus_client benchmark suite")
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--baseline", help="compare against results stored in this file")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative slowdown reported as a regression (default: 0.15)")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS),
+                        help="only run these benchmark groups")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, noisier results")
+    args = parser.parse_args()
+
+    results = run(only=args.only, n=200 if args.quick else 2000)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    for name, r in results["results"].items():
+        print(name, r)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, base, cur, change in regressions:
+            print(f"REGRESSION {name} {metric}: {base} -> {cur} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} "
+              f"(median {metric_summary(results, baseline)})")
+
+
+if __name__ == "__main__":
+    main()
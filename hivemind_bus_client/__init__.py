@@ -1,2 +1,22 @@
-from .client import HiveMessageBusClient
-from .message import HiveMessage, HiveMessageType
+# resolved on first access, importing a submodule (e.g. for the cli or
+# hivemind_bus_client.message) should not pay for the whole client stack
+_LAZY = {
+    "HiveMessageBusClient": "hivemind_bus_client.client",
+    "HiveMessage": "hivemind_bus_client.message",
+    "HiveMessageType": "hivemind_bus_client.message",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value  # next access skips __getattr__
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,179 @@
+"""pipelined sending of many messages over one connection
+
+used by "hivemind-client send-batch", reads json lines, one message each
+
+    {"type": "recognizer_loop:utterance", "data": {"utterances": ["hi"]}}   -> BUS
+    {"msg_type": "escalate", "payload": {"type": "speak", "data": {...}}}    -> any HiveMessage
+
+when waiting for replies every message is tagged with a correlation id
+and at most `window` messages are in flight, the next one is sent as soon
+as a reply arrives or a pending one times out, without replies messages
+are written back to back and the socket provides the flow control
+"""
+import json
+import time
+from collections import Counter
+from threading import Lock, Semaphore
+from typing import Callable, Iterable, Optional
+from uuid import uuid4
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.loadgen import percentiles
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.metrics import type_label
+from hivemind_bus_client.util import get_correlation_id, set_correlation_id, _innermost_payload
+
+# hive message types correlated replies may arrive as, see HiveResponseCollector
+_REPLY_TYPES = (HiveMessageType.BUS, HiveMessageType.CASCADE, HiveMessageType.QUERY)
+
+
+def parse_line(line: str) -> HiveMessage:
+    """ a json line as a HiveMessage, plain ovos messages are sent as BUS """
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError("expected a json object")
+    if "msg_type" in obj:
+        return HiveMessage(obj["msg_type"], payload=obj.get("payload"),
+                           node=obj.get("node"), source_peer=obj.get("source_peer"),
+                           route=obj.get("route"), target_peers=obj.get("target_peers"))
+    if "type" in obj:
+        return HiveMessage(HiveMessageType.BUS,
+                           payload=Message(obj["type"], obj.get("data") or {}, obj.get("context") or {}))
+    raise ValueError("expected an ovos message ('type') or a HiveMessage ('msg_type')")
+
+
+class BatchSender:
+    """ send a stream of messages over a connected client
+
+    Arguments:
+        bus: a connected HiveMessageBusClient
+        window: max messages waiting for a reply, only used with wait_replies
+        wait_replies: tag messages with a correlation id and wait for the answers
+        reply_timeout: seconds a message may wait for its reply
+        reply_type: only count replies with this ovos message type (e.g. "speak"),
+                    by default the first correlated message is the reply
+        on_reply: called with (line number, request, reply, rtt) for every reply
+    """
+
+    def __init__(self, bus: HiveMessageBusClient, window: int = 32, wait_replies: bool = False,
+                 reply_timeout: float = 10, reply_type: Optional[str] = None,
+                 on_reply: Optional[Callable] = None):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.bus = bus
+        self.window = window
+        self.wait_replies = wait_replies
+        self.reply_timeout = reply_timeout
+        self.reply_type = reply_type
+        self.on_reply = on_reply
+        self.sent = Counter()  # by hive message type
+        self.errors = Counter()
+        self.failures = []  # (line number, reason), first 100
+        self.rtts = []
+        self._slots = Semaphore(window)
+        self._lock = Lock()
+        self._pending = {}  # correlation id -> (line number, message, sent at)
+
+    def _fail(self, lineno: int, kind: str, reason: str):
+        self.errors[kind] += 1
+        if len(self.failures) < 100:
+            self.failures.append((lineno, f"{kind}: {reason}"))
+        LOG.debug(f"line {lineno} failed, {kind}: {reason}")
+
+    def _handle_reply(self, message: HiveMessage):
+        cid = get_correlation_id(message)
+        if cid is None or cid not in self._pending:
+            return
+        if self.reply_type is not None:
+            pload = _innermost_payload(message)
+            msg_type = pload.msg_type if isinstance(pload, Message) else (pload or {}).get("type")
+            if msg_type != self.reply_type:
+                return
+        with self._lock:
+            entry = self._pending.pop(cid, None)
+        if entry is None:
+            return  # a second reply, or it already timed out
+        lineno, request, sent_at = entry
+        rtt = time.monotonic() - sent_at
+        self.rtts.append(rtt)
+        self._slots.release()
+        if self.on_reply is not None:
+            try:
+                self.on_reply(lineno, request, message, rtt)
+            except Exception as e:
+                LOG.error(f"reply callback failed: {e}")
+
+    def _expire(self) -> int:
+        """ drop pending messages older than reply_timeout, returns how many """
+        deadline = time.monotonic() - self.reply_timeout
+        with self._lock:
+            expired = [(cid, entry) for cid, entry in self._pending.items() if entry[2] < deadline]
+            for cid, _ in expired:
+                del self._pending[cid]
+        for _, (lineno, _, _) in expired:
+            self._fail(lineno, "timeout", f"no reply within {self.reply_timeout}s")
+            self._slots.release()
+        return len(expired)
+
+    def _acquire_slot(self):
+        while not self._slots.acquire(timeout=min(self.reply_timeout, 0.5)):
+            self._expire()
+
+    def run(self, lines: Iterable[str]) -> dict:
+        """ send every line, returns the summary, see report() """
+        if self.wait_replies:
+            for msg_type in _REPLY_TYPES:
+                self.bus.on(msg_type, self._handle_reply)
+        start = time.monotonic()
+        try:
+            for lineno, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    message = parse_line(line)
+                except Exception as e:
+                    self._fail(lineno, "parse", str(e))
+                    continue
+                if self.wait_replies:
+                    self._acquire_slot()
+                    cid = str(uuid4())
+                    set_correlation_id(message, cid)
+                    with self._lock:
+                        self._pending[cid] = (lineno, message, time.monotonic())
+                try:
+                    self.bus.emit(message)
+                    self.sent[type_label(message.msg_type)] += 1
+                except Exception as e:
+                    if self.wait_replies:
+                        with self._lock:
+                            entry = self._pending.pop(cid, None)
+                        if entry is not None:
+                            self._slots.release()
+                    self._fail(lineno, "send", str(e))
+            sent_done = time.monotonic()
+            # wait for the replies still in flight
+            while self.wait_replies and self._pending:
+                time.sleep(0.01)
+                self._expire()
+        finally:
+            if self.wait_replies:
+                for msg_type in _REPLY_TYPES:
+                    try:
+                        self.bus.remove(msg_type, self._handle_reply)
+                    except (ValueError, KeyError):
+                        pass
+        return self.report(sent_done - start, time.monotonic() - start)
+
+    def report(self, send_elapsed: float, elapsed: float) -> dict:
+        total = sum(self.sent.values())
+        return {"sent": dict(self.sent),
+                "sent_total": total,
+                "replies": len(self.rtts),
+                "duration": round(elapsed, 3),
+                "throughput_msgs_per_sec": round(total / send_elapsed, 1) if send_elapsed else 0,
+                "errors": dict(self.errors),
+                "failures": self.failures,
+                "reply_rtt_ms": percentiles(self.rtts)}
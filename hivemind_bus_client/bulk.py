@@ -0,0 +1,116 @@
+"""bulk encode/decode of hive messages
+
+for offline jobs (replaying captured traffic, migrating archives, load
+generation) that handle many messages at once, above batch_size items
+the work is spread across a thread pool (zlib and AES release the GIL)
+or a process pool
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Union
+
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.serialization import get_bitstring, decode_bitstring
+from hivemind_bus_client.util import serialize_message, encrypt_bin, decrypt_bin, \
+    encrypt_as_json, decrypt_from_json
+
+
+def _encode_one(message: HiveMessage, crypto_key=None, binarize=True, compressed=None,
+                proto_version=1, payload_encoding="json") -> Union[bytes, str]:
+    """ same wire format as HiveMessageBusClient.emit """
+    if binarize or message.msg_type == HiveMessageType.BINARY:
+        if message.msg_type == HiveMessageType.BUS:
+            payload = message._payload
+        else:
+            payload = message.payload
+        frame = get_bitstring(hive_type=message.msg_type, payload=payload,
+                              compressed=compressed, proto_version=proto_version,
+                              versioned=proto_version > 1,
+                              payload_encoding=payload_encoding)
+        if not isinstance(frame, bytes):
+            frame = frame.bytes
+        return encrypt_bin(crypto_key, frame) if crypto_key else frame
+    frame = serialize_message(message)
+    return encrypt_as_json(crypto_key, frame) if crypto_key else frame
+
+
+def _decode_one(frame: Union[bytes, str], crypto_key=None) -> HiveMessage:
+    """ same as HiveMessageBusClient.on_message, without dispatching """
+    if isinstance(frame, bytes):
+        if crypto_key:
+            frame = decrypt_bin(crypto_key, frame)
+        return decode_bitstring(frame)
+    if crypto_key and "ciphertext" in frame:
+        frame = decrypt_from_json(crypto_key, frame)
+    if isinstance(frame, str):
+        frame = json.loads(frame)
+    return HiveMessage(**frame)
+
+
+def _run_batch(func, batch: list) -> list:
+    return [func(item) for item in batch]
+
+
+def _map_batches(func, items: Iterable, batch_size: int, workers: Optional[int],
+                 use_processes: bool) -> Iterator:
+    """ ordered, lazy map of func over items, in batches of batch_size """
+    items = iter(items)
+    batch = list(islice(items, batch_size))
+    workers = workers or os.cpu_count() or 1
+    if len(batch) < batch_size or workers <= 1:
+        # small job, a pool would cost more than it saves
+        while batch:
+            yield from _run_batch(func, batch)
+            batch = list(islice(items, batch_size))
+        return
+
+    pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    run = partial(_run_batch, func)
+    with pool_cls(max_workers=workers) as pool:
+        pending = []
+        while batch or pending:
+            # keep every worker busy, without reading the whole input upfront
+            while batch and len(pending) < workers * 2:
+                pending.append(pool.submit(run, batch))
+                batch = list(islice(items, batch_size))
+            yield from pending.pop(0).result()
+
+
+def encode_many(messages: Iterable[HiveMessage], crypto_key: Optional[str] = None,
+                binarize: bool = True, compressed: Optional[bool] = None,
+                proto_version: int = 1, payload_encoding: str = "json",
+                batch_size: int = 256, workers: Optional[int] = None,
+                use_processes: bool = False) -> Iterator[Union[bytes, str]]:
+    """ encode (and encrypt) many HiveMessages, yields websocket payloads in order
+
+    Arguments:
+        messages: iterable of HiveMessage, consumed lazily
+        crypto_key: encrypt each payload if set
+        binarize: bitstring frames (bytes) if True, else json (str)
+        compressed, proto_version, payload_encoding: see get_bitstring
+        batch_size: items per pool task, smaller jobs are encoded inline
+        workers: pool size, defaults to the number of cpus
+        use_processes: use a process pool instead of threads
+    """
+    if crypto_key and len(crypto_key) > 16:
+        crypto_key = crypto_key[:16]
+    func = partial(_encode_one, crypto_key=crypto_key, binarize=binarize,
+                   compressed=compressed, proto_version=proto_version,
+                   payload_encoding=payload_encoding)
+    return _map_batches(func, messages, batch_size, workers, use_processes)
+
+
+def decode_many(frames: Iterable[Union[bytes, str]], crypto_key: Optional[str] = None,
+                batch_size: int = 256, workers: Optional[int] = None,
+                use_processes: bool = False) -> Iterator[HiveMessage]:
+    """ decrypt and decode many websocket payloads, yields HiveMessages in order
+
+    bytes are treated as binarized frames, str as json, see encode_many for the arguments
+    """
+    if crypto_key and len(crypto_key) > 16:
+        crypto_key = crypto_key[:16]
+    func = partial(_decode_one, crypto_key=crypto_key)
+    return _map_batches(func, frames, batch_size, workers, use_processes)
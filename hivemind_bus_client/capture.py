@@ -0,0 +1,259 @@
+"""record and replay live HiveMind traffic
+
+capture files are append-only, every record is
+    timestamp (f64) | direction (u8) | kind (u8) | length (u32) | data
+data is either the raw websocket frame (as sent / received, possibly
+encrypted) or the decoded HiveMessage (msgpack, see packing.py)
+
+a sidecar "<path>.idx" file holds one fixed size entry per record
+    timestamp (f64) | offset (u64) | direction (u8) | msg_type id (u8)
+so readers can seek by time and filter by type without parsing payloads
+"""
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Lock
+from typing import Iterable, Iterator, Optional
+
+from ovos_utils.log import LOG
+from websocket import ABNF
+
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.packing import pack, unpack, PackingError
+
+MAGIC = b"HMCAP\x01\n"
+
+IN = 0  # received from the master
+OUT = 1  # sent to the master
+
+KIND_DECODED = 0  # msgpack encoded HiveMessage dict
+KIND_BYTES = 1  # raw binary websocket frame
+KIND_TEXT = 2  # raw text websocket frame
+
+_RECORD = struct.Struct("<dBBI")
+_INDEX = struct.Struct("<dQBB")
+
+_TYPES = list(HiveMessageType)
+_TYPE2ID = {t.value: i for i, t in enumerate(_TYPES)}
+_UNKNOWN_TYPE = 255
+
+# connection setup belongs to the captured connection, never replayed unless asked for
+_SETUP_TYPES = frozenset({HiveMessageType.HANDSHAKE.value, HiveMessageType.HELLO.value})
+
+CapturedFrame = namedtuple("CapturedFrame", ["timestamp", "direction", "kind", "msg_type", "data"])
+
+
+def _index_path(path: str) -> str:
+    return path + ".idx"
+
+
+class TrafficCapture:
+    """ appends the traffic of a HiveMessageBusClient to a capture file
+
+    Arguments:
+        path: capture file, appended to if it exists
+        raw: store websocket frames exactly as sent/received instead of the decoded
+             messages, raw frames are only replayable with the same encryption key
+        directions: which directions to record, (IN, OUT) by default
+    """
+
+    def __init__(self, path: str, raw: bool = False, directions=(IN, OUT)):
+        self.path = path
+        self.raw = raw
+        self.directions = frozenset(directions)
+        self._lock = Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._data = open(path, "ab")
+        self._index = open(_index_path(path), "ab")
+        if new:
+            self._data.write(MAGIC)
+        self._offset = self._data.tell()
+        self.count = 0
+
+    def record(self, direction: int, message: HiveMessage, frame=None):
+        """ called by the client for every message sent or received """
+        if direction not in self.directions:
+            return
+        if self.raw and frame is not None:
+            if isinstance(frame, str):
+                kind, data = KIND_TEXT, frame.encode("utf-8")
+            else:
+                kind, data = KIND_BYTES, bytes(frame)
+        else:
+            kind, data = KIND_DECODED, pack(message.as_compact_dict)
+        type_id = _TYPE2ID.get(message.msg_type, _UNKNOWN_TYPE)
+        with self._lock:
+            if self._data.closed:
+                return
+            ts = time.time()  # under the lock, the index must stay sorted
+            self._data.write(_RECORD.pack(ts, direction, kind, len(data)))
+            self._data.write(data)
+            self._index.write(_INDEX.pack(ts, self._offset, direction, type_id))
+            self._offset += _RECORD.size + len(data)
+            self.count += 1
+
+    def flush(self):
+        with self._lock:
+            self._data.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._data.closed:
+                self._data.close()
+                self._index.close()
+
+
+class CaptureReader:
+    """ mmap based reader for capture files """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a HiveMind capture file")
+        self._index = self._load_index()
+
+    def _load_index(self) -> list:
+        """ list of (timestamp, offset, direction, type_id), rebuilt from the data if missing """
+        idx_path = _index_path(self.path)
+        if os.path.exists(idx_path):
+            with open(idx_path, "rb") as f:
+                raw = f.read()
+            n = len(raw) // _INDEX.size
+            entries = [_INDEX.unpack_from(raw, i * _INDEX.size) for i in range(n)]
+            # index may be behind or ahead of the data if the capture was not closed cleanly
+            end = len(MAGIC)
+            if entries:
+                offset = entries[-1][1]
+                end = -1
+                if offset + _RECORD.size <= len(self._mm):
+                    end = offset + _RECORD.size + _RECORD.unpack_from(self._mm, offset)[3]
+            if end == len(self._mm):
+                return entries
+        LOG.warning(f"rebuilding capture index for {self.path}")
+        entries = []
+        pos = len(MAGIC)
+        while pos + _RECORD.size <= len(self._mm):
+            ts, direction, kind, size = _RECORD.unpack_from(self._mm, pos)
+            if pos + _RECORD.size + size > len(self._mm):
+                break  # truncated record
+            type_id = _UNKNOWN_TYPE
+            if kind == KIND_DECODED:
+                try:
+                    msg_type = unpack(self._mm[pos + _RECORD.size:pos + _RECORD.size + size])["msg_type"]
+                except (PackingError, KeyError, TypeError):
+                    break  # corrupted record, everything after it is unreadable
+                type_id = _TYPE2ID.get(msg_type, _UNKNOWN_TYPE)
+            entries.append((ts, pos, direction, type_id))
+            pos += _RECORD.size + size
+        return entries
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def start_time(self) -> Optional[float]:
+        return self._index[0][0] if self._index else None
+
+    @property
+    def end_time(self) -> Optional[float]:
+        return self._index[-1][0] if self._index else None
+
+    def _read(self, offset: int, type_id: int) -> CapturedFrame:
+        ts, direction, kind, size = _RECORD.unpack_from(self._mm, offset)
+        start = offset + _RECORD.size
+        data = self._mm[start:start + size]
+        if kind == KIND_TEXT:
+            data = data.decode("utf-8")
+        msg_type = _TYPES[type_id].value if type_id < len(_TYPES) else None
+        return CapturedFrame(ts, direction, kind, msg_type, data)
+
+    def frames(self, start: Optional[float] = None, end: Optional[float] = None,
+               msg_types: Optional[Iterable[str]] = None,
+               direction: Optional[int] = None) -> Iterator[CapturedFrame]:
+        """ iterate over the captured frames, filtered by time range, type and direction """
+        type_ids = None
+        if msg_types:
+            type_ids = {_TYPE2ID.get(t, _UNKNOWN_TYPE) for t in msg_types}
+        i = 0
+        if start is not None:
+            i = bisect_left(self._index, (start,))
+        for ts, offset, d, type_id in self._index[i:]:
+            if end is not None and ts > end:
+                break
+            if direction is not None and d != direction:
+                continue
+            if type_ids is not None and type_id not in type_ids:
+                continue
+            yield self._read(offset, type_id)
+
+    def __iter__(self):
+        return self.frames()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def _replay_frame(client, frame: CapturedFrame):
+    if frame.direction == OUT:
+        if frame.kind == KIND_DECODED:
+            client.emit(HiveMessage(**unpack(frame.data)))
+        elif frame.kind == KIND_BYTES:
+            client.client.send(frame.data, ABNF.OPCODE_BINARY)
+        else:
+            client.client.send(frame.data)
+    elif frame.kind == KIND_DECODED:
+        message = HiveMessage(**unpack(frame.data))
+        client.emitter.emit('message', message.as_dict)
+        client._handle_hive_protocol(message)
+    else:
+        client.on_message(frame.data)
+
+
+def replay(reader: CaptureReader, client, speed: Optional[float] = 1.0,
+           direction: Optional[int] = OUT, msg_types: Optional[Iterable[str]] = None,
+           start: Optional[float] = None, end: Optional[float] = None) -> dict:
+    """ re-emit captured traffic into a connected HiveMessageBusClient
+
+    OUT frames are sent to the master again (load testing), IN frames are
+    injected into the client as if they were received from the master
+
+    Arguments:
+        speed: 1.0 replays at the original timing, N replays N times faster,
+               None or 0 replays as fast as possible
+        direction: IN, OUT or None for both
+        msg_types: only replay these HiveMessageTypes
+        start/end: capture timestamps to replay
+
+    Returns:
+        {"count", "errors", "elapsed", "max_lag"} lag is how far behind schedule replay fell
+    """
+    count = errors = 0
+    max_lag = 0.0
+    t0 = first_ts = None
+    for frame in reader.frames(start=start, end=end, msg_types=msg_types, direction=direction):
+        if not msg_types and frame.msg_type in _SETUP_TYPES:
+            continue
+        now = time.monotonic()
+        if t0 is None:
+            t0, first_ts = now, frame.timestamp
+        if speed:
+            due = t0 + (frame.timestamp - first_ts) / speed
+            if due > now:
+                time.sleep(due - now)
+            else:
+                max_lag = max(max_lag, now - due)
+        try:
+            _replay_frame(client, frame)
+            count += 1
+        except Exception as e:
+            errors += 1
+            LOG.error(f"failed to replay {frame.msg_type} frame: {e}")
+    elapsed = time.monotonic() - t0 if t0 is not None else 0.0
+    return {"count": count, "errors": errors, "elapsed": elapsed, "max_lag": max_lag}
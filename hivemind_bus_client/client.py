@@ -1,8 +1,14 @@
 import base64
 import json
+import socket
 import ssl
-from threading import Event
-from typing import Union
+import time
+from collections import deque
+from copy import copy
+from queue import Queue, Empty
+from threading import Event, Lock, Timer
+from typing import Iterator, Optional, Union
+from uuid import uuid4
 
 from ovos_bus_client import Message as MycroftMessage, MessageBusClient as OVOSBusClient
 from ovos_bus_client.session import Session
@@ -12,11 +18,24 @@ from pyee import EventEmitter
 from websocket import ABNF
 from websocket import WebSocketApp, WebSocketConnectionClosedException
 
+from hivemind_bus_client.capture import TrafficCapture, IN, OUT
+from hivemind_bus_client.dedup import SeenMessagesCache
+from hivemind_bus_client.delta import ContextDeltaCodec
+from hivemind_bus_client.flight import FlightRecorder
 from hivemind_bus_client.identity import NodeIdentity
+from hivemind_bus_client.latency import LinkStats, PingProber
+from hivemind_bus_client.log import get_logger
 from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.metrics import ClientMetrics, payload_type, type_label
+from hivemind_bus_client.policy import BusSharingPolicy
 from hivemind_bus_client.serialization import get_bitstring, decode_bitstring
+from hivemind_bus_client.tracing import MessageTracer
+from hivemind_bus_client.watchdog import HandlerMonitor
 from hivemind_bus_client.util import serialize_message, \
-    encrypt_as_json, decrypt_from_json, encrypt_bin, decrypt_bin
+    encrypt_as_json, decrypt_from_json, encrypt_bin, decrypt_bin, \
+    get_correlation_id, set_correlation_id, _copy_innermost
+
+log = get_logger("client")  # per message lines
 
 
 class HiveMessageWaiter:
@@ -81,23 +100,166 @@ class HivePayloadWaiter(HiveMessageWaiter):
             self.bus.once(self.msg_type, self._handler)
 
 
+class HivePingWaiter(HiveMessageWaiter):
+    """Wait for the answer to a specific PING"""
+    def __init__(self, ping_id, *args, **kwargs):
+        self.ping_id = ping_id
+        super().__init__(*args, message_type=HiveMessageType.PING, **kwargs)
+
+    def _handler(self, message):
+        """Receive response data."""
+        if message.payload.get("ping_id") == self.ping_id and \
+                message.payload.get("pong"):
+            self.received_msg = message
+            self.response_event.set()
+        else:
+            self.bus.once(self.msg_type, self._handler)
+
+
+class HiveResponseCollector:
+    """Collect all responses correlated with a request.
+
+    responses are matched by correlation id, they may arrive wrapped in
+    any of the given message types. Handlers only enqueue, so collecting
+    responses never blocks other traffic.
+
+    iterate over it to get the responses as they arrive, the handlers are
+    removed after timeout (or close()) even if it is never iterated
+
+    Argunments:
+        bus: Bus to check for messages on
+        correlation_id: id the responses are tagged with
+        message_types: hive message types responses may arrive as
+        timeout: seconds to keep collecting, None until close()
+        max_responses: stop collecting once this many responses arrived
+    """
+
+    def __init__(self, bus, correlation_id,
+                 message_types=(HiveMessageType.BUS,
+                                HiveMessageType.CASCADE,
+                                HiveMessageType.QUERY),
+                 timeout: Optional[float] = None,
+                 max_responses: Optional[int] = None):
+        self.bus = bus
+        self.correlation_id = correlation_id
+        self.message_types = message_types
+        self.timeout = timeout
+        self.max_responses = max_responses
+        self.responses = Queue()
+        self._received = 0
+        self._closed = False
+        self._lock = Lock()
+        for msg_type in self.message_types:
+            self.bus.on(msg_type, self._handler)
+        getattr(self.bus, "_collectors", set()).add(self)
+        self._timer = None
+        if timeout is not None:
+            self._timer = Timer(timeout, self.shutdown)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _handler(self, message):
+        if get_correlation_id(message) != self.correlation_id:
+            return
+        with self._lock:
+            if self._closed or (self.max_responses is not None
+                                and self._received >= self.max_responses):
+                return
+            self._received += 1
+            self.responses.put(message)
+            done = self.max_responses is not None and self._received >= self.max_responses
+        if done:
+            self.shutdown()
+
+    def __iter__(self) -> Iterator[HiveMessage]:
+        """ yield responses as they arrive, until timeout, max_responses or close() """
+        try:
+            while True:
+                message = self.responses.get()
+                if message is None:  # collection is over
+                    self.responses.put(None)  # for the next iterator
+                    break
+                yield message
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.responses.put(None)  # wakes up iterators
+        if self._timer is not None:
+            self._timer.cancel()
+        getattr(self.bus, "_collectors", set()).discard(self)
+        for msg_type in self.message_types:
+            try:
+                self.bus.remove(msg_type, self._handler)
+            except (ValueError, KeyError):
+                pass
+
+    close = shutdown
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
 class HiveMessageBusClient(OVOSBusClient):
     def __init__(self, key=None, password=None, crypto_key=None, host='127.0.0.1', port=5678,
                  useragent="", self_signed=True, share_bus=False,
-                 compress=True, binarize=True, identity: NodeIdentity = None):
+                 compress=True, binarize=True, identity: NodeIdentity = None,
+                 share_policy: BusSharingPolicy = None,
+                 seen_cache: Optional[SeenMessagesCache] = None,
+                 unix_socket: Optional[str] = None,
+                 metrics: Optional[ClientMetrics] = None,
+                 tracer: Optional[MessageTracer] = None,
+                 flight_recorder: Optional[FlightRecorder] = None):
         ssl = host.startswith("wss://")
         host = host.replace("ws://", "").replace("wss://", "").strip()
 
         self.identity = identity or None
+        self.unix_socket = unix_socket  # connect to a local master over a unix socket
         self._password = password
         self._access_key = key
         self._name = useragent
         self.init_identity()
+        self.identity.preload()  # parse the key file while the rest of the client is set up
 
         self.crypto_key = crypto_key
         self.allow_self_signed = self_signed
         self.share_bus = share_bus
+        # decides which messages are shared when share_bus is enabled,
+        # can be modified at runtime
+        self.share_policy = share_policy or BusSharingPolicy()
         self.handshake_event = Event()
+        self.ping_stats = LinkStats()
+        self._ping_prober: Optional[PingProber] = None
+        self._query_latencies = deque(maxlen=200)  # used to decide when to hedge queries
+        # PROPAGATE/BROADCAST may reach us more than once in meshed hives
+        self.seen_cache = seen_cache if seen_cache is not None else SeenMessagesCache()  # empty caches are falsy
+        # set during handshake if the master agrees to context delta encoding
+        self.context_codec: Optional[ContextDeltaCodec] = None
+        self.capture: Optional[TrafficCapture] = None
+        self.tracer = tracer  # opt-in per message latency tracing
+        self.flight_recorder = flight_recorder  # opt-in ring buffer of recent messages
+        self.metrics = metrics or ClientMetrics()
+        self._collectors = set()  # pending scatter-gather requests
+        self.metrics.gauge("hivemind_pending_responses",
+                           lambda: sum(c.responses.qsize() for c in list(self._collectors)),
+                           "responses queued but not yet consumed")
+        self.metrics.gauge("hivemind_seen_cache_size",
+                           lambda: self.seen_cache.as_dict().get("size", 0),
+                           "keys in the duplicate suppression cache")
+        # times every handler registered with on / on_mycroft / decorators
+        self.handler_monitor = HandlerMonitor(self.metrics)
+        # (event, func) -> [(event_name, timed wrapper)], one entry per registration
+        self._timed_funcs = {}
+        self._timed_lock = Lock()
+        self.metrics.gauge("hivemind_connected", lambda: int(self.handshake_event.is_set()),
+                           "1 if the handshake with the master is done")
 
         # if you want to reduce CPU usage in exchange for more bandwidth set below to False
         self.compress = compress  # None -> auto
@@ -168,21 +330,55 @@ class HiveMessageBusClient(OVOSBusClient):
             if self.identity.site_id is not None:
                 self.protocol.site_id = self.identity.site_id
 
+        # handlers must be in place before the master sends HELLO/HANDSHAKE
+        self.protocol.bind(bus)
         LOG.info("Connecting to Hivemind")
         self.run_in_thread()
-        self.protocol.bind(bus)
         self.wait_for_handshake()
 
     def on_error(self, *args):
         self.handshake_event.clear()
         self.crypto_key = None
+        self.context_codec = None
         super().on_error(*args)
 
+    def on_open(self, *args):
+        self.context_codec = None  # a new connection starts without baselines
+        self.metrics.connection_opened()
+        super().on_open(*args)
+
     def on_close(self, *args):
         self.handshake_event.clear()
         self.crypto_key = None
+        self.context_codec = None  # baselines are per connection
         super().on_close(*args)
 
+    # traffic capture
+    def start_capture(self, path: str, raw: bool = False) -> TrafficCapture:
+        """ append all traffic of this client to a capture file,
+        see hivemind_bus_client.capture for the replay api """
+        self.stop_capture()
+        self.capture = TrafficCapture(path, raw=raw)
+        return self.capture
+
+    def stop_capture(self):
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
+
+    def close(self):
+        self.stop_capture()
+        self.stop_ping_prober()
+        self.handler_monitor.stop_watchdog()
+        self.metrics.stop()
+        super().close()
+
+    def get_stats(self) -> dict:
+        """ all metrics as a dict, see hivemind_bus_client.metrics """
+        stats = self.metrics.as_dict()
+        stats["ping"] = self.get_ping_stats()
+        return stats
+
     def wait_for_handshake(self, timeout=5):
         self.handshake_event.wait(timeout=timeout)
         if not self.handshake_event.is_set():
@@ -203,12 +399,20 @@ class HiveMessageBusClient(OVOSBusClient):
                              port=self.config.port,
                              key=self.key,
                              useragent=self.useragent)
+        sock = None
+        if self.unix_socket:
+            # host/port in the url are only used for the http headers
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         return WebSocketApp(url, on_open=self.on_open, on_close=self.on_close,
-                            on_error=self.on_error, on_message=self.on_message)
+                            on_error=self.on_error, on_message=self.on_message,
+                            socket=sock)
 
     def run_forever(self):
         self.started_running = True
-        if self.allow_self_signed:
+        if self.unix_socket:
+            self.client.prepared_socket.connect(self.unix_socket)
+            self.client.run_forever()
+        elif self.allow_self_signed:
             self.client.run_forever(sslopt={
                 "cert_reqs": ssl.CERT_NONE,
                 "check_hostname": False,
@@ -222,6 +426,10 @@ class HiveMessageBusClient(OVOSBusClient):
             message = args[0]
         else:
             message = args[1]
+        frame = message
+        metrics = self.metrics
+        fmt = "binary" if isinstance(frame, bytes) else "json"
+        t0 = time.perf_counter()
         if self.crypto_key:
             # handle binary encryption
             if isinstance(message, bytes):
@@ -231,16 +439,47 @@ class HiveMessageBusClient(OVOSBusClient):
                 # LOG.debug(f"got encrypted message: {len(message)}")
                 message = decrypt_from_json(self.crypto_key, message)
             else:
-                LOG.debug("Message was unencrypted")
+                log.debug("Message was unencrypted")
+        t1 = time.perf_counter()
+        if message is not frame:
+            metrics.decrypt_seconds.observe(t1 - t0, fmt)
 
         if isinstance(message, bytes):
-            message = decode_bitstring(message)
-        elif isinstance(message, str):
-            message = json.loads(message)
-        if "ciphertext" in message:
-            raise RuntimeError("got encrypted message, but could not decrypt!")
-        self.emitter.emit('message', message)  # raw message
-        self._handle_hive_protocol(HiveMessage(**message))
+            hmessage = decode_bitstring(message, compression_bytes=metrics.compression)
+            if self.context_codec is not None and hmessage.msg_type in (
+                    HiveMessageType.BUS, HiveMessageType.SHARED_BUS):
+                self._restore_context(hmessage._payload)
+            raw = None
+        else:
+            raw = json.loads(message) if isinstance(message, str) else message
+            if "ciphertext" in raw:
+                raise RuntimeError("got encrypted message, but could not decrypt!")
+            if self.context_codec is not None and raw.get("msg_type") in (
+                    HiveMessageType.BUS, HiveMessageType.SHARED_BUS):
+                self._restore_context(raw.get("payload"))
+            hmessage = HiveMessage(**raw)
+        t2 = time.perf_counter()
+        metrics.decode_seconds.observe(t2 - t1, fmt)
+        metrics.bytes_in.inc(type_label(hmessage.msg_type), n=len(frame))
+        metrics.messages_in.inc(type_label(hmessage.msg_type), payload_type(hmessage))
+        if self.capture is not None:
+            self.capture.record(IN, hmessage, frame)
+        # before any handler, raw "message" listeners included
+        if hmessage.msg_type in (HiveMessageType.PROPAGATE, HiveMessageType.BROADCAST) \
+                and self.seen_cache.is_duplicate(hmessage):
+            log.debug("dropping duplicate %s", hmessage.msg_type)
+            return
+
+        span = self.tracer.incoming(hmessage, t0) if self.tracer is not None else None
+        self.emitter.emit('message', raw if raw is not None else hmessage.as_dict)  # raw message
+        self._handle_hive_protocol(hmessage)
+        if span is not None or self.flight_recorder is not None:
+            t3 = time.perf_counter()
+            if self.flight_recorder is not None:
+                self.flight_recorder.record(IN, hmessage, len(frame), (t1 - t0, t2 - t1, t3 - t2))
+            if span is not None:
+                span["stages"] = {"decrypt": t1 - t0, "decode": t2 - t1, "dispatch": t3 - t2}
+                self.tracer.finish(span, hmessage)
 
     def _handle_hive_protocol(self, message: HiveMessage):
         # LOG.debug(f"received HiveMind message: {message.msg_type}")
@@ -259,48 +498,260 @@ class HiveMessageBusClient(OVOSBusClient):
                     raise ValueError('You must execute run_forever() '
                                      'before emitting messages')
                 self.connected_event.wait()
-
+        self._emit_now(message)
+
+    def _emit_now(self, message: HiveMessage):
+        """ emit without waiting for the connection, a closed socket only logs a warning """
+        if self.tracer is not None or message.msg_type == HiveMessageType.BUS:
+            # context and traceparent are added to a copy,
+            # the caller's message and context are left alone
+            message = _copy_innermost(message)
+        span = self.tracer.outgoing(message) if self.tracer is not None else None
         try:
             # auto inject context for proper routing, this is confusing for
             # end users if they need to do it manually, error prone and easy
             # to forget
             if message.msg_type == HiveMessageType.BUS:
-                ctxt = dict(message.payload.context)
-                if "source" not in ctxt:
-                    ctxt["source"] = self.useragent
-                if "platform" not in message.payload.context:
-                    ctxt["platform"] = self.useragent
-                if "destination" not in message.payload.context:
-                    ctxt["destination"] = "HiveMind"
-                message.payload.context = ctxt
+                # NOTE: the payload dict is used directly, Message objects
+                # are only built if some local handler needs them
+                pload = message._payload
+                ctxt = pload["context"]
+                ctxt.setdefault("source", self.useragent)
+                ctxt.setdefault("platform", self.useragent)
+                ctxt.setdefault("destination", "HiveMind")
                 # also send event to client registered handlers
-                self.internal_bus.emit(message.payload)
-
-            LOG.debug(f"sending to HiveMind: {message.msg_type}")
-            binarize = False
-            if message.msg_type == HiveMessageType.BINARY:
-                binarize = True
-            elif message.msg_type not in [HiveMessageType.HELLO, HiveMessageType.HANDSHAKE]:
-                binarize = self.protocol.binarize and self.binarize
-
-            if binarize:
-                bitstr = get_bitstring(hive_type=message.msg_type,
-                                       payload=message.payload,
-                                       compressed=self.compress)
-                if self.crypto_key:
-                    ws_payload = encrypt_bin(self.crypto_key, bitstr.bytes)
-                else:
-                    ws_payload = bitstr.bytes
-                self.client.send(ws_payload, ABNF.OPCODE_BINARY)
-            else:
-                ws_payload = serialize_message(message)
-                if self.crypto_key:
-                    ws_payload = encrypt_as_json(self.crypto_key, ws_payload)
-                self.client.send(ws_payload)
+                self._emit_internal(pload)
 
+            if self.context_codec is not None and message.msg_type in (
+                    HiveMessageType.BUS, HiveMessageType.SHARED_BUS):
+                with self.context_codec.lock:
+                    self._send(self._with_context_delta(message), span, original=message)
+            else:
+                self._send(message, span)
         except WebSocketConnectionClosedException:
-            LOG.warning(f'Could not send {message.msg_type} message because connection '
-                        'has been closed')
+            log.warning("Could not send %s message because connection has been closed",
+                        message.msg_type)
+            if span is not None and "_t0" in span:
+                span["error"] = "connection closed"
+                self.tracer.finish(span, message)
+
+    def _send(self, message: HiveMessage, span: Optional[dict] = None,
+              original: Optional[HiveMessage] = None):
+        """ original is the message before context delta encoding, recorded instead of message """
+        log.debug("sending to HiveMind: %s", message.msg_type)
+        binarize = False
+        if message.msg_type == HiveMessageType.BINARY:
+            binarize = True
+        elif message.msg_type not in [HiveMessageType.HELLO, HiveMessageType.HANDSHAKE]:
+            binarize = self.protocol.binarize and self.binarize
+
+        if binarize:
+            if message.msg_type == HiveMessageType.BUS:
+                payload = message._payload  # skip Message round trip
+            else:
+                payload = message.payload
+            proto_version = getattr(self.protocol, "proto_version", 1)
+            fmt = "binary"
+            t0 = time.perf_counter()
+            bitstr = get_bitstring(hive_type=message.msg_type,
+                                   payload=payload,
+                                   compressed=self.compress,
+                                   proto_version=proto_version,
+                                   versioned=proto_version > 1,
+                                   payload_encoding=getattr(self.protocol, "payload_encoding",
+                                                            "json"),
+                                   compression_bytes=self.metrics.compression)
+            if not isinstance(bitstr, bytes):
+                bitstr = bitstr.bytes
+            t1 = time.perf_counter()
+            if self.crypto_key:
+                ws_payload = encrypt_bin(self.crypto_key, bitstr)
+            else:
+                ws_payload = bitstr
+            t2 = time.perf_counter()
+            self.client.send(ws_payload, ABNF.OPCODE_BINARY)
+        else:
+            fmt = "json"
+            t0 = time.perf_counter()
+            ws_payload = serialize_message(message)
+            t1 = time.perf_counter()
+            if self.crypto_key:
+                ws_payload = encrypt_as_json(self.crypto_key, ws_payload)
+            t2 = time.perf_counter()
+            self.client.send(ws_payload)
+        self.metrics.encode_seconds.observe(t1 - t0, fmt)
+        if self.crypto_key:
+            self.metrics.encrypt_seconds.observe(t2 - t1, fmt)
+        if original is None:
+            original = message
+        if span is not None or self.flight_recorder is not None:
+            t3 = time.perf_counter()
+            if self.flight_recorder is not None:
+                self.flight_recorder.record(OUT, original, len(ws_payload), (t1 - t0, t2 - t1, t3 - t2))
+            if span is not None:
+                span["stages"] = {"prepare": t0 - span["_t0"], "encode": t1 - t0,
+                                  "encrypt": t2 - t1, "send": t3 - t2}
+                self.tracer.finish(span, message)
+        self.metrics.bytes_out.inc(type_label(message.msg_type), n=len(ws_payload))
+        self.metrics.messages_out.inc(type_label(message.msg_type), payload_type(message))
+        if self.capture is not None:
+            self.capture.record(OUT, original, ws_payload)
+
+    def _with_context_delta(self, message: HiveMessage) -> HiveMessage:
+        """ shallow copy of a BUS message with its context delta encoded """
+        pload = dict(message._payload)
+        pload["context"] = self.context_codec.encode(pload.get("context") or {})
+        message = copy(message)
+        message._payload = pload
+        return message
+
+    def _restore_context(self, pload):
+        """ rebuild the full context of a received BUS payload """
+        if isinstance(pload, dict) and isinstance(pload.get("context"), dict):
+            pload["context"] = self.context_codec.decode(pload["context"])
+
+    def _emit_internal(self, pload: dict):
+        """ send a BUS payload to the handlers registered within the client """
+        ee = self.internal_bus.ee
+        if "session" in pload["context"] and not ee.listeners(pload["type"]) \
+                and not ee.listeners("message"):
+            return  # nobody listening, and no session to inject
+        # NOTE: FakeBus injects the session into context, this side effect
+        # is shared with the payload that is sent to HiveMind
+        self.internal_bus.emit(MycroftMessage(pload["type"],
+                                              data=pload.get("data"),
+                                              context=pload["context"]))
+
+    # latency api
+    def ping(self, timeout: float = 3.0) -> Optional[float]:
+        """Measure the round trip time to the master.
+
+        the master is expected to answer with the same payload plus
+        "pong": True, and optionally its receive/send timestamps
+        "t1"/"t2" which are used to estimate the clock offset
+
+        Arguments:
+            timeout: seconds to wait before counting the ping as lost
+
+        Returns:
+            rtt in seconds, or None if the ping timed out or the client is not connected
+        """
+        if not self.connected_event.is_set() or not self.handshake_event.is_set():
+            return None  # not counted as lost, there was nothing to send it over
+        ping_id = str(uuid4())
+        waiter = HivePingWaiter(ping_id, bus=self)
+        self.ping_stats.sent += 1
+        t0 = time.time()
+        start = time.monotonic()
+        # never blocks waiting for a reconnect like emit does, probes run in their own threads
+        self._emit_now(HiveMessage(HiveMessageType.PING,
+                                   {"ping_id": ping_id, "t0": t0, "pong": False}))
+        pong = waiter.wait(timeout)
+        if pong is None:
+            return None
+        rtt = time.monotonic() - start
+        t1, t2 = pong.payload.get("t1"), pong.payload.get("t2")
+        offset = None
+        if t1 is not None and t2 is not None:
+            offset = ((t1 - t0) + (t2 - (t0 + rtt))) / 2
+        self.ping_stats.record(rtt, offset)
+        return rtt
+
+    def start_ping_prober(self, interval: float = 30, timeout: float = 5):
+        """ping the master in the background every interval seconds,
+        stats are accumulated in self.ping_stats"""
+        self.stop_ping_prober()
+        self._ping_prober = PingProber(self, interval=interval, timeout=timeout)
+        self._ping_prober.start()
+
+    def stop_ping_prober(self):
+        if self._ping_prober is not None:
+            self._ping_prober.stop()
+            self._ping_prober = None
+
+    def get_ping_stats(self) -> dict:
+        return self.ping_stats.as_dict()
+
+    # scatter-gather api
+    def cascade(self, message, timeout: float = 3.0,
+                max_responses: Optional[int] = None) -> HiveResponseCollector:
+        """Send a CASCADE and collect the responses from the hive.
+
+        the message is sent immediately, iterate over the result to get the
+        responses as they arrive, collection stops after timeout even if the
+        result is never iterated (fire and forget), close() stops it earlier
+
+        Arguments:
+            message (HiveMessage): message to cascade, mycroft Message objects also accepted
+            timeout: seconds to keep collecting responses
+            max_responses: stop collecting as soon as this many responses arrived,
+                           by default collect until timeout
+
+        Returns:
+            HiveResponseCollector, use list() to wait for all the responses
+        """
+        message = self._as_scatter_message(message, HiveMessageType.CASCADE)
+        correlation_id = str(uuid4())
+        set_correlation_id(message, correlation_id)
+        collector = HiveResponseCollector(self, correlation_id, timeout=timeout,
+                                          max_responses=max_responses)
+        self.emit(message)
+        return collector
+
+    def query(self, message, timeout: float = 3.0,
+              hedge_percentile: Optional[float] = 0.95) -> Optional[HiveMessage]:
+        """Send a QUERY and wait for the first node to answer.
+
+        Arguments:
+            message (HiveMessage): message to query, mycroft Message objects also accepted
+            timeout: seconds to wait before timeout, defaults to 3
+            hedge_percentile: if no answer arrived after this percentile of
+                              previous query latencies, the query is sent again
+                              once, None disables hedging
+
+        Returns:
+            The first response or None if the query timed out
+        """
+        message = self._as_scatter_message(message, HiveMessageType.QUERY)
+        correlation_id = str(uuid4())
+        set_correlation_id(message, correlation_id)
+        collector = HiveResponseCollector(self, correlation_id)
+        start = time.monotonic()
+        self.emit(message)
+        try:
+            hedge_after = self._hedge_delay(hedge_percentile)
+            if hedge_after is not None and hedge_after < timeout:
+                try:
+                    response = collector.responses.get(timeout=hedge_after)
+                except Empty:
+                    log.debug("hedging query %s", correlation_id)
+                    self.emit(message)
+                    response = None
+            else:
+                response = None
+            if response is None:
+                remaining = timeout - (time.monotonic() - start)
+                response = collector.responses.get(timeout=max(remaining, 0))
+        except Empty:
+            return None
+        finally:
+            collector.shutdown()
+        self._query_latencies.append(time.monotonic() - start)
+        return response
+
+    def _hedge_delay(self, percentile: Optional[float]) -> Optional[float]:
+        if percentile is None or len(self._query_latencies) < 20:
+            return None  # not enough data to know what is slow
+        latencies = sorted(self._query_latencies)
+        return latencies[min(int(len(latencies) * percentile), len(latencies) - 1)]
+
+    @staticmethod
+    def _as_scatter_message(message, msg_type: HiveMessageType) -> HiveMessage:
+        if isinstance(message, MycroftMessage):
+            message = HiveMessage(HiveMessageType.BUS, payload=message)
+        if message.msg_type != msg_type:
+            message = HiveMessage(msg_type, payload=message.as_dict)
+        return message
 
     def emit_mycroft(self, message: MycroftMessage):
         message = HiveMessage(msg_type=HiveMessageType.BUS, payload=message)
@@ -308,7 +759,7 @@ class HiveMessageBusClient(OVOSBusClient):
 
     def on_mycroft(self, mycroft_msg_type, func):
         LOG.debug(f"registering mycroft event: {mycroft_msg_type}")
-        self.internal_bus.on(mycroft_msg_type, func)
+        self.internal_bus.on(mycroft_msg_type, self._timed(func, mycroft_msg_type))
 
     # event api
     def on(self, event_name, func):
@@ -322,7 +773,49 @@ class HiveMessageBusClient(OVOSBusClient):
         else:
             # hivemind message
             LOG.debug(f"registering handler: {event_name}")
-            self.emitter.on(event_name, func)
+            self.emitter.on(event_name, self._timed(func, event_name))
+
+    def _timed(self, func, msg_type):
+        timed = self.handler_monitor.wrap(func, msg_type)
+        # keyed by event too, the same func may be registered for several
+        # events and every registration gets its own wrapper
+        with self._timed_lock:
+            self._timed_funcs.setdefault((type_label(msg_type), func), []).append((msg_type, timed))
+        return timed
+
+    def remove(self, event_name, func):
+        """ remove a handler registered with on / on_mycroft """
+        with self._timed_lock:
+            key = (type_label(event_name), func)
+            wrappers = self._timed_funcs.get(key)
+            if not wrappers:
+                timed = None
+            else:
+                registered_as, timed = wrappers.pop()
+                if not wrappers:
+                    del self._timed_funcs[key]
+        if timed is None:
+            super().remove(event_name, func)  # registered on the emitter directly
+        elif registered_as in list(HiveMessageType):
+            try:
+                self.emitter.remove_listener(registered_as, timed)
+            except KeyError:
+                pass
+        else:
+            self.internal_bus.remove(registered_as, timed)
+
+    # handler timing
+    def start_handler_watchdog(self, threshold: float = 1.0):
+        """ log a warning with a stack sample when a handler blocks
+        its thread for longer than threshold seconds """
+        self.handler_monitor.start_watchdog(threshold)
+
+    def stop_handler_watchdog(self):
+        self.handler_monitor.stop_watchdog()
+
+    def get_handler_stats(self, n: int = 10, by: str = "total") -> list:
+        """ the n handlers costing the most time, by "total", "avg" or "p99" """
+        return self.handler_monitor.top(n, by)
 
     # utility
     def wait_for_message(self, message_type, timeout=3.0):
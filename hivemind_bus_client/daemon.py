@@ -0,0 +1,195 @@
+"""local daemon holding one HiveMind connection for one-shot cli commands
+
+`hivemind-client daemon` connects and handshakes once, then accepts
+requests on a unix socket, send-mycroft / escalate / propagate go through
+it when it is running instead of paying for a connection + handshake per
+message, and fall back to connecting themselves when it is not
+
+the local protocol is one json object per line in each direction
+
+    {"op": "emit", "msg_type": "escalate", "payload": {"type": "speak", "data": {...}}}
+    {"op": "status"}
+    -> {"ok": true, ...} or {"ok": false, "error": "..."}
+
+the client side of this module only uses the standard library, the cli
+does not import the client stack when the daemon does the work
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+import time
+from threading import Thread
+from typing import Optional
+
+from hivemind_bus_client.exceptions import HiveMindException
+
+
+def default_socket_path() -> str:
+    """ $HIVEMIND_CLIENT_SOCKET, else a per user path in $XDG_RUNTIME_DIR or the temp dir """
+    path = os.environ.get("HIVEMIND_CLIENT_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "hivemind-client.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else "user"
+    return os.path.join(tempfile.gettempdir(), f"hivemind-client-{uid}.sock")
+
+
+class DaemonError(HiveMindException):
+    """ the daemon received the request but could not do it """
+
+
+# client side
+def daemon_request(request: dict, path: Optional[str] = None, timeout: float = 10) -> Optional[dict]:
+    """ send one request to the daemon, None if no daemon is listening """
+    path = path or default_socket_path()
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    # requests may carry anything the node would send, never hand them
+    # to a socket (or symlink) someone else put at the path
+    if not stat.S_ISSOCK(st.st_mode) or (hasattr(os, "getuid") and st.st_uid != os.getuid()):
+        raise DaemonError(f"{path} is not a socket owned by this user, refusing to use it")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None  # stale socket file, daemon is gone
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise DaemonError("daemon closed the connection without answering")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise DaemonError(response.get("error") or "unknown daemon error")
+    return response
+
+
+def send_via_daemon(msg_type: str, payload: dict, path: Optional[str] = None,
+                    timeout: float = 10) -> bool:
+    """ emit a HiveMessage through the daemon, False if no daemon is running
+
+    Arguments:
+        msg_type: HiveMessageType value, e.g. "bus" or "escalate"
+        payload: the HiveMessage payload, a serialized ovos Message for mycroft payloads
+    """
+    return daemon_request({"op": "emit", "msg_type": msg_type, "payload": payload},
+                          path, timeout) is not None
+
+
+# daemon side
+_RAW_PAYLOADS = ("3rdparty", "bin")
+_MYCROFT_PAYLOADS = ("bus", "shared_bus")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    daemon: "HiveClientDaemon" = None
+
+    def handle(self):
+        # a connection may carry several requests, one per line
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.daemon.handle_request(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:  # windows
+    _UnixServer = None
+
+
+class HiveClientDaemon:
+    """ serves requests from one-shot cli invocations over a connected client
+
+    Arguments:
+        bus: a HiveMessageBusClient, connect() it before or after start()
+        path: unix socket path, see default_socket_path()
+        handshake_timeout: seconds a request waits for the connection to
+                           come (back) up before failing
+    """
+
+    def __init__(self, bus, path: Optional[str] = None, handshake_timeout: float = 10):
+        self.bus = bus
+        self.path = path or default_socket_path()
+        self.handshake_timeout = handshake_timeout
+        self.started = time.time()
+        self.emitted = 0
+        self._server = None
+        self._thread = None
+
+    def start(self) -> "HiveClientDaemon":
+        if _UnixServer is None:
+            raise RuntimeError("unix sockets are not supported on this platform")
+        if daemon_request({"op": "status"}, self.path, timeout=2) is not None:
+            raise RuntimeError(f"a daemon is already listening on {self.path}")
+        if os.path.exists(self.path):
+            os.remove(self.path)  # left behind by a daemon that did not exit cleanly
+        handler = type("_Handler", (_RequestHandler,), {"daemon": self})
+        # the socket speaks with the node's credentials, only the owner may use it
+        umask = os.umask(0o177)
+        try:
+            self._server = _UnixServer(self.path, handler)
+        finally:
+            os.umask(umask)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle_request(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "status":
+            return {"ok": True, "connected": self.bus.handshake_event.is_set(),
+                    "uptime": time.time() - self.started, "emitted": self.emitted}
+        if op == "emit":
+            self.emit(request["msg_type"], request.get("payload"))
+            return {"ok": True}
+        raise ValueError(f"unknown op: {op}")
+
+    def emit(self, msg_type: str, payload):
+        from ovos_bus_client.message import Message
+        from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+        if not self.bus.handshake_event.wait(self.handshake_timeout):
+            raise ConnectionError("not connected to the HiveMind master")
+        if msg_type not in _RAW_PAYLOADS and isinstance(payload, dict) and "type" in payload:
+            # a serialized ovos Message, the client injects session / site_id context into these
+            payload = Message(payload["type"], payload.get("data") or {}, payload.get("context") or {})
+            if msg_type not in _MYCROFT_PAYLOADS:
+                # escalate / propagate / ... carry a HiveMessage
+                payload = HiveMessage(HiveMessageType.BUS, payload).as_dict
+        self.bus.emit(HiveMessage(msg_type, payload))
+        self.emitted += 1
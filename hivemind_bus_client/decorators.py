@@ -18,6 +18,9 @@ class HiveMessageListener:
         return self
 
     def add_handler(self, handler):
+        monitor = getattr(self.bus, "handler_monitor", None)
+        if monitor is not None:
+            handler = monitor.wrap(handler, getattr(self, "payload_type", self.message_type))
         self._handlers.append(handler)
 
     def clear_handlers(self):
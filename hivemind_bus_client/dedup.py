@@ -0,0 +1,164 @@
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from hivemind_bus_client.message import HiveMessage
+
+MSG_ID_KEY = "msg_id"
+
+
+def message_key(message: HiveMessage, hash_payload: bool = True) -> Optional[str]:
+    """ stable identifier of a message across hops
+
+    uses an explicit "msg_id" from the hive metadata or payload if present,
+    otherwise a hash of the payload (route and peers change on every hop
+    so they are not part of the key), None if there is no id and
+    hash_payload is False"""
+    msg_id = message._meta.get(MSG_ID_KEY)
+    pload = message._payload
+    if msg_id is None and isinstance(pload, dict):
+        msg_id = pload.get(MSG_ID_KEY)
+    if msg_id is not None:
+        return str(msg_id)
+    if not hash_payload:
+        return None
+    if isinstance(pload, HiveMessage):
+        pload = pload.as_dict
+    if isinstance(pload, dict):
+        pload = dict(pload)
+        pload.pop("route", None)  # changes on every hop
+        pload = json.dumps(pload, sort_keys=True, default=str)
+    elif not isinstance(pload, (str, bytes)):
+        pload = str(pload)
+    if isinstance(pload, str):
+        pload = pload.encode("utf-8")
+    return message.msg_type + ":" + hashlib.blake2b(pload, digest_size=16).hexdigest()
+
+
+class SeenMessagesCache:
+    """ bounded LRU + TTL set of recently seen message keys
+
+    Arguments:
+        max_size: max number of keys remembered, oldest are evicted first
+        ttl: seconds a key is remembered
+        hash_payloads: also dedup messages without a "msg_id" by a hash of their
+                       payload, identical messages sent on purpose within ttl
+                       (a second "stop") are dropped too, off by default,
+                       HiveMessageBusClient never sets a "msg_id" itself
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 30, hash_payloads: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hash_payloads = hash_payloads
+        self._seen = OrderedDict()
+        self._lock = Lock()
+        self.checked = 0
+        self.suppressed = 0
+
+    def check_and_add(self, key: str) -> bool:
+        """ returns True if key was already seen, remembers it otherwise """
+        now = monotonic()
+        with self._lock:
+            self.checked += 1
+            expires = self._seen.get(key)
+            if expires is not None and expires > now:
+                self.suppressed += 1
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = now + self.ttl
+            self._seen.move_to_end(key)
+            # expired entries are always the oldest
+            while self._seen:
+                oldest, expires = next(iter(self._seen.items()))
+                if len(self._seen) <= self.max_size and expires > now:
+                    break
+                del self._seen[oldest]
+            return False
+
+    def is_duplicate(self, message: HiveMessage) -> bool:
+        key = message_key(message, self.hash_payloads)
+        if key is None:
+            return False  # nothing to recognize it by
+        return self.check_and_add(key)
+
+    def clear(self):
+        with self._lock:
+            self._seen.clear()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def as_dict(self) -> dict:
+        return {"checked": self.checked,
+                "suppressed": self.suppressed,
+                "size": len(self._seen)}
+
+
+class BloomSeenFilter(SeenMessagesCache):
+    """ constant memory seen-set for large hives
+
+    two bloom filters are rotated every ttl seconds, a key is considered
+    seen if it is in either of them, so keys are remembered for
+    ttl to 2 * ttl seconds. False positives (dropping an unseen message)
+    happen with probability ~error_rate
+
+    Arguments:
+        capacity: expected number of distinct messages per ttl window
+        error_rate: acceptable false positive probability
+        ttl: seconds a key is remembered (at least)
+        hash_payloads: see SeenMessagesCache
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001, ttl: float = 30,
+                 hash_payloads: bool = False):
+        super().__init__(max_size=capacity, ttl=ttl, hash_payloads=hash_payloads)
+        self.n_bits = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self._current = bytearray((self.n_bits + 7) // 8)
+        self._previous = bytearray((self.n_bits + 7) // 8)
+        self._rotated = monotonic()
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    @staticmethod
+    def _contains(bits: bytearray, positions) -> bool:
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def check_and_add(self, key: str) -> bool:
+        positions = self._positions(key)
+        with self._lock:
+            now = monotonic()
+            if now - self._rotated > self.ttl:
+                self._previous = self._current
+                self._current = bytearray(len(self._previous))
+                self._rotated = now
+            self.checked += 1
+            if self._contains(self._current, positions) or \
+                    self._contains(self._previous, positions):
+                self.suppressed += 1
+                return True
+            for p in positions:
+                self._current[p >> 3] |= 1 << (p & 7)
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._current = bytearray(len(self._current))
+            self._previous = bytearray(len(self._previous))
+
+    def __len__(self):
+        return sum(bin(b).count("1") for b in self._current) // self.n_hashes
+
+    def as_dict(self) -> dict:
+        return {"checked": self.checked,
+                "suppressed": self.suppressed,
+                "size": len(self)}
@@ -0,0 +1,128 @@
+from copy import deepcopy
+from threading import Lock
+
+from ovos_utils.log import LOG
+
+# reserved context key carrying the delta header
+CONTEXT_DELTA_KEY = "__ctx_delta__"
+
+_MISSING = object()
+
+
+def _dict_diff(new: dict, base: dict):
+    """ keys of new that differ from base + keys of base missing from new """
+    changed = {k: v for k, v in new.items() if base.get(k, _MISSING) != v}
+    removed = [k for k in base if k not in new]
+    return changed, removed
+
+
+class ContextDeltaCodec:
+    """ per connection context delta encoding for BUS messages
+
+    almost every message sent over a connection carries the same context
+    (source, destination, session, site_id...), instead of sending it every
+    time each direction keeps a baseline context and only sends what changed
+
+    keyframe: full context + {"__ctx_delta__": {"v": version, "base": true}},
+        becomes the new baseline
+    delta: {"__ctx_delta__": {"v": version, "set": {...}, "patch": {...}, "del": [...]}}
+        "set" keys replace baseline keys, "patch" updates dict values one level
+        deep ({"key": {"set": {...}, "del": [...]}}), "del" removes keys
+
+    deltas are always relative to the baseline, not to the previous message,
+    so a lost message does not corrupt the ones after it, a delta for an unknown
+    baseline version is decoded from its "set" keys only
+
+    Arguments:
+        keyframe_interval: send a new baseline at least every N messages
+    """
+
+    def __init__(self, keyframe_interval: int = 100):
+        self.keyframe_interval = keyframe_interval
+        # encode + send must be atomic, otherwise a delta may overtake its keyframe
+        self.lock = Lock()
+        self._tx_base = None
+        self._tx_version = 0
+        self._tx_count = 0
+        self._rx_base = None
+        self._rx_version = None
+        self.keyframes = 0
+        self.deltas = 0
+        self.desyncs = 0
+
+    def encode(self, context: dict) -> dict:
+        """ outgoing context -> context to put on the wire """
+        base = self._tx_base
+        if base is None or self._tx_count >= self.keyframe_interval:
+            return self._keyframe(context)
+
+        changed, removed = _dict_diff(context, base)
+        if len(changed) + len(removed) > len(context) // 2:
+            # context changed too much, start over from a new baseline
+            return self._keyframe(context)
+
+        delta = {"v": self._tx_version}
+        sets, patches = {}, {}
+        for k, v in changed.items():
+            old = base.get(k)
+            if isinstance(v, dict) and isinstance(old, dict):
+                sub_set, sub_del = _dict_diff(v, old)
+                patches[k] = {"set": sub_set, "del": sub_del} if sub_del else {"set": sub_set}
+            else:
+                sets[k] = v
+        if sets:
+            delta["set"] = sets
+        if patches:
+            delta["patch"] = patches
+        if removed:
+            delta["del"] = removed
+        self._tx_count += 1
+        self.deltas += 1
+        return {CONTEXT_DELTA_KEY: delta}
+
+    def _keyframe(self, context: dict) -> dict:
+        self._tx_version += 1
+        self._tx_count = 0
+        self._tx_base = deepcopy(context)  # callers may mutate their context later
+        self.keyframes += 1
+        ctxt = dict(context)
+        ctxt[CONTEXT_DELTA_KEY] = {"v": self._tx_version, "base": True}
+        return ctxt
+
+    def decode(self, context: dict) -> dict:
+        """ context received from the wire -> full context """
+        delta = context.get(CONTEXT_DELTA_KEY) if context else None
+        if delta is None:
+            return context  # peer sent a plain context
+        if delta.get("base"):
+            ctxt = dict(context)
+            ctxt.pop(CONTEXT_DELTA_KEY)
+            self._rx_base = deepcopy(ctxt)
+            self._rx_version = delta.get("v")
+            return ctxt
+        if delta.get("v") != self._rx_version:
+            self.desyncs += 1
+            LOG.warning(f"context delta for unknown baseline v{delta.get('v')}, "
+                        f"expected v{self._rx_version}")
+            return dict(delta.get("set") or {})
+
+        # handlers may mutate the context, never hand out the baseline itself
+        ctxt = deepcopy(self._rx_base)
+        ctxt.update(delta.get("set") or {})
+        for k, patch in (delta.get("patch") or {}).items():
+            sub = ctxt.get(k)
+            sub = sub if isinstance(sub, dict) else {}
+            sub.update(patch.get("set") or {})
+            for d in patch.get("del") or []:
+                sub.pop(d, None)
+            ctxt[k] = sub
+        for k in delta.get("del") or []:
+            ctxt.pop(k, None)
+        return ctxt
+
+    def as_dict(self) -> dict:
+        return {"keyframes": self.keyframes,
+                "deltas": self.deltas,
+                "desyncs": self.desyncs,
+                "tx_version": self._tx_version,
+                "rx_version": self._rx_version}
@@ -0,0 +1,110 @@
+"""flight recorder, the last N message events of a client kept in memory
+
+the ring buffer is allocated once, recording is a single list store
+(slot indexes come from itertools.count, atomic under the GIL) so it
+never takes a lock, dumps read whatever is in the buffer at that moment
+
+dumps are triggered by the api, a signal (SIGUSR1 by default) or
+automatically when dispatching a received message takes too long
+"""
+import itertools
+import json
+import os
+import signal
+import tempfile
+import time
+from threading import Thread
+from typing import List, Optional
+
+from ovos_utils.log import LOG
+
+from hivemind_bus_client.capture import IN, OUT
+from hivemind_bus_client.metrics import payload_type, type_label
+
+_STAGES = {IN: ("decrypt", "decode", "dispatch"),
+           OUT: ("encode", "encrypt", "send")}
+
+
+class FlightRecorder:
+    """ fixed size ring buffer of recent message events
+
+    Arguments:
+        size: number of events kept
+        slow_threshold: seconds, dump automatically when dispatching a received
+                        message (all its handlers) takes longer, None disables
+        dump_dir: where dumps are written, system temp dir by default
+        cooldown: min seconds between automatic dumps
+    """
+
+    def __init__(self, size: int = 4096, slow_threshold: Optional[float] = None,
+                 dump_dir: Optional[str] = None, cooldown: float = 60):
+        self.size = size
+        self.slow_threshold = slow_threshold
+        self.dump_dir = dump_dir or tempfile.gettempdir()
+        self.cooldown = cooldown
+        self._slots = [None] * size
+        self._counter = itertools.count()
+        self._last_auto_dump = 0.0
+        self._prev_handler = None
+        self.dumps: List[str] = []  # paths of the dumps written so far
+
+    def record(self, direction: int, message, size: int, stages: tuple):
+        """ stages are the 3 stage durations of the direction, see _STAGES """
+        seq = next(self._counter)
+        self._slots[seq % self.size] = (
+            seq, time.time(), direction, message.msg_type, payload_type(message), size, stages)
+        if direction == IN and self.slow_threshold is not None and \
+                stages[2] > self.slow_threshold:
+            self._slow(message, stages[2])
+
+    def _slow(self, message, duration: float):
+        now = time.monotonic()
+        if now - self._last_auto_dump < self.cooldown:
+            return
+        self._last_auto_dump = now
+        LOG.warning(f"dispatching {type_label(message.msg_type)} took {duration * 1000:.1f} ms, "
+                    f"dumping flight recorder")
+        Thread(target=self.dump, kwargs={"reason": "slow_dispatch"}, daemon=True).start()
+
+    def snapshot(self) -> List[dict]:
+        """ the recorded events, oldest first """
+        # entries carry their sequence number, the counter is never advanced
+        # here, a slot written while we read is simply its newest event
+        entries = sorted(e for e in list(self._slots) if e is not None)
+        events = []
+        for _, ts, direction, msg_type, ptype, size, stages in entries:
+            events.append({"time": ts,
+                           "direction": "in" if direction == IN else "out",
+                           "msg_type": type_label(msg_type),
+                           "payload_type": ptype,
+                           "size": size,
+                           "stages": dict(zip(_STAGES[direction], stages))})
+        return events
+
+    def dump(self, path: Optional[str] = None, reason: str = "manual") -> str:
+        """ write the buffer as json lines, returns the file path """
+        events = self.snapshot()
+        if path is None:
+            path = os.path.join(self.dump_dir,
+                                f"hivemind-flight-{os.getpid()}-{int(time.time() * 1000)}.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"reason": reason, "time": time.time(),
+                                "events": len(events)}) + "\n")
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+        self.dumps.append(path)
+        LOG.info(f"flight recorder dumped {len(events)} events to {path}")
+        return path
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR1", None)):
+        """ dump when the process receives signum, only callable from the main thread """
+        if signum is None:
+            raise RuntimeError("signal not supported on this platform")
+
+        def handle(sig, frame):
+            # file io does not belong in a signal handler
+            Thread(target=self.dump, kwargs={"reason": f"signal {sig}"}, daemon=True).start()
+            if callable(self._prev_handler):
+                self._prev_handler(sig, frame)
+
+        self._prev_handler = signal.signal(signum, handle)
@@ -1,12 +1,94 @@
-from os.path import basename, dirname
-
-from json_database import JsonConfigXDG
+import os
+from copy import copy
+from os.path import basename, dirname, isfile
+from threading import Event, Lock, Thread
+from typing import Dict, Optional
+
+# identity material is loaded once per process and shared by every client,
+# files are only read / parsed again when their mtime changes
+_lock = Lock()
+_identity_file = None
+_identity_mtime = None
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _default_identity_file():
+    global _identity_file, _identity_mtime
+    # json_database (and its file locking deps) only when the default file is used
+    from json_database import JsonConfigXDG
+    with _lock:
+        if _identity_file is None:
+            _identity_file = JsonConfigXDG("_identity", subfolder="hivemind")
+            _identity_mtime = _mtime(_identity_file.path)
+        else:
+            mtime = _mtime(_identity_file.path)
+            if mtime != _identity_mtime:
+                _identity_file.reload()
+                _identity_mtime = mtime
+        # clients set their own key / password / site_id on it, each gets a copy
+        return copy(_identity_file)
+
+
+class _KeyEntry:
+    __slots__ = ("mtime", "handshake", "error", "ready")
+
+    def __init__(self):
+        self.mtime = None
+        self.handshake = None  # never used for a handshake itself, only copied
+        self.error = None
+        self.ready = Event()
+
+
+_keys: Dict[str, _KeyEntry] = {}
+
+
+def _load_key(path: str, entry: _KeyEntry):
+    try:
+        from poorman_handshake import HandShake
+        entry.handshake = HandShake(path)  # generates and saves the key if missing
+    except Exception as e:
+        entry.error = e
+    entry.mtime = _mtime(path)
+    entry.ready.set()
+
+
+def preload_key(path: str) -> _KeyEntry:
+    """ parse (or generate) the private key at path in a background thread,
+    does nothing if it is already cached or loading """
+    with _lock:
+        entry = _keys.get(path)
+        if entry is not None and (not entry.ready.is_set() or
+                                  (entry.error is None and entry.mtime == _mtime(path))):
+            return entry
+        entry = _keys[path] = _KeyEntry()
+    Thread(target=_load_key, args=(path, entry), daemon=True).start()
+    return entry
+
+
+def get_handshake(path: str, timeout: Optional[float] = None):
+    """ a fresh poorman_handshake.HandShake for the private key at path
+
+    the key is parsed once per process, every call returns a copy sharing
+    the parsed key, waits if the key is still loading in the background
+    """
+    entry = preload_key(path)
+    if not entry.ready.wait(timeout):
+        raise TimeoutError(f"loading private key {path} timed out")
+    if entry.error is not None:
+        raise entry.error
+    return copy(entry.handshake)
 
 
 class NodeIdentity:
 
     def __init__(self, identity_file=None):
-        self.IDENTITY_FILE = identity_file or JsonConfigXDG("_identity", subfolder="hivemind")
+        self.IDENTITY_FILE = identity_file or _default_identity_file()
 
     @property
     def name(self):
@@ -68,6 +150,23 @@ class NodeIdentity:
     def default_master(self, val):
         self.IDENTITY_FILE["default_master"] = val
 
+    @property
+    def masters(self) -> list:
+        """ "ws://host:port?weight=2" urls for HiveMultiMasterClient, in priority order """
+        masters = self.IDENTITY_FILE.get("masters")
+        if masters:
+            return masters
+        return [self.default_master] if self.default_master else []
+
+    @masters.setter
+    def masters(self, val: list):
+        self.IDENTITY_FILE["masters"] = val
+
+    def preload(self):
+        """ start parsing the private key in the background, so connecting does not wait for it """
+        if isfile(self.private_key):
+            preload_key(self.private_key)
+
     def save(self):
         self.IDENTITY_FILE.store()
 
@@ -0,0 +1,97 @@
+import statistics
+from collections import deque
+from threading import Event, Thread
+from typing import Optional
+
+
+class LinkStats:
+    """ latency statistics for the link to a hivemind master
+
+    smoothed rtt and jitter follow the TCP retransmission timer
+    estimators (RFC 6298), clock offset follows NTP,
+    all values are in seconds
+    """
+    ALPHA = 1 / 8  # srtt gain
+    BETA = 1 / 4  # jitter gain
+
+    def __init__(self, max_samples: int = 100):
+        self.samples = deque(maxlen=max_samples)
+        self.offsets = deque(maxlen=max_samples)
+        self.srtt: Optional[float] = None
+        self.jitter: Optional[float] = None
+        self.sent = 0
+        self.received = 0
+
+    def record(self, rtt: float, offset: Optional[float] = None):
+        self.received += 1
+        self.samples.append(rtt)
+        if offset is not None:
+            self.offsets.append(offset)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.jitter = rtt / 2
+        else:
+            self.jitter = (1 - self.BETA) * self.jitter + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+    @property
+    def lost(self) -> int:
+        return max(self.sent - self.received, 0)
+
+    @property
+    def loss(self) -> float:
+        """ fraction of pings that never got an answer """
+        return self.lost / self.sent if self.sent else 0.0
+
+    @property
+    def clock_offset(self) -> Optional[float]:
+        """ estimated master clock - local clock,
+        median of recent samples to filter out asymmetric delays """
+        if not self.offsets:
+            return None
+        return statistics.median(self.offsets)
+
+    @property
+    def last_rtt(self) -> Optional[float]:
+        return self.samples[-1] if self.samples else None
+
+    @property
+    def min_rtt(self) -> Optional[float]:
+        return min(self.samples) if self.samples else None
+
+    @property
+    def max_rtt(self) -> Optional[float]:
+        return max(self.samples) if self.samples else None
+
+    def as_dict(self) -> dict:
+        return {"sent": self.sent,
+                "received": self.received,
+                "lost": self.lost,
+                "loss": self.loss,
+                "last_rtt": self.last_rtt,
+                "min_rtt": self.min_rtt,
+                "max_rtt": self.max_rtt,
+                "srtt": self.srtt,
+                "jitter": self.jitter,
+                "clock_offset": self.clock_offset}
+
+
+class PingProber(Thread):
+    """ periodically pings the master in the background,
+    results are accumulated in client.ping_stats """
+
+    def __init__(self, client, interval: float = 30, timeout: float = 5):
+        super().__init__(daemon=True)
+        self.client = client
+        self.interval = interval
+        self.timeout = timeout
+        self._stop_event = Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.client.handshake_event.is_set():
+                self.client.ping(timeout=self.timeout)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
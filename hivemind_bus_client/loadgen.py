@@ -0,0 +1,254 @@
+"""multi connection load generator, simulates many satellites talking to one master
+
+used by "hivemind-client bench" to capacity plan masters, works against
+a real master or the in-package MockHiveMaster
+"""
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from threading import Event, Thread
+from typing import Dict, List, Optional
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+from ovos_utils.messagebus import FakeBus
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.identity import NodeIdentity
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+MESSAGE_KINDS = ("bus", "shared_bus", "binary")
+
+
+@dataclass
+class LoadProfile:
+    satellites: int = 10
+    duration: float = 30  # seconds of traffic, after all satellites connected
+    rate: float = 5.0  # messages per second, per satellite
+    # relative weights of BUS utterances, SHARED_BUS streams and BINARY audio chunks
+    mix: Dict[str, float] = field(default_factory=lambda: {"bus": 0.7, "shared_bus": 0.2,
+                                                           "binary": 0.1})
+    payload_size: int = 64  # characters per utterance / shared message
+    binary_size: int = 3200  # bytes per audio chunk, 100ms of 16kHz 16bit audio
+    ramp_up: float = 0  # seconds over which satellites connect
+    ping_interval: float = 1.0  # seconds between latency probes, 0 to disable
+    binarize: bool = True
+    compress: Optional[bool] = None
+    connect_timeout: float = 30
+    seed: Optional[int] = None
+
+    @staticmethod
+    def parse_mix(mix: str) -> Dict[str, float]:
+        """ "bus=0.7,shared_bus=0.2,binary=0.1" -> dict """
+        weights = {}
+        for part in mix.split(","):
+            kind, _, weight = part.partition("=")
+            kind = kind.strip().lower()
+            if kind not in MESSAGE_KINDS:
+                raise ValueError(f"unknown message kind '{kind}', valid: {MESSAGE_KINDS}")
+            weights[kind] = float(weight or 1)
+        return weights
+
+
+class _MemoryIdentityFile(dict):
+    """ identity that is never saved, satellites must not share the user's identity file """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def store(self):
+        pass
+
+    def reload(self):
+        pass
+
+
+def percentiles(samples: List[float], scale: float = 1000) -> dict:
+    """ p50/p90/p99/max of samples, in ms by default """
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+
+    def pick(q):
+        return round(samples[min(int(len(samples) * q), len(samples) - 1)] * scale, 3)
+
+    return {"count": len(samples), "p50": pick(0.5), "p90": pick(0.9),
+            "p99": pick(0.99), "max": round(samples[-1] * scale, 3)}
+
+
+class _Satellite(Thread):
+    def __init__(self, gen: "LoadGenerator", idx: int):
+        super().__init__(daemon=True)
+        self.gen = gen
+        self.idx = idx
+        self.rng = random.Random(None if gen.profile.seed is None else gen.profile.seed + idx)
+        self.client: Optional[HiveMessageBusClient] = None
+        self.handshake_time: Optional[float] = None
+        self.sent = Counter()
+        self.errors = Counter()
+        self.echo_rtts = []
+        self._pending = {}
+        self.connected = Event()
+
+    def _connect(self):
+        gen = self.gen
+        identity = NodeIdentity(_MemoryIdentityFile(os.path.join(gen.workdir, "identity.json")))
+        # one key file shared by all satellites, so it is generated once
+        identity.private_key = os.path.join(gen.workdir, "satellite.asc")
+        self.client = HiveMessageBusClient(gen.key, password=gen.password,
+                                           host=gen.host, port=gen.port,
+                                           useragent=f"hivemind-bench-{self.idx}",
+                                           identity=identity,
+                                           unix_socket=gen.unix_socket,
+                                           binarize=gen.profile.binarize,
+                                           compress=gen.profile.compress)
+        self.client.on(HiveMessageType.BUS, self._handle_echo)
+        start = time.monotonic()
+        connector = Thread(target=self.client.connect, args=(FakeBus(),), daemon=True)
+        connector.start()
+        if not self.client.handshake_event.wait(gen.profile.connect_timeout):
+            raise TimeoutError("handshake timed out")
+        self.handshake_time = time.monotonic() - start
+
+    def _handle_echo(self, message: HiveMessage):
+        # masters that echo (like the mock) let us measure full round trips
+        data = message.payload.data
+        if data.get("bench_sat") == self.idx:
+            sent_at = self._pending.pop(data.get("bench_seq"), None)
+            if sent_at is not None:
+                self.echo_rtts.append(time.monotonic() - sent_at)
+
+    def _build(self, kind: str, seq: int) -> HiveMessage:
+        profile = self.gen.profile
+        text = "x" * profile.payload_size
+        if kind == "binary":
+            return HiveMessage(HiveMessageType.BINARY, payload=os.urandom(profile.binary_size))
+        if kind == "shared_bus":
+            return HiveMessage(HiveMessageType.SHARED_BUS,
+                               payload=Message("enclosure.mouth.viseme", {"code": text}))
+        self._pending[seq] = time.monotonic()
+        return HiveMessage(HiveMessageType.BUS,
+                           payload=Message("recognizer_loop:utterance",
+                                           {"utterances": [text], "lang": "en-us",
+                                            "bench_sat": self.idx, "bench_seq": seq},
+                                           {"destination": "skills"}))
+
+    def run(self):
+        gen = self.gen
+        try:
+            self._connect()
+        except Exception as e:
+            LOG.error(f"satellite {self.idx} failed to connect: {e}")
+            self.errors["connect"] += 1
+            return
+        finally:
+            self.connected.set()
+
+        profile = gen.profile
+        kinds = [k for k in MESSAGE_KINDS if profile.mix.get(k)]
+        weights = [profile.mix[k] for k in kinds]
+        if profile.ping_interval:
+            self.client.start_ping_prober(interval=profile.ping_interval)
+        gen.start_event.wait()
+
+        interval = 1 / profile.rate if profile.rate > 0 else 0
+        next_send = time.monotonic() + self.rng.uniform(0, interval)  # spread satellites
+        seq = 0
+        while not gen.stop_event.is_set():
+            if interval:
+                delay = next_send - time.monotonic()
+                if delay > 0 and gen.stop_event.wait(delay):
+                    break
+                next_send += interval
+            kind = self.rng.choices(kinds, weights)[0]
+            try:
+                self.client.emit(self._build(kind, seq))
+                self.sent[kind] += 1
+            except Exception as e:
+                self.errors["send"] += 1
+                LOG.debug(f"satellite {self.idx} send failed: {e}")
+            seq += 1
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+class LoadGenerator:
+    """ start N simulated satellites and report how the master copes
+
+    Arguments:
+        key/password: credentials every satellite uses
+        host/port/unix_socket: where the master is
+        profile: what and how much each satellite sends
+    """
+
+    def __init__(self, key: str, password: str, host: str = "127.0.0.1", port: int = 5678,
+                 profile: Optional[LoadProfile] = None, unix_socket: Optional[str] = None):
+        self.key = key
+        self.password = password
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.profile = profile or LoadProfile()
+        self.start_event = Event()
+        self.stop_event = Event()
+        self.workdir = tempfile.mkdtemp(prefix="hivemind-bench-")
+        self.satellites: List[_Satellite] = []
+
+    def run(self) -> dict:
+        profile = self.profile
+        self.satellites = [_Satellite(self, i) for i in range(profile.satellites)]
+        ramp = profile.ramp_up / profile.satellites if profile.satellites else 0
+        for sat in self.satellites:
+            sat.start()
+            if ramp:
+                time.sleep(ramp)
+            elif sat.idx == 0:
+                sat.connected.wait()  # let the first one create the shared key file
+        for sat in self.satellites:
+            sat.connected.wait()
+
+        start = time.monotonic()
+        self.start_event.set()
+        self.stop_event.wait(profile.duration)
+        self.stop_event.set()
+        elapsed = time.monotonic() - start
+        time.sleep(min(1.0, profile.duration))  # let in flight echoes arrive
+        for sat in self.satellites:
+            sat.join(timeout=5)
+            sat.close()
+        return self.report(elapsed)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def report(self, elapsed: float) -> dict:
+        sent, errors = Counter(), Counter()
+        handshakes, echoes, pings = [], [], []
+        connected = 0
+        for sat in self.satellites:
+            sent.update(sat.sent)
+            errors.update(sat.errors)
+            echoes += sat.echo_rtts
+            if sat.handshake_time is not None:
+                connected += 1
+                handshakes.append(sat.handshake_time)
+            if sat.client is not None:
+                pings += list(sat.client.ping_stats.samples)
+                errors["ping_lost"] += sat.client.ping_stats.lost
+        total = sum(sent.values())
+        return {"satellites": len(self.satellites),
+                "connected": connected,
+                "duration": round(elapsed, 3),
+                "sent": dict(sent),
+                "sent_total": total,
+                "throughput_msgs_per_sec": round(total / elapsed, 1) if elapsed else 0,
+                "errors": {k: v for k, v in errors.items() if v},
+                "handshake_ms": percentiles(handshakes),
+                "echo_rtt_ms": percentiles(echoes),
+                "ping_rtt_ms": percentiles(pings)}
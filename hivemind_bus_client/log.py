@@ -0,0 +1,165 @@
+"""cheap logging for lines written once per message
+
+ovos_utils LOG inspects the call stack on every call, even for lines
+below the log level, and f-strings format their payload before LOG gets
+to decide, per message lines use HotLogger instead
+
+    - the level check is a dict lookup, nothing else happens for disabled lines
+    - arguments are %-formatted lazily, only for lines that are written
+    - levels are set per category, e.g. HIVEMIND_LOG_LEVELS="protocol=DEBUG,client=WARNING",
+      categories without a level follow the ovos LOG level
+    - a line (its format string) is written at most `burst` times per `interval`
+      seconds, the rest are counted and reported as suppressed
+    - payloads wrapped in Payload(...) are rendered with a size limit,
+      without copying or serializing them
+"""
+import logging
+import os
+import reprlib
+import time
+from typing import Dict, Optional
+
+from ovos_utils.log import LOG
+
+_levels: Dict[str, int] = {}
+
+
+def _parse_level(level) -> int:
+    if isinstance(level, int):
+        return level
+    return logging.getLevelName(str(level).upper())
+
+
+_global_level = (None, logging.INFO)  # (ovos LOG.level, parsed)
+
+
+def _ovos_level() -> int:
+    global _global_level
+    if _global_level[0] != LOG.level:
+        _global_level = (LOG.level, _parse_level(LOG.level))
+    return _global_level[1]
+
+
+def set_log_level(category: str, level: Optional[str]):
+    """ level for one category, None to follow the ovos LOG level again """
+    if level is None:
+        _levels.pop(category, None)
+    else:
+        _levels[category] = _parse_level(level)
+
+
+def _load_env_levels():
+    for entry in os.environ.get("HIVEMIND_LOG_LEVELS", "").split(","):
+        category, _, level = entry.partition("=")
+        if category.strip() and level.strip():
+            set_log_level(category.strip(), level.strip())
+
+
+_load_env_levels()
+
+_repr = reprlib.Repr()
+_repr.maxlevel = 3
+_repr.maxdict = 10
+_repr.maxlist = 10
+_repr.maxstring = 80
+_repr.maxother = 80
+
+
+class Payload:
+    """ size limited rendering of a payload, only evaluated if the line is written """
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj, limit: int = 300):
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self):
+        obj = self.obj
+        if hasattr(obj, "msg_type") and hasattr(obj, "_payload"):  # HiveMessage
+            text = f"{getattr(obj.msg_type, 'value', obj.msg_type)} {_repr.repr(obj._payload)}"
+        elif hasattr(obj, "msg_type") and hasattr(obj, "data"):  # mycroft Message
+            text = f"{obj.msg_type} data={_repr.repr(obj.data)}"
+        elif isinstance(obj, (bytes, bytearray)):
+            text = f"<{len(obj)} bytes>"
+        else:
+            text = _repr.repr(obj)
+        if len(text) > self.limit:
+            text = text[:self.limit] + "..."
+        return text
+
+
+class HotLogger:
+    """ logger for one category of per message log lines
+
+    Arguments:
+        category: name used for the per category level and in the log output
+        burst: lines with the same format string allowed per interval
+        interval: seconds
+    """
+
+    def __init__(self, category: str, burst: int = 20, interval: float = 10):
+        self.category = category
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # format string -> [window start, lines written, lines suppressed]
+        self._logger = None
+
+    @property
+    def level(self) -> int:
+        level = _levels.get(self.category)
+        if level is None:
+            level = _ovos_level()
+        return level
+
+    def is_enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def _allowed(self, msg: str) -> int:
+        """ -1 if the line is suppressed, otherwise the count of lines suppressed before it """
+        now = time.monotonic()
+        window = self._windows.get(msg)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            self._windows[msg] = [now, 1, 0]
+            return suppressed
+        if window[1] >= self.burst:
+            window[2] += 1
+            return -1
+        window[1] += 1
+        return 0
+
+    def log(self, level: int, msg: str, *args):
+        if level < self.level:
+            return
+        suppressed = self._allowed(msg)
+        if suppressed < 0:
+            return
+        if self._logger is None:
+            # same handlers and format as ovos LOG, without the stack inspection
+            self._logger = LOG.create_logger(f"{LOG.name} - hivemind_bus_client.{self.category}")
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar lines suppressed)"
+        # the logger level follows the global ovos level, the category level was checked above
+        self._logger.handle(self._logger.makeRecord(self._logger.name, level, "", 0,
+                                                    msg, args, None))
+
+    def debug(self, msg: str, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg: str, *args):
+        self.log(logging.WARNING, msg, *args)
+
+    def error(self, msg: str, *args):
+        self.log(logging.ERROR, msg, *args)
+
+
+_loggers: Dict[str, HotLogger] = {}
+
+
+def get_logger(category: str) -> HotLogger:
+    if category not in _loggers:
+        _loggers[category] = HotLogger(category)
+    return _loggers[category]
@@ -1,5 +1,7 @@
 from enum import Enum
 import json
+from sys import intern
+from typing import Optional
 from ovos_utils.json_helper import merge_dict
 from ovos_bus_client import Message
 
@@ -24,14 +26,55 @@ class HiveMessageType(str, Enum):
     BINARY = "bin"  # binary data container, payload for something else
 
 
+_HIVE_TYPES = frozenset(m.value for m in HiveMessageType)
+
+
+class RoutePolicy(str, Enum):
+    """ what to drop when a route grows above HiveMessage.max_route_length """
+    DROP_OLDEST = "drop_oldest"  # keep only the most recent hops
+    KEEP_ORIGIN = "keep_origin"  # keep the first hop + the most recent hops
+
+
+def _intern(peer):
+    return intern(peer) if isinstance(peer, str) else peer
+
+
+def _route_entry(hop) -> tuple:
+    """ normalize a route hop into a compact (source, targets, extra) tuple
+
+    accepts the dict form {"source": .., "targets": [..], ...}
+    and the compact list form [source, [targets], {extra}]
+    peer ids are interned, they repeat across every message of a connection
+    """
+    if isinstance(hop, dict):
+        extra = {k: v for k, v in hop.items() if k not in ("source", "targets")}
+        source, targets = hop.get("source"), hop.get("targets")
+    else:
+        source, targets = hop[0], hop[1]
+        extra = hop[2] if len(hop) > 2 else None
+    targets = tuple(_intern(t) for t in targets or ())
+    return _intern(source), targets, extra or None
+
+
+def _compact_hop(hop: tuple) -> list:
+    src, targets, extra = hop
+    if extra:
+        return [src, list(targets), extra]
+    return [src, list(targets)]
+
+
 class HiveMessage:
+    # routes grow on every hop, cap them for deep hives, None -> unbounded
+    max_route_length: Optional[int] = None
+    route_policy: RoutePolicy = RoutePolicy.KEEP_ORIGIN
+
     def __init__(self, msg_type, payload=None, node=None, source_peer=None,
                  route=None, target_peers=None, meta=None):
         #  except for the hivemind node classes receiving the message and
         #  creating the object nothing should be able to change these values
         #  node classes might change them a runtime by the private attribute
         #  but end-users should consider them read_only
-        if msg_type not in [m.value for m in HiveMessageType]:
+        if msg_type not in _HIVE_TYPES:
             raise ValueError("Unknown HiveMessage.msg_type")
 
         self._msg_type = msg_type
@@ -50,9 +93,10 @@ class HiveMessage:
             payload = json.loads(payload)
         self._payload = payload or {}
 
-        self._node = node  # node semi-unique identifier
-        self._source_peer = source_peer  # peer_id
-        self._route = route or []  # where did this message come from
+        self._node = _intern(node)  # node semi-unique identifier
+        self._source_peer = _intern(source_peer)  # peer_id
+        # where did this message come from, list of (source, targets, extra) tuples
+        self._route = [_route_entry(hop) for hop in route or []]
         self._targets = target_peers or []  # where will it be sent
         self._meta = meta or {}
 
@@ -76,7 +120,20 @@ class HiveMessage:
 
     @property
     def route(self):
-        return [r for r in self._route if r.get("targets") and r.get("source")]
+        return [self._route_dict(r) for r in self._route if r[0] and r[1]]
+
+    @property
+    def compact_route(self):
+        """ route as a list of [source, [targets]] or [source, [targets], {extra}] """
+        return [_compact_hop(r) for r in self._route if r[0] and r[1]]
+
+    @staticmethod
+    def _route_dict(hop: tuple) -> dict:
+        src, targets, extra = hop
+        hop = {"source": src, "targets": list(targets)}
+        if extra:
+            hop.update(extra)
+        return hop
 
     @property
     def payload(self):
@@ -87,22 +144,37 @@ class HiveMessage:
         if self.msg_type in [HiveMessageType.BROADCAST,
                              HiveMessageType.PROPAGATE,
                              HiveMessageType.CASCADE,
+                             HiveMessageType.QUERY,
                              HiveMessageType.ESCALATE]:
             return HiveMessage(**self._payload)
         return self._payload
 
     @property
     def as_dict(self):
+        return self._as_dict()
+
+    @property
+    def as_compact_dict(self):
+        """ same as as_dict, but routes use the compact list form, used in binarized mode """
+        return self._as_dict(compact=True)
+
+    def _as_dict(self, compact=False):
         pload = self._payload
         if isinstance(pload, HiveMessage):
-            pload = pload.as_json
+            pload = pload._as_dict(compact)
         elif isinstance(pload, Message):
             pload = pload.serialize()
         if isinstance(pload, str):
             pload = json.loads(pload)
+        if isinstance(pload, dict) and pload.get("route") and "msg_type" in pload:
+            # nested hive message kept in dict form, its route may be in either
+            # form depending on where it came from, normalize it to the requested one
+            hops = [_route_entry(hop) for hop in pload["route"]]
+            route = [_compact_hop(h) for h in hops] if compact else [self._route_dict(h) for h in hops]
+            pload = dict(pload, route=route)
         return {"msg_type": self.msg_type,
                 "payload": pload,
-                "route": self.route,
+                "route": self.compact_route if compact else self.route,
                 "node": self.node_id,
                 "source_peer": self.source_peer}
 
@@ -110,7 +182,9 @@ class HiveMessage:
     def as_json(self):
         return json.dumps(self.as_dict)
 
-    def serialize(self):
+    def serialize(self, compact=False):
+        if compact:
+            return json.dumps(self.as_compact_dict)
         return self.as_json
 
     @staticmethod
@@ -144,22 +218,33 @@ class HiveMessage:
         return self.as_json
 
     def update_hop_data(self, data=None, **kwargs):
-        if not self._route or self._route[-1]["source"] != self.source_peer:
-            self._route += [{"source": self.source_peer,
-                             "targets": self.target_peers}]
+        if not self._route or self._route[-1][0] != self.source_peer:
+            self._route.append(_route_entry((self.source_peer, self.target_peers)))
+            self._enforce_route_length()
         if self._route and data:
-            self._route[-1] = merge_dict(self._route[-1], data, **kwargs)
+            hop = merge_dict(self._route_dict(self._route[-1]), data, **kwargs)
+            self._route[-1] = _route_entry(hop)
+
+    def _enforce_route_length(self):
+        max_len = self.max_route_length
+        if max_len is None or len(self._route) <= max_len:
+            return
+        if self.route_policy == RoutePolicy.KEEP_ORIGIN and max_len > 1:
+            del self._route[1:len(self._route) - max_len + 1]
+        else:
+            del self._route[:len(self._route) - max_len]
 
     def replace_route(self, route):
-        self._route = route
+        self._route = [_route_entry(hop) for hop in route or []]
+        self._enforce_route_length()
 
     def update_source_peer(self, peer):
-        self._source_peer = peer
+        self._source_peer = _intern(peer)
         return self
 
     def add_target_peer(self, peer):
-        self._targets.append(peer)
+        self._targets.append(_intern(peer))
 
     def remove_target_peer(self, peer):
         if peer in self._targets:
-            self._targets.pop(peer)
+            self._targets.remove(peer)
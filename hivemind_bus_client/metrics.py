@@ -0,0 +1,381 @@
+"""counters, histograms and gauges for HiveMessageBusClient
+
+recording never takes a lock, every thread writes to its own shard and
+shards are only summed when stats are read, values are exported as a
+dict (get_stats), prometheus text (http endpoint or file) or pushed to
+a callback periodically
+"""
+import os
+import threading
+import weakref
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, Optional, Sequence
+
+from ovos_utils.log import LOG
+
+from hivemind_bus_client.message import HiveMessageType
+
+# seconds, from tens of microseconds (crypto on small messages) to handshakes
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OVERFLOW_LABEL = "other"
+
+_MYCROFT_TYPES = (HiveMessageType.BUS, HiveMessageType.SHARED_BUS)
+
+
+class _Instrument:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str = "", labels: Sequence[str] = (),
+                 max_series: int = 256):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # unbounded label values (e.g. mycroft message types) are folded into "other"
+        self.max_series = max_series
+        self._local = threading.local()
+        self._shards = []  # (thread weakref, shard)
+        self._shards_lock = Lock()  # only taken once per thread and when reading
+        self._retired = {}  # shards of threads that exited
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+            return shard
+
+    def _key(self, shard: dict, labels: tuple) -> tuple:
+        if labels not in shard and len(shard) >= self.max_series:
+            return (OVERFLOW_LABEL,) * len(labels)
+        return labels
+
+    def _merge(self, into: dict, shard: dict):
+        raise NotImplementedError
+
+    def collect(self) -> dict:
+        """ {label values tuple: value}, summed over all threads """
+        with self._shards_lock:
+            alive = []
+            for ref, shard in self._shards:
+                if ref() is None or not ref().is_alive():
+                    self._merge(self._retired, shard)  # can not be written to anymore
+                else:
+                    alive.append((ref, shard))
+            self._shards = alive
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in alive:
+                self._merge(total, shard)
+        return total
+
+
+class Counter(_Instrument):
+    kind = "counter"
+
+    def inc(self, *labels, n: float = 1):
+        shard = self._shard()
+        key = self._key(shard, labels)
+        shard[key] = shard.get(key, 0) + n
+
+    def _merge(self, into: dict, shard: dict):
+        for key, value in list(shard.items()):
+            into[key] = into.get(key, 0) + value
+
+    def total(self) -> float:
+        return sum(self.collect().values())
+
+
+class Histogram(_Instrument):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, max_series: int = 256):
+        super().__init__(name, help, labels, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            key = self._key(shard, labels)
+            entry = shard.get(key)
+            if entry is None:
+                entry = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def _merge(self, into: dict, shard: dict):
+        for key, (counts, total, count) in list(shard.items()):
+            merged = into.get(key)
+            if merged is None:
+                into[key] = [list(counts), total, count]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+
+    def quantile(self, counts: list, count: int, q: float) -> Optional[float]:
+        """ upper bound of the bucket holding the q quantile """
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Gauge(_Instrument):
+    """ value is computed when read, func returns a number or {label values tuple: number} """
+    kind = "gauge"
+
+    def __init__(self, name: str, func: Callable, help: str = "", labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.func = func
+
+    def collect(self) -> dict:
+        value = self.func()
+        if isinstance(value, dict):
+            return value
+        return {(): value}
+
+
+def _label_key(labels: tuple) -> str:
+    return "/".join(str(l) for l in labels) or "total"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _fmt(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """ a set of instruments that are exported together """
+
+    def __init__(self):
+        self.instruments: Dict[str, _Instrument] = {}
+        self._exporters = []
+        self._http = None
+
+    def register(self, instrument: _Instrument) -> _Instrument:
+        """ add an existing instrument, instruments can be shared between registries """
+        self.instruments[instrument.name] = instrument
+        return instrument
+
+    def counter(self, name: str, help: str = "", labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str = "", labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, func: Callable, help: str = "",
+              labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, func, help, labels))
+
+    # export
+    def as_dict(self) -> dict:
+        stats = {}
+        for name, inst in self.instruments.items():
+            values = inst.collect()
+            if isinstance(inst, Histogram):
+                values = {k: {"count": count,
+                              "sum": total,
+                              "avg": total / count if count else None,
+                              "p50": inst.quantile(counts, count, 0.5),
+                              "p99": inst.quantile(counts, count, 0.99)}
+                          for k, (counts, total, count) in values.items()}
+            if not inst.labels:
+                stats[name] = values.get((), {"count": 0} if isinstance(inst, Histogram) else 0)
+            else:
+                stats[name] = {_label_key(k): v for k, v in values.items()}
+        return stats
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, inst in self.instruments.items():
+            if inst.help:
+                lines.append(f"# HELP {name} {inst.help}")
+            lines.append(f"# TYPE {name} {inst.kind}")
+            for key, value in inst.collect().items():
+                labels = [f'{l}="{_escape(v)}"' for l, v in zip(inst.labels, key)]
+                if not isinstance(inst, Histogram):
+                    label_str = "{" + ",".join(labels) + "}" if labels else ""
+                    lines.append(f"{name}{label_str} {_fmt(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, c in zip(inst.buckets + (float("inf"),), counts):
+                    cumulative += c
+                    le = ",".join(labels + [f'le="{_fmt(bound)}"'])
+                    lines.append(f"{name}_bucket{{{le}}} {cumulative}")
+                label_str = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{name}_sum{label_str} {_fmt(total)}")
+                lines.append(f"{name}_count{label_str} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """ write prometheus text format to a file, e.g. for the node_exporter textfile collector """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)  # scrapers never see a half written file
+
+    def add_callback(self, func: Callable[[dict], None], interval: float = 10) -> "_PeriodicExporter":
+        """ call func(self.as_dict()) every interval seconds in a background thread """
+        exporter = _PeriodicExporter(lambda: func(self.as_dict()), interval)
+        self._exporters.append(exporter)
+        exporter.start()
+        return exporter
+
+    def export_to_file(self, path: str, interval: float = 15) -> "_PeriodicExporter":
+        """ rewrite a prometheus text file every interval seconds """
+        exporter = _PeriodicExporter(lambda: self.write_prometheus(path), interval)
+        self._exporters.append(exporter)
+        exporter.start()
+        return exporter
+
+    def serve_http(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """ serve prometheus text format on http://host:port/metrics, port 0 picks a free port """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # scrapes are not worth a log line
+
+        self.stop_http()
+        self._http = ThreadingHTTPServer((host, port), Handler)
+        self._http.daemon_threads = True
+        Thread(target=self._http.serve_forever, daemon=True).start()
+        return self._http
+
+    def stop_http(self):
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+
+    def stop(self):
+        """ stop all exporters """
+        for exporter in self._exporters:
+            exporter.stop()
+        self._exporters = []
+        self.stop_http()
+
+
+class _PeriodicExporter(Thread):
+    def __init__(self, func: Callable, interval: float):
+        super().__init__(daemon=True)
+        self.func = func
+        self.interval = interval
+        self._stop_event = Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.func()
+            except Exception as e:
+                LOG.error(f"metrics export failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class ClientMetrics(MetricsRegistry):
+    """ the instruments recorded by HiveMessageBusClient """
+
+    def __init__(self):
+        super().__init__()
+        self.messages_in = self.counter("hivemind_messages_received_total",
+                                        "messages received", ("msg_type", "payload_type"))
+        self.messages_out = self.counter("hivemind_messages_sent_total",
+                                         "messages sent", ("msg_type", "payload_type"))
+        self.bytes_in = self.counter("hivemind_bytes_received_total",
+                                     "websocket payload bytes received", ("msg_type",))
+        self.bytes_out = self.counter("hivemind_bytes_sent_total",
+                                      "websocket payload bytes sent", ("msg_type",))
+        self.encode_seconds = self.histogram("hivemind_encode_seconds",
+                                             "serialization time", ("format",))
+        self.decode_seconds = self.histogram("hivemind_decode_seconds",
+                                             "deserialization time", ("format",))
+        self.encrypt_seconds = self.histogram("hivemind_encrypt_seconds",
+                                              "encryption time", ("format",))
+        self.decrypt_seconds = self.histogram("hivemind_decrypt_seconds",
+                                              "decryption time", ("format",))
+        self.handshake_seconds = self.histogram("hivemind_handshake_seconds",
+                                                "time from websocket open to handshake done")
+        self.connections = self.counter("hivemind_connections_total",
+                                        "websocket connections opened, reconnects included")
+        # passed down to get_bitstring / decode_bitstring by the client
+        self.compression = self.counter("hivemind_compression_bytes",
+                                        "bytes before (raw) and after (zlib) compression",
+                                        ("direction", "stage"))
+        self._handshake_start: Optional[float] = None
+
+    def connection_opened(self):
+        self.connections.inc()
+        self._handshake_start = monotonic()
+
+    def handshake_completed(self):
+        if self._handshake_start is not None:
+            self.handshake_seconds.observe(monotonic() - self._handshake_start)
+            self._handshake_start = None
+
+    @property
+    def reconnects(self) -> int:
+        return max(int(self.connections.total()) - 1, 0)
+
+    def compression_ratio(self) -> Dict[str, Optional[float]]:
+        """ compressed / raw bytes per direction """
+        values = self.compression.collect()
+        ratios = {}
+        for direction in ("in", "out"):
+            raw = values.get((direction, "raw"), 0)
+            ratios[direction] = values.get((direction, "zlib"), 0) / raw if raw else None
+        return ratios
+
+    def as_dict(self) -> dict:
+        stats = super().as_dict()
+        stats["reconnects"] = self.reconnects
+        stats["compression_ratio"] = self.compression_ratio()
+        return stats
+
+
+def type_label(msg_type) -> str:
+    """ "bus" for both HiveMessageType.BUS and "bus" """
+    return getattr(msg_type, "value", msg_type)
+
+
+def payload_type(message) -> str:
+    """ mycroft message type of BUS/SHARED_BUS messages, "" otherwise """
+    pload = message._payload
+    if message.msg_type in _MYCROFT_TYPES and isinstance(pload, dict):
+        return pload.get("type") or ""
+    return ""
+
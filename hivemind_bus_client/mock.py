@@ -0,0 +1,468 @@
+"""lightweight stand-in HiveMind master, for tests and benchmarks
+
+implements the master side of what HiveMindSlaveProtocol expects:
+HELLO, the password and pubkey HANDSHAKE, binarize / protocol version /
+payload encoding / context delta negotiation and AES encryption,
+over a local port or a unix socket, with no dependencies beyond this package
+
+    with MockHiveMaster(password="...", mode="echo") as master:
+        bus = HiveMessageBusClient(key, password="...", port=master.port)
+        bus.connect()
+
+this is not a hivemind-core replacement, there is no database, permissions
+or routing to other nodes
+"""
+import base64
+import hashlib
+import json
+import os
+import random
+import socketserver
+import struct
+import time
+from collections import Counter
+from contextlib import nullcontext
+from threading import Lock, Thread
+from typing import Callable, Dict, Optional, Tuple, Union
+from urllib.parse import urlparse, parse_qs
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+from poorman_handshake import HandShake, PasswordHandShake
+
+from hivemind_bus_client.delta import ContextDeltaCodec
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.serialization import get_bitstring, decode_bitstring, PROTOCOL_VERSION
+from hivemind_bus_client.util import encrypt_as_json, decrypt_from_json, encrypt_bin, decrypt_bin, \
+    _innermost_payload
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_OP_CONT, _OP_TEXT, _OP_BINARY, _OP_CLOSE, _OP_PING, _OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+_MYCROFT_TYPES = (HiveMessageType.BUS, HiveMessageType.SHARED_BUS)
+
+Response = Union[Message, HiveMessage, Callable]
+
+
+class _WebSocketHandler(socketserver.StreamRequestHandler):
+    """ minimal RFC 6455 server side, one instance per connection """
+    master: "MockHiveMaster" = None
+
+    def setup(self):
+        super().setup()
+        self._send_lock = Lock()
+        self.closed = False
+        # hivemind session state
+        self.crypto_key = None
+        self.useragent = None
+        self.binarize = False
+        self.proto_version = 1
+        self.payload_encoding = "json"
+        self.context_codec: Optional[ContextDeltaCodec] = None
+        self.handshake_start = None
+
+    # websocket layer
+    def _accept(self) -> bool:
+        request_line = self.rfile.readline().decode("latin-1").strip()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            k, _, v = line.partition(":")
+            headers[k.strip().lower()] = v.strip()
+        key = headers.get("sec-websocket-key")
+        if not request_line.startswith("GET") or not key:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+            return False
+        path = request_line.split(" ")[1]
+        auth = parse_qs(urlparse(path).query).get("authorization", [""])[0]
+        try:
+            self.useragent, _, access_key = base64.b64decode(auth).decode("utf-8").partition(":")
+        except ValueError:
+            self.useragent, access_key = None, None
+        if self.master.access_key and access_key != self.master.access_key:
+            self.wfile.write(b"HTTP/1.1 401 Unauthorized\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        self.wfile.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                          "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    def _read_exact(self, n: int) -> bytes:
+        data = self.rfile.read(n)
+        if len(data) < n:
+            raise ConnectionError("connection closed")
+        return data
+
+    def _read_frame(self) -> Tuple[int, bytes]:
+        """ returns (opcode, payload) of the next complete message """
+        chunks, opcode = [], None
+        while True:
+            b0, b1 = self._read_exact(2)
+            size = b1 & 0x7F
+            if size == 126:
+                size = struct.unpack(">H", self._read_exact(2))[0]
+            elif size == 127:
+                size = struct.unpack(">Q", self._read_exact(8))[0]
+            mask = self._read_exact(4) if b1 & 0x80 else None
+            data = self._read_exact(size)
+            if mask:
+                # xor as one big int, much faster than byte by byte
+                mask_int = int.from_bytes((mask * (size // 4 + 1))[:size], "big")
+                data = (int.from_bytes(data, "big") ^ mask_int).to_bytes(size, "big")
+            frame_op = b0 & 0x0F
+            if frame_op >= _OP_CLOSE:  # control frames may be interleaved
+                return frame_op, data
+            if frame_op != _OP_CONT:
+                opcode = frame_op
+            chunks.append(data)
+            if b0 & 0x80:
+                return opcode, b"".join(chunks)
+
+    def send_frame(self, data: Union[bytes, str], opcode: Optional[int] = None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            opcode = opcode or _OP_TEXT
+        opcode = opcode or _OP_BINARY
+        size = len(data)
+        if size < 126:
+            header = struct.pack(">BB", 0x80 | opcode, size)
+        elif size < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, size)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, size)
+        with self._send_lock:
+            if self.closed:
+                return
+            self.wfile.write(header + data)
+            self.wfile.flush()
+
+    def close(self):
+        try:
+            self.send_frame(struct.pack(">H", 1000), _OP_CLOSE)
+        except OSError:
+            pass
+        self.closed = True
+
+    def handle(self):
+        if not self._accept():
+            return
+        self.master._register(self)
+        try:
+            self.handshake_start = time.monotonic()
+            self.send_message(HiveMessage(HiveMessageType.HELLO, self.master.hello_payload()))
+            self.send_message(HiveMessage(HiveMessageType.HANDSHAKE, self.master.handshake_request()))
+            while not self.closed:
+                opcode, data = self._read_frame()
+                if opcode == _OP_CLOSE:
+                    self.close()
+                elif opcode == _OP_PING:
+                    self.send_frame(data, _OP_PONG)
+                elif opcode in (_OP_TEXT, _OP_BINARY):
+                    self.master._on_frame(self, data if opcode == _OP_BINARY else data.decode("utf-8"))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.closed = True
+            self.master._unregister(self)
+
+    # hivemind layer
+    def send_message(self, message: HiveMessage):
+        """ encode, encrypt and send, the same way a hivemind-core master does """
+        codec = self.context_codec if message.msg_type in _MYCROFT_TYPES else None
+        # encode + send must be atomic with context deltas, see ContextDeltaCodec
+        with codec.lock if codec else nullcontext():
+            if codec:
+                pload = dict(message._payload)
+                pload["context"] = codec.encode(pload.get("context") or {})
+                message = HiveMessage(message.msg_type, pload)
+            self.send_frame(self._encode(message))
+        self.master._count_sent(message)
+
+    def _encode(self, message: HiveMessage) -> Union[bytes, str]:
+        # BINARY payloads can only be sent binarized, same as the client
+        binarize = self.binarize or message.msg_type == HiveMessageType.BINARY
+        if binarize and self.crypto_key and \
+                message.msg_type not in (HiveMessageType.HELLO, HiveMessageType.HANDSHAKE):
+            payload = message._payload if message.msg_type in _MYCROFT_TYPES else message.payload
+            frame = get_bitstring(message.msg_type, payload, compressed=None,
+                                  proto_version=self.proto_version,
+                                  versioned=self.proto_version > 1,
+                                  payload_encoding=self.payload_encoding)
+            if not isinstance(frame, bytes):
+                frame = frame.bytes
+            return encrypt_bin(self.crypto_key, frame)
+        frame = message.serialize()
+        if self.crypto_key:
+            frame = encrypt_as_json(self.crypto_key, frame)
+        return frame
+
+    def decode(self, data: Union[bytes, str]) -> HiveMessage:
+        if isinstance(data, bytes):
+            message = decode_bitstring(decrypt_bin(self.crypto_key, data) if self.crypto_key else data)
+        else:
+            if self.crypto_key and "ciphertext" in data:
+                data = decrypt_from_json(self.crypto_key, data)
+            message = HiveMessage(**json.loads(data))
+        if self.context_codec is not None and message.msg_type in _MYCROFT_TYPES \
+                and isinstance(message._payload.get("context"), dict):
+            message._payload["context"] = self.context_codec.decode(message._payload["context"])
+        return message
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:  # windows
+    _UnixServer = None
+
+
+class MockHiveMaster:
+    """ stand-in HiveMind master
+
+    Arguments:
+        password: password for the password handshake, None to only accept pubkey handshakes
+        access_key: reject connections with a different access key, None accepts any
+        host/port: where to listen, port 0 picks a free port (see .port)
+        unix_socket: listen on this unix socket path instead of a tcp port
+        mode: "echo" sends every message back (SHARED_BUS as BUS), "sink" only counts them
+        responses: scripted answers, keyed by ovos message type (BUS payloads)
+            or HiveMessageType, values are a Message (sent as a reply to the
+            request), a HiveMessage, or a callable(HiveMessage) returning
+            either, a list of them or None
+        latency: seconds to wait before answering, or a (min, max) range
+        loss: probability of silently dropping a received message
+        binarize, proto_version, payload_encoding, context_delta:
+            what the master supports, the client may negotiate less
+        pubkey_handshake: generate a RSA key and announce it in HELLO, the
+            client will then verify the master identity in pubkey handshakes
+        seed: random seed for latency and loss
+    """
+
+    def __init__(self, password: Optional[str] = None, access_key: Optional[str] = None,
+                 host: str = "127.0.0.1", port: int = 0, unix_socket: Optional[str] = None,
+                 mode: str = "echo", responses: Optional[Dict[str, Response]] = None,
+                 latency: Union[float, Tuple[float, float]] = 0, loss: float = 0,
+                 binarize: bool = True, proto_version: int = PROTOCOL_VERSION,
+                 payload_encoding: str = "json", context_delta: bool = False,
+                 pubkey_handshake: bool = False, node_id: str = "mock-master",
+                 seed: Optional[int] = None):
+        if mode not in ("echo", "sink"):
+            raise ValueError(f"unknown mode: {mode}")
+        self.password = password
+        self.access_key = access_key
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.mode = mode
+        self.responses = responses or {}
+        self.latency = latency
+        self.loss = loss
+        self.binarize = binarize
+        self.proto_version = proto_version
+        self.payload_encoding = payload_encoding
+        self.context_delta = context_delta
+        self.node_id = node_id
+        self._rng = random.Random(seed)
+        self._pgp = HandShake() if pubkey_handshake else None
+        self._server = None
+        self._thread = None
+        self._lock = Lock()
+        self.connections = []
+        # stats
+        self.received = Counter()
+        self.sent = Counter()
+        self.dropped = 0
+        self.errors = 0
+        self.handshake_times = []
+
+    # server lifecycle
+    def start(self) -> "MockHiveMaster":
+        handler = type("_Handler", (_WebSocketHandler,), {"master": self})
+        if self.unix_socket:
+            if _UnixServer is None:
+                raise RuntimeError("unix sockets are not supported on this platform")
+            if os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
+            self._server = _UnixServer(self.unix_socket, handler)
+        else:
+            self._server = _TCPServer((self.host, self.port), handler)
+            self.port = self._server.server_address[1]
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        LOG.info(f"mock HiveMind master listening on {self.unix_socket or f'{self.host}:{self.port}'}")
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        for conn in list(self.connections):
+            conn.close()
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _register(self, conn: _WebSocketHandler):
+        with self._lock:
+            self.connections.append(conn)
+
+    def _unregister(self, conn: _WebSocketHandler):
+        with self._lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+
+    # protocol
+    def hello_payload(self) -> dict:
+        payload = {"node_id": self.node_id}
+        if self._pgp is not None:
+            payload["pubkey"] = self._pgp.pubkey
+        return payload
+
+    def handshake_request(self) -> dict:
+        return {"handshake": True,
+                "binarize": self.binarize,
+                "password": self.password is not None,
+                "crypto_key": False}
+
+    def _handle_handshake(self, conn: _WebSocketHandler, message: HiveMessage):
+        pload = message.payload
+        if "envelope" in pload:
+            if self.password is None:
+                raise ValueError("password handshake not enabled")
+            shake = PasswordHandShake(self.password)
+            envelope = shake.generate_handshake()
+            if not shake.receive_and_verify(pload["envelope"]):
+                raise ValueError("password handshake failed")
+        elif "pubkey" in pload:
+            shake = self._pgp or HandShake()
+            shake.load_public(pload["pubkey"])
+            envelope = shake.generate_handshake()
+        else:
+            raise ValueError("invalid handshake")
+
+        response = {"envelope": envelope}
+        conn.binarize = bool(self.binarize and pload.get("binarize"))
+        if conn.binarize:
+            conn.proto_version = max(1, min(self.proto_version,
+                                            int(pload.get("max_protocol_version") or 1)))
+            response["max_protocol_version"] = conn.proto_version
+            offered = pload.get("payload_encodings") or []
+            if conn.proto_version >= 2 and self.payload_encoding in offered:
+                conn.payload_encoding = self.payload_encoding
+                response["payload_encoding"] = self.payload_encoding
+        if self.context_delta and pload.get("context_delta"):
+            conn.context_codec = ContextDeltaCodec()
+            response["context_delta"] = True
+        conn.send_message(HiveMessage(HiveMessageType.HANDSHAKE, response))
+        # everything after the envelope is encrypted
+        conn.crypto_key = shake.secret
+        self.handshake_times.append(time.monotonic() - conn.handshake_start)
+
+    def _on_frame(self, conn: _WebSocketHandler, data: Union[bytes, str]):
+        try:
+            message = conn.decode(data)
+        except Exception as e:
+            self.errors += 1
+            LOG.error(f"mock master failed to decode message: {e}")
+            return
+        with self._lock:
+            self.received[getattr(message.msg_type, "value", message.msg_type)] += 1
+
+        if message.msg_type == HiveMessageType.HANDSHAKE:
+            try:
+                self._handle_handshake(conn, message)
+            except Exception as e:
+                self.errors += 1
+                LOG.error(f"mock master handshake failed: {e}")
+                conn.close()
+            return
+
+        if self.loss and self._rng.random() < self.loss:
+            with self._lock:
+                self.dropped += 1
+            return
+        received_at = time.time()
+        if self.latency:
+            delay = self.latency
+            if isinstance(delay, (tuple, list)):
+                delay = self._rng.uniform(*delay)
+            time.sleep(delay)
+
+        for response in self._responses_for(message, received_at):
+            conn.send_message(response)
+
+    def _responses_for(self, message: HiveMessage, received_at: float) -> list:
+        if message.msg_type == HiveMessageType.PING and not message.payload.get("pong"):
+            return [HiveMessage(HiveMessageType.PING,
+                                dict(message.payload, pong=True, t1=received_at, t2=time.time()))]
+
+        # scripts are looked up by the ovos type of the (innermost) mycroft payload first
+        request = _innermost_payload(message)
+        if not (isinstance(request, dict) and isinstance(request.get("type"), str)):
+            request = None
+        script = self.responses.get(request["type"]) if request else None
+        if script is None:
+            script = self.responses.get(message.msg_type)
+        if script is None:
+            if self.mode != "echo":
+                return []
+            if message.msg_type == HiveMessageType.SHARED_BUS:
+                # masters never send SHARED_BUS, clients would reject it
+                message = HiveMessage(HiveMessageType.BUS, message._payload)
+            return [message]
+
+        if callable(script):
+            script = script(message)
+        if script is None:
+            return []
+        if not isinstance(script, (list, tuple)):
+            script = [script]
+        responses = []
+        for response in script:
+            if isinstance(response, Message):
+                if request is not None:
+                    # reply keeps the request context, including the correlation id
+                    request_msg = Message(request["type"], request.get("data"), request.get("context"))
+                    response = request_msg.reply(response.msg_type, response.data, response.context)
+                response = HiveMessage(HiveMessageType.BUS, response)
+            responses.append(response)
+        return responses
+
+    def _count_sent(self, message: HiveMessage):
+        with self._lock:
+            self.sent[getattr(message.msg_type, "value", message.msg_type)] += 1
+
+    # api
+    def send(self, message: Union[Message, HiveMessage]):
+        """ send a message to every connected (and handshaked) client """
+        if isinstance(message, Message):
+            message = HiveMessage(HiveMessageType.BUS, message)
+        for conn in list(self.connections):
+            if conn.crypto_key:
+                conn.send_message(message)
+
+    def get_stats(self) -> dict:
+        times = sorted(self.handshake_times)
+        return {"connections": len(self.connections),
+                "received": dict(self.received),
+                "sent": dict(self.sent),
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "handshakes": len(times),
+                "handshake_p50": times[len(times) // 2] if times else None,
+                "handshake_max": times[-1] if times else None}
@@ -0,0 +1,319 @@
+"""one logical connection to several HiveMind masters, with failover
+
+every master gets its own HiveMessageBusClient, all of them connect and
+handshake up front and stay connected as warm standbys, so failing over
+is picking another connection that is already up, not a reconnect
+
+a link is considered down as soon as its websocket closes, or after
+`max_missed` pings in a row went unanswered (half open connections
+behind flaky networks never close on their own)
+
+    mm = HiveMultiMasterClient(["ws://core-a:5678", "ws://core-b:5678?weight=2"],
+                               key=key, password=password, strategy="latency")
+    mm.connect()
+    mm.emit_mycroft(Message("speak", {"utterance": "hello"}))
+
+strategies
+    priority  the first healthy master in list order, fails back when it recovers
+    weighted  a random healthy master per message, proportional to its weight
+    latency   the healthy master with the lowest smoothed ping rtt
+"""
+import random
+import time
+from dataclasses import dataclass
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional, Union
+from urllib.parse import urlparse, parse_qs
+
+from ovos_bus_client import Message as MycroftMessage
+from ovos_utils.log import LOG
+from ovos_utils.messagebus import FakeBus
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.dedup import SeenMessagesCache
+from hivemind_bus_client.exceptions import HiveMindConnectionError
+from hivemind_bus_client.identity import NodeIdentity
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+STRATEGIES = ("priority", "weighted", "latency")
+
+
+@dataclass
+class MasterSpec:
+    host: str
+    port: int = 5678
+    weight: float = 1.0
+
+    @staticmethod
+    def parse(url: str) -> "MasterSpec":
+        """ "ws://host:port?weight=2", scheme, port and weight are optional """
+        if "://" not in url:
+            url = "ws://" + url
+        parsed = urlparse(url)
+        weight = parse_qs(parsed.query).get("weight", ["1"])[0]
+        return MasterSpec(host=f"{parsed.scheme}://{parsed.hostname}",
+                          port=parsed.port or 5678, weight=float(weight))
+
+    @property
+    def url(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class _MasterLink(Thread):
+    """ connects one master and keeps probing it, decides if it is healthy """
+
+    def __init__(self, mm: "HiveMultiMasterClient", spec: MasterSpec, client: HiveMessageBusClient):
+        super().__init__(daemon=True)
+        self.mm = mm
+        self.spec = spec
+        self.client = client
+        self.healthy = False
+        self.missed = 0
+        self._stop_event = Event()
+        client.emitter.on("close", self._handle_close)
+
+    @property
+    def srtt(self) -> Optional[float]:
+        return self.client.ping_stats.srtt
+
+    def _handle_close(self, *args):
+        self._set_healthy(False, "connection closed")
+
+    def _set_healthy(self, healthy: bool, reason: str = ""):
+        if healthy != self.healthy:
+            self.healthy = healthy
+            LOG.info(f"master {self.spec.url} is {'up' if healthy else 'down'} {reason}".strip())
+            self.mm._link_changed(self)
+
+    def run(self):
+        from hivemind_bus_client.protocol import HiveMindSlaveProtocol
+
+        mm, client = self.mm, self.client
+        client.identity.site_id = mm.site_id or client.identity.site_id
+        # every link is bound to the same local bus, upstream requests are
+        # routed once by HiveMultiMasterClient.handle_send instead
+        client.protocol = HiveMindSlaveProtocol(client, shared_bus=False,
+                                                site_id=client.identity.site_id or "unknown",
+                                                identity=client.identity, handle_upstream=False)
+        try:
+            client.protocol.bind(mm.bus)
+            # not client.connect(), it blocks until a handshake succeeds,
+            # forever for a master that is down
+            client.run_in_thread()
+        except Exception as e:
+            LOG.error(f"failed to connect to master {self.spec.url}: {e}")
+            return
+        waiting_since = None
+        while not self._stop_event.is_set():
+            if not client.handshake_event.is_set():
+                self._set_healthy(False, "handshake lost")
+                self.missed = 0
+                # the client reconnects on its own, the handshake is restarted
+                # if the master does not finish it in time, like connect() does
+                if not client.connected_event.is_set():
+                    waiting_since = None
+                elif waiting_since is None:
+                    waiting_since = time.monotonic()
+                elif time.monotonic() - waiting_since > mm.handshake_timeout:
+                    waiting_since = None
+                    client.protocol.start_handshake()
+                client.handshake_event.wait(mm.ping_interval)
+                continue
+            waiting_since = None
+            if client.ping(timeout=mm.ping_timeout) is None:
+                self.missed += 1
+                if self.missed >= mm.max_missed:
+                    self._set_healthy(False, f"{self.missed} pings lost")
+                elif self.healthy:
+                    continue  # confirm right away, a dead master is detected in about max_missed * ping_timeout
+            else:
+                self.missed = 0
+                self._set_healthy(True)
+            self._stop_event.wait(mm.ping_interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.client.close()
+
+
+class HiveMultiMasterClient:
+    """ HiveMind client connected to several masters, messages go to one of them
+
+    Arguments:
+        masters: MasterSpec objects or urls ("ws://host:port?weight=2"),
+                 in priority order, defaults to NodeIdentity.masters
+        key/password/identity: credentials, the same for every master
+        strategy: "priority", "weighted" or "latency", see module docstring
+        ping_interval: seconds between health / rtt probes of each master
+        ping_timeout: seconds before a probe counts as lost, raise it for
+                      masters with a high rtt
+        max_missed: lost probes in a row before a master is considered down
+        failover_timeout: seconds emit waits for any master to be up before raising
+        handshake_timeout: seconds a connected master may take to handshake
+                           before the handshake is started again
+        reconnect_delay: first reconnect backoff of each link (ovos default is 5s)
+        share_bus: share the local bus with the active master only
+        on_failover: called with (old MasterSpec or None, new MasterSpec or None)
+        **client_kwargs: passed to every HiveMessageBusClient
+    """
+
+    def __init__(self, masters: Optional[List[Union[str, MasterSpec]]] = None,
+                 key: Optional[str] = None, password: Optional[str] = None,
+                 identity: Optional[NodeIdentity] = None, strategy: str = "priority",
+                 ping_interval: float = 0.5, ping_timeout: float = 0.3, max_missed: int = 2,
+                 failover_timeout: float = 5, handshake_timeout: float = 5,
+                 reconnect_delay: float = 1,
+                 share_bus: bool = False, on_failover: Optional[Callable] = None,
+                 **client_kwargs):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown strategy '{strategy}', valid: {STRATEGIES}")
+        self.identity = identity or NodeIdentity()
+        masters = masters or self.identity.masters
+        if not masters:
+            raise ValueError("no masters given and none set in the identity file")
+        self.masters = [m if isinstance(m, MasterSpec) else MasterSpec.parse(m) for m in masters]
+        self.strategy = strategy
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.max_missed = max_missed
+        self.failover_timeout = failover_timeout
+        self.handshake_timeout = handshake_timeout
+        self.share_bus = share_bus
+        self.on_failover = on_failover
+        self.bus = None
+        self.site_id = None
+        self._lock = Lock()
+        self._any_up = Event()
+        self._active: Optional[_MasterLink] = None
+        self.failovers = 0
+        # PROPAGATE / BROADCAST with a msg_id reaching us through several masters
+        # is only handled once, pass seen_cache=SeenMessagesCache(hash_payloads=True)
+        # to also catch messages without one
+        client_kwargs.setdefault("seen_cache", SeenMessagesCache())
+        self.links: List[_MasterLink] = []
+        for spec in self.masters:
+            client = HiveMessageBusClient(key, password=password, host=spec.host, port=spec.port,
+                                          identity=self.identity, share_bus=False, **client_kwargs)
+            client.retry = client.RECONNECT_INITIAL_S = reconnect_delay
+            self.links.append(_MasterLink(self, spec, client))
+
+    # connection
+    def connect(self, bus=FakeBus(), site_id=None, timeout: Optional[float] = None):
+        """ connect every master in the background, returns once one of them
+        is up (or after timeout, default failover_timeout) """
+        self.bus = bus
+        self.site_id = site_id
+        bus.on("hive.send.upstream", self.handle_send)
+        for link in self.links:
+            link.start()
+        if not self._any_up.wait(self.failover_timeout if timeout is None else timeout):
+            LOG.warning("no HiveMind master is reachable yet")
+
+    def close(self):
+        if self.bus is not None:
+            self.bus.remove("hive.send.upstream", self.handle_send)
+        for link in self.links:
+            link.stop()
+
+    def _link_changed(self, link: _MasterLink):
+        with self._lock:
+            healthy = [l for l in self.links if l.healthy]
+            if healthy:
+                self._any_up.set()
+            else:
+                self._any_up.clear()
+            # the active master only changes when it goes down or a better
+            # ranked one (priority strategy) comes back
+            old = self._active
+            new = self._rank(healthy)[0] if healthy else None
+            if self.strategy != "priority" and old is not None and old.healthy:
+                new = old
+            if new is old:
+                return
+            self._active = new
+            for l in self.links:
+                l.client.share_bus = self.share_bus and l is new
+            if old is not None:
+                self.failovers += 1
+        LOG.info(f"active HiveMind master: {new.spec.url if new else None}")
+        if self.on_failover is not None:
+            try:
+                self.on_failover(old.spec if old else None, new.spec if new else None)
+            except Exception as e:
+                LOG.error(f"failover callback failed: {e}")
+
+    def _rank(self, links: List[_MasterLink]) -> List[_MasterLink]:
+        if self.strategy == "latency":
+            # masters without rtt samples yet go last, in list order
+            return sorted(links, key=lambda l: (l.srtt is None, l.srtt or 0))
+        return links  # list order is priority order
+
+    @property
+    def active(self) -> Optional[MasterSpec]:
+        """ the master the local bus is shared with and priority traffic goes to """
+        link = self._active
+        return link.spec if link is not None else None
+
+    def select(self) -> HiveMessageBusClient:
+        """ the client the next message should go to, raises if every master is down """
+        deadline = time.monotonic() + self.failover_timeout
+        while True:
+            healthy = [l for l in self.links if l.healthy and l.client.handshake_event.is_set()]
+            if healthy:
+                if self.strategy == "weighted":
+                    return random.choices(healthy, [l.spec.weight for l in healthy])[0].client
+                return self._rank(healthy)[0].client
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HiveMindConnectionError("no HiveMind master is reachable")
+            self._any_up.wait(min(remaining, 0.05))
+
+    # messages
+    def emit(self, message: Union[MycroftMessage, HiveMessage]):
+        self.select().emit(message)
+
+    def emit_mycroft(self, message: MycroftMessage):
+        self.emit(HiveMessage(HiveMessageType.BUS, payload=message))
+
+    def handle_send(self, message: MycroftMessage):
+        """ the local bus wants to send a HiveMessage upstream, see HiveMindSlaveInternalProtocol """
+        msg_type = message.data["msg_type"]
+        if msg_type == HiveMessageType.BROADCAST:
+            return  # only masters can broadcast
+        try:
+            self.emit(HiveMessage(msg_type, payload=message.data.get("payload")))
+        except HiveMindConnectionError as e:
+            LOG.error(f"dropped upstream {msg_type}: {e}")
+
+    def on(self, event_name, func):
+        """ messages can arrive from any master, handlers are registered on all of them """
+        for link in self.links:
+            link.client.on(event_name, func)
+
+    def on_mycroft(self, mycroft_msg_type, func):
+        for link in self.links:
+            link.client.on_mycroft(mycroft_msg_type, func)
+
+    def remove(self, event_name, func):
+        for link in self.links:
+            link.client.remove(event_name, func)
+
+    # request / response, answers come back through the master that got the request
+    def wait_for_response(self, message, reply_type=None, timeout=3.0):
+        return self.select().wait_for_response(message, reply_type=reply_type, timeout=timeout)
+
+    def query(self, message, timeout: float = 3.0, **kwargs):
+        return self.select().query(message, timeout=timeout, **kwargs)
+
+    def cascade(self, message, timeout: float = 3.0, **kwargs):
+        return self.select().cascade(message, timeout=timeout, **kwargs)
+
+    def get_stats(self) -> dict:
+        return {"active": self.active.url if self.active else None,
+                "strategy": self.strategy,
+                "failovers": self.failovers,
+                "masters": {link.spec.url: {"healthy": link.healthy,
+                                            "weight": link.spec.weight,
+                                            "srtt": link.srtt,
+                                            "ping": link.client.get_ping_stats()}
+                            for link in self.links}}
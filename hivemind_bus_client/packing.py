@@ -0,0 +1,190 @@
+"""compact binary encoding for message payloads
+
+a pure python implementation of the MessagePack subset needed for
+json-like values plus raw bytes: nil, bool, int, float, str, bin, array, map
+
+if the msgpack package is installed it is used instead, both produce
+the same wire format so the two ends of a connection may use either
+"""
+import struct
+
+try:
+    import msgpack as _msgpack
+except ImportError:  # pure python fallback
+    _msgpack = None
+
+_pack_f64 = struct.Struct(">d").pack
+_unpack_f64 = struct.Struct(">d").unpack_from
+
+
+class PackingError(ValueError):
+    """ value can not be packed / data can not be unpacked """
+
+
+def _pack_int(buf: bytearray, value: int):
+    if 0 <= value <= 0x7F:
+        buf.append(value)
+    elif -32 <= value < 0:
+        buf.append(value & 0xFF)
+    elif value >= 0:
+        if value <= 0xFF:
+            buf += b"\xcc" + value.to_bytes(1, "big")
+        elif value <= 0xFFFF:
+            buf += b"\xcd" + value.to_bytes(2, "big")
+        elif value <= 0xFFFFFFFF:
+            buf += b"\xce" + value.to_bytes(4, "big")
+        elif value <= 0xFFFFFFFFFFFFFFFF:
+            buf += b"\xcf" + value.to_bytes(8, "big")
+        else:
+            raise PackingError("int too big")
+    else:
+        if value >= -0x80:
+            buf += b"\xd0" + value.to_bytes(1, "big", signed=True)
+        elif value >= -0x8000:
+            buf += b"\xd1" + value.to_bytes(2, "big", signed=True)
+        elif value >= -0x80000000:
+            buf += b"\xd2" + value.to_bytes(4, "big", signed=True)
+        elif value >= -0x8000000000000000:
+            buf += b"\xd3" + value.to_bytes(8, "big", signed=True)
+        else:
+            raise PackingError("int too small")
+
+
+def _pack_len(buf: bytearray, size: int, fix_mask: int, fix_max: int, codes: bytes):
+    """ codes are the 8/16/32 bit length type bytes, fix_mask 0 if no fix variant """
+    if fix_mask and size <= fix_max:
+        buf.append(fix_mask | size)
+    elif codes[0] and size <= 0xFF:
+        buf.append(codes[0])
+        buf.append(size)
+    elif size <= 0xFFFF:
+        buf.append(codes[1])
+        buf += size.to_bytes(2, "big")
+    elif size <= 0xFFFFFFFF:
+        buf.append(codes[2])
+        buf += size.to_bytes(4, "big")
+    else:
+        raise PackingError("value too long")
+
+
+def _pack(buf: bytearray, value):
+    if value is None:
+        buf.append(0xC0)
+    elif value is True:
+        buf.append(0xC3)
+    elif value is False:
+        buf.append(0xC2)
+    elif isinstance(value, int):
+        _pack_int(buf, value)
+    elif isinstance(value, float):
+        buf.append(0xCB)
+        buf += _pack_f64(value)
+    elif isinstance(value, str):
+        raw = value.encode("utf-8")
+        _pack_len(buf, len(raw), 0xA0, 31, b"\xd9\xda\xdb")
+        buf += raw
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _pack_len(buf, len(value), 0, 0, b"\xc4\xc5\xc6")
+        buf += value
+    elif isinstance(value, (list, tuple)):
+        _pack_len(buf, len(value), 0x90, 15, b"\x00\xdc\xdd")
+        for v in value:
+            _pack(buf, v)
+    elif isinstance(value, dict):
+        _pack_len(buf, len(value), 0x80, 15, b"\x00\xde\xdf")
+        for k, v in value.items():
+            _pack(buf, k)
+            _pack(buf, v)
+    else:
+        raise PackingError(f"can not pack {type(value)}")
+
+
+def _unpack(data: bytes, pos: int):
+    code = data[pos]
+    pos += 1
+    if code <= 0x7F:
+        return code, pos
+    if code >= 0xE0:
+        return code - 0x100, pos
+    if 0xA0 <= code <= 0xBF:
+        end = pos + (code & 0x1F)
+        return data[pos:end].decode("utf-8"), end
+    if 0x90 <= code <= 0x9F:
+        return _unpack_array(data, pos, code & 0x0F)
+    if 0x80 <= code <= 0x8F:
+        return _unpack_map(data, pos, code & 0x0F)
+    if code == 0xC0:
+        return None, pos
+    if code == 0xC2:
+        return False, pos
+    if code == 0xC3:
+        return True, pos
+    if code == 0xCB:
+        return _unpack_f64(data, pos)[0], pos + 8
+    if code == 0xCA:
+        return struct.unpack_from(">f", data, pos)[0], pos + 4
+    if 0xCC <= code <= 0xCF:  # uint 8-64
+        size = 1 << (code - 0xCC)
+        return int.from_bytes(data[pos:pos + size], "big"), pos + size
+    if 0xD0 <= code <= 0xD3:  # int 8-64
+        size = 1 << (code - 0xD0)
+        return int.from_bytes(data[pos:pos + size], "big", signed=True), pos + size
+    if code in (0xD9, 0xDA, 0xDB, 0xC4, 0xC5, 0xC6):  # str / bin 8-32
+        size_len = 1 << ((code - 0xD9) if code >= 0xD9 else (code - 0xC4))
+        size = int.from_bytes(data[pos:pos + size_len], "big")
+        pos += size_len
+        raw = data[pos:pos + size]
+        if code >= 0xD9:
+            return raw.decode("utf-8"), pos + size
+        return bytes(raw), pos + size
+    if code in (0xDC, 0xDD, 0xDE, 0xDF):  # array / map 16-32
+        size_len = 2 if code in (0xDC, 0xDE) else 4
+        size = int.from_bytes(data[pos:pos + size_len], "big")
+        if code in (0xDC, 0xDD):
+            return _unpack_array(data, pos + size_len, size)
+        return _unpack_map(data, pos + size_len, size)
+    raise PackingError(f"unsupported type code {hex(code)}")
+
+
+def _unpack_array(data: bytes, pos: int, size: int):
+    arr = []
+    for _ in range(size):
+        v, pos = _unpack(data, pos)
+        arr.append(v)
+    return arr, pos
+
+
+def _unpack_map(data: bytes, pos: int, size: int):
+    obj = {}
+    for _ in range(size):
+        k, pos = _unpack(data, pos)
+        v, pos = _unpack(data, pos)
+        obj[k] = v
+    return obj, pos
+
+
+def pack(value) -> bytes:
+    if _msgpack is not None:
+        try:
+            return _msgpack.packb(value, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise PackingError(str(e)) from e
+    buf = bytearray()
+    _pack(buf, value)
+    return bytes(buf)
+
+
+def unpack(data: bytes):
+    if _msgpack is not None:
+        # same errors whichever backend is used
+        try:
+            return _msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except (TypeError, ValueError, _msgpack.UnpackException) as e:
+            raise PackingError(str(e) or "truncated or corrupted data") from e
+    try:
+        value, pos = _unpack(bytes(data), 0)
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise PackingError("truncated or corrupted data") from e
+    if pos != len(data):
+        raise PackingError("trailing data after packed value")
+    return value
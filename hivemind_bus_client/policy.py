@@ -0,0 +1,210 @@
+import json
+import random
+import re
+from fnmatch import translate
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, Optional, Union
+
+from ovos_bus_client.message import Message
+
+_GLOB_CHARS = ("*", "?", "[")
+
+
+class MessageTypeMatcher:
+    """ compiled index of message type patterns
+
+    patterns can be:
+        - exact message types, eg. "speak"
+        - prefixes, eg. "mycroft.audio.*"
+        - arbitrary globs, eg. "gui.*.value.*"
+
+    exact types are checked with a set lookup, prefixes with a single
+    str.startswith call and everything else with one combined regex,
+    results are cached per message type since the set of types seen on a
+    bus is small
+    """
+    _CACHE_SIZE = 2048
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.patterns = tuple(dict.fromkeys(patterns))  # dedup, keep order
+        self._exact = {}
+        prefixes = []
+        globs = []
+        for pattern in self.patterns:
+            if not any(c in pattern for c in _GLOB_CHARS):
+                self._exact[pattern] = pattern
+            elif pattern.find("*") == len(pattern) - 1 and \
+                    "?" not in pattern and "[" not in pattern:
+                prefixes.append(pattern)
+            else:
+                globs.append(pattern)
+        self._prefixes = tuple(p[:-1] for p in prefixes)
+        self._prefix_patterns = tuple(prefixes)
+        self._globs = tuple(globs)
+        self._regex = re.compile("|".join(f"(?P<g{i}>{translate(g)})"
+                                          for i, g in enumerate(globs))) \
+            if globs else None
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def match(self, msg_type: str) -> Optional[str]:
+        """ return the pattern matching msg_type, or None
+
+        exact matches take priority over prefixes, prefixes over globs"""
+        try:
+            return self._cache[msg_type]
+        except KeyError:
+            pass
+        pattern = self._exact.get(msg_type)
+        if pattern is None and self._prefixes and msg_type.startswith(self._prefixes):
+            # longest prefix wins
+            pattern = max((p for p, s in zip(self._prefix_patterns, self._prefixes)
+                           if msg_type.startswith(s)), key=len)
+        if pattern is None and self._regex is not None:
+            m = self._regex.match(msg_type)
+            if m:
+                pattern = self._globs[int(m.lastgroup[1:])]
+        if len(self._cache) >= self._CACHE_SIZE:
+            self._cache.clear()
+        self._cache[msg_type] = pattern
+        return pattern
+
+    def __contains__(self, msg_type: str) -> bool:
+        return self.match(msg_type) is not None
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "tokens", "stamp")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = max(rate, 1.0)
+        self.stamp = monotonic()
+
+    def consume(self) -> bool:
+        now = monotonic()
+        self.tokens = min(max(self.rate, 1.0),
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class BusSharingPolicy:
+    """ decides which local ovos bus messages are shared with the master
+
+    used by HiveMindSlaveInternalProtocol when share_bus is enabled,
+    every setting can be changed at runtime, no reconnection needed
+
+    Arguments:
+        allow: message type patterns to share, if empty everything is allowed
+        deny: message type patterns never shared, takes priority over allow
+        rate_limits: {pattern: max messages per second}, applied per message type
+        sampling: {pattern: fraction of messages to share, 0.0 - 1.0}
+        max_data_size: drop message.data fields whose json size exceeds this many bytes
+    """
+
+    def __init__(self, allow: Iterable[str] = (), deny: Iterable[str] = (),
+                 rate_limits: Optional[Dict[str, float]] = None,
+                 sampling: Optional[Dict[str, float]] = None,
+                 max_data_size: Optional[int] = None):
+        self._lock = Lock()
+        self._allow = MessageTypeMatcher(allow)
+        self._deny = MessageTypeMatcher(deny)
+        self._rate_limits = dict(rate_limits or {})
+        self._rate_matcher = MessageTypeMatcher(self._rate_limits)
+        self._sampling = dict(sampling or {})
+        self._sampling_matcher = MessageTypeMatcher(self._sampling)
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.max_data_size = max_data_size
+        self.dropped = 0
+
+    # runtime configuration
+    # matchers are rebuilt and swapped in, readers never see a partial index
+    def allow(self, *patterns: str):
+        with self._lock:
+            self._allow = MessageTypeMatcher(self._allow.patterns + patterns)
+
+    def deny(self, *patterns: str):
+        with self._lock:
+            self._deny = MessageTypeMatcher(self._deny.patterns + patterns)
+
+    def remove_pattern(self, pattern: str):
+        with self._lock:
+            self._allow = MessageTypeMatcher(p for p in self._allow.patterns if p != pattern)
+            self._deny = MessageTypeMatcher(p for p in self._deny.patterns if p != pattern)
+
+    def set_rate_limit(self, pattern: str, max_per_second: Optional[float]):
+        """ set to None to remove the rate limit """
+        with self._lock:
+            if max_per_second is None:
+                self._rate_limits.pop(pattern, None)
+            else:
+                self._rate_limits[pattern] = max_per_second
+            self._rate_matcher = MessageTypeMatcher(self._rate_limits)
+            self._buckets = {}
+
+    def set_sampling(self, pattern: str, rate: Optional[float]):
+        """ set to None to remove sampling """
+        with self._lock:
+            if rate is None:
+                self._sampling.pop(pattern, None)
+            else:
+                self._sampling[pattern] = rate
+            self._sampling_matcher = MessageTypeMatcher(self._sampling)
+
+    # filtering
+    def allows_type(self, msg_type: str) -> bool:
+        """ static allow/deny check, does not consume rate limit tokens """
+        if self._deny and msg_type in self._deny:
+            return False
+        if self._allow and msg_type not in self._allow:
+            return False
+        return True
+
+    def _within_limits(self, msg_type: str) -> bool:
+        if self._sampling:
+            pattern = self._sampling_matcher.match(msg_type)
+            if pattern is not None and random.random() >= self._sampling.get(pattern, 1.0):
+                return False
+        if self._rate_limits:
+            pattern = self._rate_matcher.match(msg_type)
+            if pattern is not None:
+                # filter runs on whichever thread emits, buckets are shared
+                with self._lock:
+                    rate = self._rate_limits.get(pattern)
+                    if rate is None:
+                        return True  # removed meanwhile
+                    bucket = self._buckets.get(msg_type)
+                    if bucket is None:
+                        bucket = self._buckets[msg_type] = _TokenBucket(rate)
+                    if not bucket.consume():
+                        return False
+        return True
+
+    def filter(self, message: Union[Message, dict]) -> Union[Message, dict, None]:
+        """ return the message to be shared, or None if it should be dropped
+
+        accepts a Message or its serialized dict form, the same type is returned,
+        oversized data fields are removed from the returned message"""
+        if isinstance(message, dict):
+            msg_type, data = message["type"], message.get("data")
+        else:
+            msg_type, data = message.msg_type, message.data
+        if not self.allows_type(msg_type) or not self._within_limits(msg_type):
+            with self._lock:
+                self.dropped += 1
+            return None
+        if self.max_data_size is not None and data:
+            small = {k: v for k, v in data.items()
+                     if len(json.dumps(v)) <= self.max_data_size}
+            if len(small) != len(data):
+                if isinstance(message, dict):
+                    return dict(message, data=small)
+                return Message(msg_type, small, message.context)
+        return message
@@ -1,26 +1,49 @@
+import json
+import time
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 from ovos_bus_client import Message as MycroftMessage
 from ovos_bus_client import MessageBusClient
 from ovos_bus_client.message import Message
 from ovos_utils.log import LOG
-from hivemind_bus_client.identity import NodeIdentity
+from hivemind_bus_client.identity import NodeIdentity, get_handshake
 from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.delta import ContextDeltaCodec
+from hivemind_bus_client.log import Payload, get_logger
 from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.serialization import PROTOCOL_VERSION, PAYLOAD_ENCODINGS
+from hivemind_bus_client.util import peek_msg_type
 from poorman_handshake import HandShake, PasswordHandShake
 
+log = get_logger("protocol")  # per message lines
+
+
+@lru_cache(maxsize=32)
+def _json_escaped(text: str) -> str:
+    return json.dumps(text)[1:-1]
+
 
 @dataclass()
 class HiveMindSlaveInternalProtocol:
     """ this class handles all interactions between a hivemind listener and a ovos-core messagebus"""
     hm_bus: HiveMessageBusClient
-    share_bus: bool = False
+    share_bus: Optional[bool] = None  # None -> follow hm_bus.share_bus
     bus: Optional[MessageBusClient] = None
     node_id: str = ""  # this is how ovos-core bus refers to this slave's master
+    # False if something else routes "hive.send.upstream", eg. HiveMultiMasterClient
+    handle_upstream: bool = True
+
+    @property
+    def sharing_enabled(self) -> bool:
+        if self.share_bus is None:
+            return self.hm_bus.share_bus
+        return self.share_bus
 
     def register_bus_handlers(self):
-        self.bus.on("hive.send.upstream", self.handle_send)
+        if self.handle_upstream:
+            self.bus.on("hive.send.upstream", self.handle_send)
         self.bus.on("message", self.handle_outgoing_mycroft)  # catch all
 
     # mycroft handlers  - from slave -> master
@@ -46,28 +69,53 @@ class HiveMindSlaveInternalProtocol:
         else:
             self.hm_bus.emit(hmessage)
 
+    def is_relevant(self, raw: str) -> bool:
+        """ fast pre-filter for the "message" firehose
+
+        decides if a serialized bus message needs to be forwarded upstream
+        without deserializing it, false positives are fine since
+        handle_outgoing_mycroft checks again after parsing"""
+        if self.sharing_enabled:
+            msg_type = peek_msg_type(raw)
+            if msg_type is None or self.hm_bus.share_policy.allows_type(msg_type):
+                return True
+        if not self.node_id:
+            return False  # no master to address messages to yet
+        # depending on the json backend non-ascii chars may be escaped or not
+        return self.node_id in raw or _json_escaped(self.node_id) in raw
+
     def handle_outgoing_mycroft(self, message: Message):
         """ forward internal messages to masters"""
         if isinstance(message, str):
             # "message" is a special case in ovos-bus-client that is not deserialized
-            message = Message.deserialize(message)
+            if not self.is_relevant(message):
+                return
+            # NOTE: the parsed dict is forwarded as is, no Message objects
+            # are created, it will only be serialized again by hm_bus.emit
+            message = json.loads(message)
+        elif isinstance(message, Message):
+            message = {"type": message.msg_type,
+                       "data": message.data,
+                       "context": message.context}
 
         # this allows the master node to do passive monitoring of bus events
-        if self.share_bus:
-            msg = HiveMessage(HiveMessageType.SHARED_BUS,
-                              payload=message.serialize())
-            self.hm_bus.emit(msg)
+        if self.sharing_enabled:
+            shared = self.hm_bus.share_policy.filter(message)
+            if shared is not None:
+                msg = HiveMessage(HiveMessageType.SHARED_BUS,
+                                  payload=shared)
+                self.hm_bus.emit(msg)
 
         # this message is targeted at master
         # eg, a response to some bus event injected by master
         # note: master might completely ignore it
-        peers = message.context.get("destination")
+        peers = (message.get("context") or {}).get("destination")
         if peers:
             if not isinstance(peers, list):
                 peers = [peers]
             if self.node_id in peers:
                 msg = HiveMessage(HiveMessageType.BUS,
-                                  payload=message.serialize())
+                                  payload=message)
                 self.hm_bus.emit(msg)
 
 
@@ -85,12 +133,17 @@ class HiveMindSlaveProtocol:
     mpubkey: str = ""  # asc public PGP key from master
     shared_bus: bool = False
     binarize: bool = False
+    proto_version: int = 1  # binarization protocol version, negotiated in handshake
+    payload_encoding: str = "json"  # v2 payload value encoding, negotiated in handshake
+    context_delta: bool = True  # offer context delta encoding for BUS messages in handshake
     site_id: str = "unknown"
+    handle_upstream: bool = True  # see HiveMindSlaveInternalProtocol
 
     def bind(self, bus: Optional[MessageBusClient] = None):
         if self.identity is None:
             self.identity = NodeIdentity()
-        self.handshake = HandShake(self.identity.private_key)
+        # parsed once per process and shared with other clients using the same key
+        self.handshake = get_handshake(self.identity.private_key)
         self.pswd_handshake = PasswordHandShake(self.identity.password) if self.identity.password else None
 
         if bus is None:
@@ -98,7 +151,8 @@ class HiveMindSlaveProtocol:
             bus.run_in_thread()
             bus.connected_event.wait()
         LOG.info("Initializing HiveMindSlaveInternalProtocol")
-        self.internal_protocol = HiveMindSlaveInternalProtocol(bus=bus, hm_bus=self.hm)
+        self.internal_protocol = HiveMindSlaveInternalProtocol(bus=bus, hm_bus=self.hm,
+                                                               handle_upstream=self.handle_upstream)
         self.internal_protocol.register_bus_handlers()
         LOG.info("registering protocol handlers")
         self.hm.on(HiveMessageType.HELLO, self.handle_hello)
@@ -108,6 +162,7 @@ class HiveMindSlaveProtocol:
         self.hm.on(HiveMessageType.SHARED_BUS, self.handle_illegal_msg)
         self.hm.on(HiveMessageType.BUS, self.handle_bus)
         self.hm.on(HiveMessageType.HANDSHAKE, self.handle_handshake)
+        self.hm.on(HiveMessageType.PING, self.handle_ping)
 
     @property
     def node_id(self):
@@ -120,13 +175,13 @@ class HiveMindSlaveProtocol:
         # this should not happen,
         # only sent from client -> server NOT server -> client
         # TODO log, kill connection (?)
-        LOG.warning(f"illegal message {message}")
+        log.warning("illegal message %s", Payload(message))
 
     def handle_hello(self, message: HiveMessage):
         # this check is because other nodes in the hive
         # may also send HELLO with their pubkey
         # only want this on the first connection
-        LOG.info(f"HELLO: {message.payload}")
+        log.info("HELLO: %s", Payload(message.payload))
         if not self.node_id:
             self.mpubkey = message.payload.get("pubkey")
             node_id = message.payload.get("node_id", "")
@@ -144,14 +199,20 @@ class HiveMindSlaveProtocol:
 
         if self.pswd_handshake is not None:
             envelope = self.pswd_handshake.generate_handshake()
-            msg = HiveMessage(HiveMessageType.HANDSHAKE, {"envelope": envelope,
-                                                          "binarize": self.binarize,
-                                                          "site_id": self.site_id})
+            payload = {"envelope": envelope,
+                       "binarize": self.binarize,
+                       "site_id": self.site_id}
         else:
-            msg = HiveMessage(HiveMessageType.HANDSHAKE, {"pubkey": self.handshake.pubkey,
-                                                          "binarize": self.binarize,
-                                                          "site_id": self.site_id})
-        self.hm.emit(msg)
+            payload = {"pubkey": self.handshake.pubkey,
+                       "binarize": self.binarize,
+                       "site_id": self.site_id}
+        if self.binarize:
+            # masters that don't know about versions ignore this and keep using v1
+            payload["max_protocol_version"] = PROTOCOL_VERSION
+            payload["payload_encodings"] = list(PAYLOAD_ENCODINGS)
+        if self.context_delta:
+            payload["context_delta"] = True
+        self.hm.emit(HiveMessage(HiveMessageType.HANDSHAKE, payload))
 
     def receive_handshake(self, envelope):
         if self.pswd_handshake is not None:
@@ -169,12 +230,17 @@ class HiveMindSlaveProtocol:
                 # implicitly trust the server
                 self.handshake.receive_handshake(envelope)
             self.hm.crypto_key = self.handshake.secret  # update to new crypto key
+        metrics = getattr(self.hm, "metrics", None)
+        if metrics is not None:
+            metrics.handshake_completed()
         self.hm.handshake_event.set()
 
     def handle_handshake(self, message: HiveMessage):
-        LOG.info(f"HANDSHAKE: {message.payload}")
+        log.info("HANDSHAKE: %s", Payload(message.payload))
         # master is performing the handshake
         if "envelope" in message.payload:
+            self._negotiate_protocol_version(message)
+            self._negotiate_context_delta(message)
             envelope = message.payload["envelope"]
             self.receive_handshake(envelope)
 
@@ -191,24 +257,65 @@ class HiveMindSlaveProtocol:
                 # TODO - flag to give preference to pre-shared key over handshake
 
             self.binarize = message.payload.get("binarize", False)
+            self._negotiate_protocol_version(message)
+            self._negotiate_context_delta(message)
             # TODO - flag to give preference to / require password or not
             # currently if password is set then it is always used
             if message.payload.get("password") and self.identity.password:
                 self.pswd_handshake = PasswordHandShake(self.identity.password)
                 self.start_handshake()
 
+    def _negotiate_protocol_version(self, message: HiveMessage):
+        # master announces the highest version it supports (or the one it picked)
+        # in its handshake messages, if it never does we stay on v1
+        if not self.binarize:
+            self.proto_version = 1
+            return
+        master_version = message.payload.get("max_protocol_version") or \
+            message.payload.get("proto_version")
+        if master_version:
+            self.proto_version = max(1, min(PROTOCOL_VERSION, int(master_version)))
+            LOG.info(f"using binarization protocol v{self.proto_version}")
+        # master picks a single encoding, or lists the ones it supports,
+        # handshake messages without either keep the negotiated one
+        encodings = message.payload.get("payload_encoding") or \
+            message.payload.get("payload_encodings")
+        if not encodings:
+            return
+        if isinstance(encodings, str):
+            encodings = [encodings]
+        self.payload_encoding = "json"
+        if self.proto_version >= 2:
+            for encoding in PAYLOAD_ENCODINGS:
+                if encoding in encodings:
+                    self.payload_encoding = encoding
+                    break
+
+    def _negotiate_context_delta(self, message: HiveMessage):
+        # only used if the master explicitly agrees, it must keep baselines too,
+        # handshake messages without the key keep the current codec
+        if "context_delta" not in message.payload:
+            return
+        if self.context_delta and message.payload["context_delta"]:
+            if self.hm.context_codec is None:
+                LOG.info("using context delta encoding")
+                self.hm.context_codec = ContextDeltaCodec()
+        else:
+            self.hm.context_codec = None
+
     def handle_bus(self, message: HiveMessage):
-        LOG.info(f"BUS: {message.payload.msg_type}")
-        assert isinstance(message.payload, MycroftMessage)
         # master wants to inject message into mycroft bus
         pload = message.payload
+        assert isinstance(pload, MycroftMessage)
+        log.info("BUS: %s", pload.msg_type)
 
         # from this point on, it should be a native source and execute audio
-        pload.context["source"] = pload.context.pop("destination")
+        if "destination" in pload.context:
+            pload.context["source"] = pload.context.pop("destination")
         self.internal_protocol.bus.emit(pload)
 
     def handle_broadcast(self, message: HiveMessage):
-        LOG.info(f"BROADCAST: {message.payload}")
+        log.info("BROADCAST: %s", Payload(message.payload))
         # if this device is also a hivemind server
         # forward to HiveMindListenerInternalProtocol
         data = message.serialize()
@@ -216,9 +323,18 @@ class HiveMindSlaveProtocol:
         self.internal_protocol.bus.emit(MycroftMessage('hive.send.downstream', data, ctxt))
 
     def handle_propagate(self, message: HiveMessage):
-        LOG.info(f"PROPAGATE: {message.payload}")
+        log.info("PROPAGATE: %s", Payload(message.payload))
         # if this device is also a hivemind server
         # forward to HiveMindListenerInternalProtocol
         data = message.serialize()
         ctxt = {"source": self.node_id}
         self.internal_protocol.bus.emit(MycroftMessage('hive.send.downstream', data, ctxt))
+
+    def handle_ping(self, message: HiveMessage):
+        # answer pings from the master, so it can measure the link too
+        # our own pings are answered with pong=True and handled by the client
+        if message.payload.get("pong"):
+            return
+        now = time.time()
+        pong = dict(message.payload, pong=True, t1=now, t2=now)
+        self.hm.emit(HiveMessage(HiveMessageType.PING, pong))
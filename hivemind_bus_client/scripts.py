@@ -1,19 +1,37 @@
 import json
+import sys
+import time
 
 import click
-from ovos_bus_client import Message
-from ovos_utils.log import LOG
-from ovos_utils.messagebus import FakeBus
 
-from hivemind_bus_client.client import HiveMessageBusClient
-from hivemind_bus_client.message import HiveMessage, HiveMessageType
-from hivemind_bus_client.identity import NodeIdentity
-LOG.set_level("DEBUG")
+# the client stack (ovos_bus_client, websocket, crypto) is imported inside the
+# commands that connect, set-identity and --help stay fast, see benchmarks/importtime.py
 
 
 @click.group()
-def hmclient_cmds():
-    pass
+@click.option("--log-level", help="log level, e.g. DEBUG (default: INFO), per category "
+                                  "levels can be set with HIVEMIND_LOG_LEVELS=protocol=DEBUG",
+              type=str, default="")
+def hmclient_cmds(log_level: str):
+    if log_level:
+        from ovos_utils.log import LOG
+        LOG.set_level(log_level.upper())
+
+
+def _via_daemon(no_daemon: bool, overrides: tuple, msg_type: str, msg: str, payload: str) -> bool:
+    """ True if a running `hivemind-client daemon` sent the message """
+    if no_daemon or any(overrides):
+        return False  # explicit credentials / host / port / site are for a direct connection
+    from hivemind_bus_client.daemon import send_via_daemon, DaemonError
+    try:
+        sent = send_via_daemon(msg_type, {"type": msg, "data": json.loads(payload), "context": {}})
+    except DaemonError as e:
+        from ovos_utils.log import LOG
+        LOG.warning(f"hivemind-client daemon failed, connecting directly: {e}")
+        return False
+    if sent:
+        print("== sent through hivemind-client daemon")
+    return sent
 
 
 @hmclient_cmds.command(help="persist node identity / credentials", name="set-identity")
@@ -22,6 +40,8 @@ def hmclient_cmds():
 @click.option("--host", help="default host for hivemind-core", type=str, default="")
 @click.option("--siteid", help="location identifier for message.context", type=str, default="")
 def identity_set(key: str, password: str, host: str, siteid: str):
+    from hivemind_bus_client.identity import NodeIdentity
+
     if not key and not password and not siteid:
         raise ValueError("please set at least one of key/password/siteid/host")
     identity = NodeIdentity()
@@ -43,6 +63,12 @@ def identity_set(key: str, password: str, host: str, siteid: str):
 @click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
 @click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
 def terminal(key: str, password: str, host: str, port: int, siteid: str):
+    from ovos_bus_client import Message
+    from ovos_utils.log import LOG
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+
     identity = NodeIdentity()
     password = password or identity.password
     key = key or identity.access_key
@@ -90,12 +116,21 @@ def terminal(key: str, password: str, host: str, port: int, siteid: str):
 @click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
 @click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
 @click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
-@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=None)
 @click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
 @click.option("--msg", help="ovos message type to inject", type=str)
 @click.option("--payload", help="ovos message.data json", type=str)
-def send_mycroft(key: str, password: str, host: str, port: int, siteid: str, msg: str, payload: str):
-    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+@click.option("--no-daemon", help="always connect directly, even if hivemind-client daemon is running", is_flag=True)
+def send_mycroft(key: str, password: str, host: str, port: int, siteid: str, msg: str, payload: str,
+                 no_daemon: bool):
+    if _via_daemon(no_daemon, (key, password, host, port, siteid), "bus", msg, payload):
+        return
+
+    from ovos_bus_client import Message
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+
+    node = HiveMessageBusClient(key, host=host, port=port or 5678, password=password)
     node.connect(FakeBus(), site_id=siteid)
 
     node.connected_event.wait()
@@ -111,11 +146,22 @@ def send_mycroft(key: str, password: str, host: str, port: int, siteid: str, msg
 @click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
 @click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
 @click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
-@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=None)
 @click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
 @click.option("--msg", help="ovos message type to inject", type=str)
 @click.option("--payload", help="ovos message.data json", type=str)
-def escalate(key: str, password: str, host: str, port: int, siteid: str, msg: str, payload: str):
+@click.option("--no-daemon", help="always connect directly, even if hivemind-client daemon is running", is_flag=True)
+def escalate(key: str, password: str, host: str, port: int, siteid: str, msg: str, payload: str,
+             no_daemon: bool):
+    if _via_daemon(no_daemon, (key, password, host, port, siteid), "escalate", msg, payload):
+        return
+
+    from ovos_bus_client import Message
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+    from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
     identity = NodeIdentity()
     password = password or identity.password
     key = key or identity.access_key
@@ -129,14 +175,14 @@ def escalate(key: str, password: str, host: str, port: int, siteid: str, msg: st
         raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
                            "call 'hivemind-client set-identity'")
 
-    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    node = HiveMessageBusClient(key, host=host, port=port or 5678, password=password)
     node.connect(FakeBus(), site_id=siteid)
 
     node.connected_event.wait()
     print("== connected to HiveMind")
 
     hm = HiveMessage(HiveMessageType.ESCALATE,
-                     Message(msg, json.loads(payload)))
+                     HiveMessage(HiveMessageType.BUS, Message(msg, json.loads(payload))).as_dict)
     node.emit(hm)
 
     node.close()
@@ -147,11 +193,22 @@ def escalate(key: str, password: str, host: str, port: int, siteid: str, msg: st
 @click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
 @click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
 @click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
-@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=None)
 @click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
 @click.option("--msg", help="ovos message type to inject", type=str)
 @click.option("--payload", help="ovos message.data json", type=str)
-def propagate(key: str, password: str, host: str, port: int, siteid: str, msg: str, payload: str):
+@click.option("--no-daemon", help="always connect directly, even if hivemind-client daemon is running", is_flag=True)
+def propagate(key: str, password: str, host: str, port: int, siteid: str, msg: str, payload: str,
+              no_daemon: bool):
+    if _via_daemon(no_daemon, (key, password, host, port, siteid), "propagate", msg, payload):
+        return
+
+    from ovos_bus_client import Message
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+    from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
     identity = NodeIdentity()
     password = password or identity.password
     key = key or identity.access_key
@@ -165,18 +222,340 @@ def propagate(key: str, password: str, host: str, port: int, siteid: str, msg: s
         raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
                            "call 'hivemind-client set-identity'")
 
-    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    node = HiveMessageBusClient(key, host=host, port=port or 5678, password=password)
     node.connect(FakeBus(), site_id=siteid)
 
     node.connected_event.wait()
     print("== connected to HiveMind")
 
     hm = HiveMessage(HiveMessageType.PROPAGATE,
-                     Message(msg, json.loads(payload)))
+                     HiveMessage(HiveMessageType.BUS, Message(msg, json.loads(payload))).as_dict)
     node.emit(hm)
 
     node.close()
 
 
+@hmclient_cmds.command(help="keep a HiveMind connection open, send-mycroft / escalate / "
+                            "propagate use it instead of connecting themselves",
+                       name="daemon")
+@click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
+@click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
+@click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
+@click.option("--socket", "socket_path", help="unix socket to listen on (default: $HIVEMIND_CLIENT_SOCKET "
+                                              "or hivemind-client.sock in $XDG_RUNTIME_DIR)", type=str, default="")
+def daemon(key: str, password: str, host: str, port: int, siteid: str, socket_path: str):
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.daemon import HiveClientDaemon
+    from hivemind_bus_client.identity import NodeIdentity
+
+    identity = NodeIdentity()
+    password = password or identity.password
+    key = key or identity.access_key
+    host = host or identity.default_master
+    siteid = siteid or identity.site_id or "unknown"
+
+    if not host.startswith("ws://") and not host.startswith("wss://"):
+        host = "ws://" + host
+
+    if not key or not password or not host:
+        raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
+                           "call 'hivemind-client set-identity'")
+
+    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    node.connect(FakeBus(), site_id=siteid)
+
+    with HiveClientDaemon(node, socket_path or None) as server:
+        print(f"== connected to HiveMind, listening on {server.path}, ctrl+c to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        print(f"== {server.emitted} messages sent")
+
+    node.close()
+
+
+@hmclient_cmds.command(help="measure latency to the HiveMind master",
+                       name="ping")
+@click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
+@click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
+@click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
+@click.option("--count", help="number of pings to send (default: 5)", type=int, default=5)
+@click.option("--interval", help="seconds between pings (default: 1)", type=float, default=1.0)
+@click.option("--timeout", help="seconds to wait for each answer (default: 3)", type=float, default=3.0)
+def ping(key: str, password: str, host: str, port: int, siteid: str,
+         count: int, interval: float, timeout: float):
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+
+    identity = NodeIdentity()
+    password = password or identity.password
+    key = key or identity.access_key
+    host = host or identity.default_master
+    siteid = siteid or identity.site_id or "unknown"
+
+    if not host.startswith("ws://") and not host.startswith("wss://"):
+        host = "ws://" + host
+
+    if not key or not password or not host:
+        raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
+                           "call 'hivemind-client set-identity'")
+
+    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    node.connect(FakeBus(), site_id=siteid)
+
+    for i in range(count):
+        rtt = node.ping(timeout=timeout)
+        if rtt is None:
+            print(f"ping {i}: timeout")
+        else:
+            print(f"ping {i}: {rtt * 1000:.2f} ms")
+        if i < count - 1:
+            time.sleep(interval)
+
+    stats = node.get_ping_stats()
+    print(f"== {stats['sent']} sent, {stats['received']} received, {stats['loss']:.0%} loss")
+    if stats["received"]:
+        print(f"rtt min/smoothed/max = {stats['min_rtt'] * 1000:.2f}/{stats['srtt'] * 1000:.2f}/"
+              f"{stats['max_rtt'] * 1000:.2f} ms, jitter {stats['jitter'] * 1000:.2f} ms")
+    if stats["clock_offset"] is not None:
+        print(f"clock offset to master: {stats['clock_offset'] * 1000:.2f} ms")
+
+    node.close()
+
+
+@hmclient_cmds.command(help="record HiveMind traffic to a capture file",
+                       name="capture")
+@click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
+@click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
+@click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
+@click.option("--file", "path", help="capture file, appended to if it exists", type=str, required=True)
+@click.option("--raw", help="store websocket frames as received instead of decoded messages", is_flag=True)
+@click.option("--duration", help="seconds to capture (default: until ctrl+c)", type=float, default=0)
+def capture(key: str, password: str, host: str, port: int, siteid: str,
+            path: str, raw: bool, duration: float):
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+
+    identity = NodeIdentity()
+    password = password or identity.password
+    key = key or identity.access_key
+    host = host or identity.default_master
+    siteid = siteid or identity.site_id or "unknown"
+
+    if not host.startswith("ws://") and not host.startswith("wss://"):
+        host = "ws://" + host
+
+    if not key or not password or not host:
+        raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
+                           "call 'hivemind-client set-identity'")
+
+    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    recorder = node.start_capture(path, raw=raw)
+    node.connect(FakeBus(), site_id=siteid)
+    print(f"== capturing to {path}, ctrl+c to stop")
+
+    try:
+        start = time.monotonic()
+        while not duration or time.monotonic() - start < duration:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+
+    node.close()
+    print(f"== {recorder.count} messages captured")
+
+
+@hmclient_cmds.command(help="replay a capture file into the HiveMind master",
+                       name="replay")
+@click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
+@click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
+@click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
+@click.option("--file", "path", help="capture file to replay", type=str, required=True)
+@click.option("--speed", help="1 replays at the original timing, N is N times faster, "
+                              "0 as fast as possible (default: 1)", type=float, default=1.0)
+@click.option("--type", "msg_types", help="only replay this HiveMessageType, can be repeated", multiple=True)
+def replay_capture(key: str, password: str, host: str, port: int, siteid: str,
+                   path: str, speed: float, msg_types: tuple):
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+    from hivemind_bus_client.capture import CaptureReader, replay, OUT
+
+    identity = NodeIdentity()
+    password = password or identity.password
+    key = key or identity.access_key
+    host = host or identity.default_master
+    siteid = siteid or identity.site_id or "unknown"
+
+    if not host.startswith("ws://") and not host.startswith("wss://"):
+        host = "ws://" + host
+
+    if not key or not password or not host:
+        raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
+                           "call 'hivemind-client set-identity'")
+
+    reader = CaptureReader(path)
+    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    node.connect(FakeBus(), site_id=siteid)
+    node.handshake_event.wait()
+    print(f"== replaying {len(reader)} captured messages")
+
+    stats = replay(reader, node, speed=speed or None, direction=OUT, msg_types=msg_types or None)
+    rate = stats["count"] / stats["elapsed"] if stats["elapsed"] else 0
+    print(f"== {stats['count']} sent, {stats['errors']} errors in {stats['elapsed']:.2f}s "
+          f"({rate:.0f} msgs/s), max lag {stats['max_lag'] * 1000:.1f} ms")
+
+    reader.close()
+    node.close()
+
+
+@hmclient_cmds.command(help="send messages from a json lines file over one connection",
+                       name="send-batch")
+@click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
+@click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
+@click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--siteid", help="location identifier for message.context  (default read from identity file)", type=str, default="")
+@click.option("--file", "infile", help="json lines, an ovos message or a HiveMessage per line "
+                                       "(default: stdin)", type=click.File("r"), default="-")
+@click.option("--wait-replies", help="wait for the correlated reply to every message", is_flag=True)
+@click.option("--window", help="max messages waiting for a reply (default: 32)", type=int, default=32)
+@click.option("--reply-timeout", help="seconds to wait for each reply (default: 10)", type=float, default=10)
+@click.option("--reply-type", help="only accept replies of this ovos message type, e.g. speak", type=str, default="")
+@click.option("--replies", "replies_path", help="write the replies as json lines to this file", type=str, default="")
+@click.option("--json", "as_json", help="print the summary as json", is_flag=True)
+def send_batch(key: str, password: str, host: str, port: int, siteid: str, infile,
+               wait_replies: bool, window: int, reply_timeout: float, reply_type: str,
+               replies_path: str, as_json: bool):
+    from ovos_utils.messagebus import FakeBus
+    from hivemind_bus_client.batch import BatchSender
+    from hivemind_bus_client.client import HiveMessageBusClient
+    from hivemind_bus_client.identity import NodeIdentity
+
+    identity = NodeIdentity()
+    password = password or identity.password
+    key = key or identity.access_key
+    host = host or identity.default_master
+    siteid = siteid or identity.site_id or "unknown"
+
+    if not host.startswith("ws://") and not host.startswith("wss://"):
+        host = "ws://" + host
+
+    if not key or not password or not host:
+        raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
+                           "call 'hivemind-client set-identity'")
+
+    replies_file = open(replies_path, "w") if replies_path else None
+
+    def write_reply(lineno, request, reply, rtt):
+        replies_file.write(json.dumps({"line": lineno, "rtt": rtt, "reply": reply.as_dict}) + "\n")
+
+    node = HiveMessageBusClient(key, host=host, port=port, password=password)
+    node.connect(FakeBus(), site_id=siteid)
+    print("== connected to HiveMind", file=sys.stderr)
+
+    sender = BatchSender(node, window=window, wait_replies=wait_replies or bool(replies_file),
+                         reply_timeout=reply_timeout, reply_type=reply_type or None,
+                         on_reply=write_reply if replies_file else None)
+    try:
+        report = sender.run(infile)
+    finally:
+        node.close()
+        if replies_file is not None:
+            replies_file.close()
+
+    if as_json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"== {report['sent_total']} sent in {report['duration']:.2f}s "
+              f"({report['throughput_msgs_per_sec']} msgs/s) {report['sent']}")
+        if sender.wait_replies:
+            rtt = report["reply_rtt_ms"]
+            print(f"== {report['replies']} replies" +
+                  (f", rtt p50 {rtt['p50']} p99 {rtt['p99']} max {rtt['max']} ms" if rtt["count"] else ""))
+        print(f"== errors: {report['errors'] or 'none'}")
+        for lineno, reason in report["failures"][:10]:
+            print(f"line {lineno}: {reason}")
+    if report["errors"]:
+        sys.exit(1)
+
+
+@hmclient_cmds.command(help="load test a HiveMind master with simulated satellites",
+                       name="bench")
+@click.option("--key", help="HiveMind access key (default read from identity file)", type=str, default="")
+@click.option("--password", help="HiveMind password (default read from identity file)", type=str, default="")
+@click.option("--host", help="HiveMind host (default read from identity file)", type=str, default="")
+@click.option("--port", help="HiveMind port number (default: 5678)", type=int, default=5678)
+@click.option("--mock", help="run against an in-process mock master instead", is_flag=True)
+@click.option("--satellites", help="number of simulated satellites (default: 10)", type=int, default=10)
+@click.option("--duration", help="seconds of traffic (default: 30)", type=float, default=30)
+@click.option("--rate", help="messages per second per satellite (default: 5)", type=float, default=5)
+@click.option("--mix", help="message mix weights (default: bus=0.7,shared_bus=0.2,binary=0.1)",
+              type=str, default="bus=0.7,shared_bus=0.2,binary=0.1")
+@click.option("--payload-size", help="characters per bus message (default: 64)", type=int, default=64)
+@click.option("--binary-size", help="bytes per binary message (default: 3200)", type=int, default=3200)
+@click.option("--ramp-up", help="seconds over which satellites connect (default: 0)", type=float, default=0)
+@click.option("--json", "as_json", help="print the report as json", is_flag=True)
+def bench(key: str, password: str, host: str, port: int, mock: bool, satellites: int,
+          duration: float, rate: float, mix: str, payload_size: int, binary_size: int,
+          ramp_up: float, as_json: bool):
+    from hivemind_bus_client.identity import NodeIdentity
+    from hivemind_bus_client.loadgen import LoadGenerator, LoadProfile
+
+    profile = LoadProfile(satellites=satellites, duration=duration, rate=rate,
+                          mix=LoadProfile.parse_mix(mix), payload_size=payload_size,
+                          binary_size=binary_size, ramp_up=ramp_up)
+    master = None
+    if mock:
+        from hivemind_bus_client.mock import MockHiveMaster
+        key = key or "hivemind-bench"
+        password = password or "hivemind-bench-password"
+        master = MockHiveMaster(password=password).start()
+        host, port = "ws://127.0.0.1", master.port
+    else:
+        identity = NodeIdentity()
+        password = password or identity.password
+        key = key or identity.access_key
+        host = host or identity.default_master
+        if not host.startswith("ws://") and not host.startswith("wss://"):
+            host = "ws://" + host
+        if not key or not password or not host:
+            raise RuntimeError("NodeIdentity not set, please pass key/password/host or "
+                               "call 'hivemind-client set-identity'")
+
+    print(f"== {satellites} satellites x {rate} msgs/s for {duration}s against {host}:{port}")
+    try:
+        report = LoadGenerator(key, password, host=host, port=port, profile=profile).run()
+    finally:
+        if master is not None:
+            master.stop()
+
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"== {report['connected']}/{report['satellites']} connected, "
+          f"{report['sent_total']} sent in {report['duration']:.1f}s "
+          f"({report['throughput_msgs_per_sec']} msgs/s) {report['sent']}")
+    print(f"== errors: {report['errors'] or 'none'}")
+    for name in ("handshake_ms", "echo_rtt_ms", "ping_rtt_ms"):
+        stats = report[name]
+        if stats["count"]:
+            print(f"{name}: p50 {stats['p50']} p90 {stats['p90']} p99 {stats['p99']} "
+                  f"max {stats['max']} (n={stats['count']})")
+
+
 if __name__ == "__main__":
     hmclient_cmds()
@@ -1,3 +1,4 @@
+import json
 import sys
 from enum import IntEnum
 from inspect import signature
@@ -5,11 +6,13 @@ from inspect import signature
 from bitstring import BitArray, BitStream
 
 from hivemind_bus_client.exceptions import UnsupportedProtocolVersion
-from hivemind_bus_client.message import HiveMessageType, HiveMessage
+from hivemind_bus_client.message import HiveMessageType, HiveMessage, Message
+from hivemind_bus_client.packing import pack, unpack
 from hivemind_bus_client.util import compress_payload, decompress_payload, cast2bytes, bytes2str
 
-PROTOCOL_VERSION = 1  # integer, a version increase signals new functionality added
+PROTOCOL_VERSION = 2  # integer, a version increase signals new functionality added
                       # version 0 is the original hivemind protocol, 1 supports handshake + binary
+                      # 2 is byte aligned, with varint lengths and id tables for common strings
 
 
 class HiveMindBinaryPayloadType(IntEnum):
@@ -34,63 +37,362 @@ _INT2TYPE = {0: HiveMessageType.HANDSHAKE,
              10: HiveMessageType.RENDEZVOUS,
              11: HiveMessageType.THIRDPRTY,
              12: HiveMessageType.BINARY}
+_TYPE2INT = {v: k for k, v in _INT2TYPE.items()}
+_EMPTY_META = b"{}"
+_EMPTY_META_Z = compress_payload(_EMPTY_META)
+_BIN2INT = {e: e.value for e in HiveMindBinaryPayloadType}
+_HIVE_KWARGS = [a for a in signature(HiveMessage).parameters if a not in ("msg_type", "payload", "meta")]
+
+# v2 id tables, ids are part of the wire format, only ever append to these lists!
+# id 0 is reserved for "not in table, literal string follows"
+_V2_MSG_TYPES = [None,
+                 "speak",
+                 "recognizer_loop:utterance",
+                 "recognizer_loop:wakeword",
+                 "recognizer_loop:record_begin",
+                 "recognizer_loop:record_end",
+                 "recognizer_loop:audio_output_start",
+                 "recognizer_loop:audio_output_end",
+                 "recognizer_loop:b64_transcribe",
+                 "recognizer_loop:b64_transcribe.response",
+                 "speak:b64_audio",
+                 "speak:b64_audio.response",
+                 "mycroft.stop",
+                 "mycroft.mic.listen",
+                 "mycroft.audio.speech.stop",
+                 "mycroft.audio.service.play",
+                 "mycroft.audio.service.stop",
+                 "mycroft.audio.service.pause",
+                 "mycroft.audio.service.resume",
+                 "mycroft.skill.handler.start",
+                 "mycroft.skill.handler.complete",
+                 "mycroft.skills.fallback",
+                 "mycroft.skills.initialized",
+                 "mycroft.ready",
+                 "complete_intent_failure",
+                 "intent_failure",
+                 "enclosure.mouth.text",
+                 "gui.value.set",
+                 "gui.page.show",
+                 "mycroft.gui.screen.close",
+                 "ovos.common_play.play",
+                 "ovos.common_play.search",
+                 "ovos.session.update_default",
+                 "ovos.session.sync",
+                 "question:query",
+                 "question:query.response",
+                 "hive.send.upstream",
+                 "hive.send.downstream"]
+_V2_CONTEXT_KEYS = [None,
+                    "source",
+                    "destination",
+                    "platform",
+                    "session",
+                    "site_id",
+                    "skill_id",
+                    "lang",
+                    "ident",
+                    "user_id",
+                    "correlation_id",
+                    "client_name",
+                    "timing",
+                    "peer"]
+_V2_MSG_TYPE_IDS = {t: i for i, t in enumerate(_V2_MSG_TYPES) if t}
+_V2_CONTEXT_KEY_IDS = {k: i for i, k in enumerate(_V2_CONTEXT_KEYS) if k}
+
+# v2 header flags
+_V2_COMPRESSED = 1  # meta and payload are zlib compressed
+_V2_STRUCTURED = 2  # payload is a mycroft message encoded as type id + data + context entries
+_V2_PACKED = 4  # payload values are msgpack encoded instead of json text
+
+# v2 payload value encodings, in order of preference, negotiated in handshake
+PAYLOAD_ENCODINGS = ("msgpack", "json")
 
 
 def get_bitstring(hive_type=HiveMessageType.BUS, payload=None,
                   compressed=None, hivemeta=None,
                   binary_type=HiveMindBinaryPayloadType.UNDEFINED,
-                  proto_version=PROTOCOL_VERSION, versioned=False):
+                  proto_version=1, versioned=False, payload_encoding="json",
+                  compression_bytes=None):
+    """ encode a hive message for the wire
+
+    proto_version 2 must be negotiated with the other end during the handshake,
+    v2 frames are always versioned and returned as bytes instead of a BitArray
+
+    payload_encoding "msgpack" is only supported by v2 and must also be negotiated
+
+    compression_bytes is an optional metrics Counter labeled (direction, stage),
+    bytes before and after compression are counted there"""
+    if proto_version == 2:
+        return _get_bytes_v2(hive_type, payload, compressed, hivemeta, binary_type,
+                             packed=payload_encoding == "msgpack",
+                             compression_bytes=compression_bytes)
     if proto_version <= 1:
-        if compressed is None:  # auto
-            unc = _get_bitstring_v1(hive_type, payload, False, hivemeta, binary_type, versioned)
-            comp = _get_bitstring_v1(hive_type, payload, True, hivemeta, binary_type, versioned)
-            if len(unc) <= len(comp):
-                return unc
-            return comp
-        return _get_bitstring_v1(hive_type, payload, bool(compressed), hivemeta, binary_type, versioned)
+        # payload and metadata are encoded only once,
+        # in auto mode the compressed version is only kept if smaller
+        payload = _payload2bytes(hive_type, payload)
+        hivemeta = cast2bytes(hivemeta) if hivemeta else _EMPTY_META
+        if hive_type != HiveMessageType.BINARY and compressed is not False:
+            comp_payload = compress_payload(payload)
+            comp_meta = compress_payload(hivemeta) if hivemeta is not _EMPTY_META else _EMPTY_META_Z
+            if compressed or len(comp_payload) + len(comp_meta) < len(payload) + len(hivemeta):
+                if compression_bytes is not None:
+                    compression_bytes.inc("out", "raw", n=len(payload) + len(hivemeta))
+                    compression_bytes.inc("out", "zlib", n=len(comp_payload) + len(comp_meta))
+                return _get_bitstring_v1(hive_type, comp_payload, True, comp_meta,
+                                         binary_type, versioned)
+        elif compressed:  # binary payloads are passed along raw, only meta is compressed
+            return _get_bitstring_v1(hive_type, payload, True, compress_payload(hivemeta),
+                                     binary_type, versioned)
+        return _get_bitstring_v1(hive_type, payload, False, hivemeta, binary_type, versioned)
     raise UnsupportedProtocolVersion(f"Max Supported Version: {PROTOCOL_VERSION}")
 
 
-def _get_bitstring_v1(hive_type=HiveMessageType.BUS, payload=None,
-                      compressed=True, hivemeta=None,
-                      binary_type=HiveMindBinaryPayloadType.UNDEFINED, versioned=False):
-    # there are 12 hivemind message main types
-    typemap = {v: k for k, v in _INT2TYPE.items()}
-    binmap = {e: e.value for e in HiveMindBinaryPayloadType}
+def _payload2bytes(hive_type, payload, compact=False) -> bytes:
+    """ encode a payload to its final (uncompressed) bytes representation
+
+    compact routes are only understood by peers that negotiated protocol v2,
+    v1 frames always carry the dict form"""
+    if hive_type == HiveMessageType.BINARY:
+        return payload
+    if isinstance(payload, HiveMessage):
+        payload = payload.serialize(compact=compact)
+    elif hasattr(payload, "serialize"):
+        payload = payload.serialize()
+    return cast2bytes(payload)
+
 
+def _get_bitstring_v1(hive_type=HiveMessageType.BUS, payload=b"",
+                      compressed=True, hivemeta=b"",
+                      binary_type=HiveMindBinaryPayloadType.UNDEFINED, versioned=False):
+    """ payload and hivemeta are expected to be already encoded (and compressed) bytes """
     s = BitArray()
     s.append(f'uint:1={int(1)}')  # always start with a 1, 0s to the left for padding so it can be cast to bytes
     s.append(f'uint:1={int(versioned)}')  # 1 bit unsigned integer - requires protocol version
     if versioned:
-        s.append(f'uint:8={PROTOCOL_VERSION}')
-    s.append(f'uint:5={typemap.get(hive_type, 11)}')  # 5 bit unsigned integer - the hive msg type
+        s.append('uint:8=1')
+    # there are 12 hivemind message main types
+    s.append(f'uint:5={_TYPE2INT.get(hive_type, 11)}')  # 5 bit unsigned integer - the hive msg type
     s.append(f'uint:1={int(bool(compressed))}')  # 1 bit unsigned integer - payload is zlib compressed
 
     # NOTE: hivemind meta is reserved TBD arbitrary data
-    hivemeta = cast2bytes(hivemeta or {}, compressed)
     s.append(f'uint:8={len(hivemeta)}')  # 8 bit unsigned integer - N of bytes for metadata
     s.append(hivemeta)  # arbitrary hivemind meta
 
     # when payload is binary data meant to be passed along raw and not parsed
     if hive_type == HiveMessageType.BINARY:
         # 4 bit unsigned integer - integer indicating pseudo format of bin content
-        s.append(f'uint:4={binmap.get(binary_type, 0)}')
-    # the remaining bits are the payload
-    else:
-        if hasattr(payload, "serialize"):
-            payload = payload.serialize()
-        payload = cast2bytes(payload, compressed)
+        s.append(f'uint:4={_BIN2INT.get(binary_type, 0)}')
 
+    # the remaining bits are the payload
     s.append(payload)
 
     # pad
-    while len(s) % 8 != 0:
-        s.insert(f'uint:1={int(0)}', 0)
+    if len(s) % 8:
+        s.prepend(BitArray(8 - len(s) % 8))
 
     return s
 
 
-def decode_bitstring(bitstr):
+def _write_varint(buf: bytearray, value: int):
+    """ unsigned LEB128 """
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, pos: int):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_str(buf: bytearray, value: str, table: dict):
+    idx = table.get(value)
+    if idx is not None:
+        _write_varint(buf, idx)
+    else:
+        raw = value.encode("utf-8")
+        buf.append(0)
+        _write_varint(buf, len(raw))
+        buf += raw
+
+
+def _read_str(data, pos: int, table: list):
+    idx, pos = _read_varint(data, pos)
+    if idx:
+        return table[idx], pos
+    size, pos = _read_varint(data, pos)
+    return bytes(data[pos:pos + size]).decode("utf-8"), pos + size
+
+
+def _write_blob(buf: bytearray, value: bytes):
+    _write_varint(buf, len(value))
+    buf += value
+
+
+def _read_blob(data, pos: int):
+    size, pos = _read_varint(data, pos)
+    return bytes(data[pos:pos + size]), pos + size
+
+
+def _json_dumpb(value) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+def _encode_structured_v2(pload: dict, packed=False) -> bytes:
+    """ mycroft message as: type + data + context entries, with known strings as table ids """
+    dumps = pack if packed else _json_dumpb
+    buf = bytearray()
+    _write_str(buf, pload["type"], _V2_MSG_TYPE_IDS)
+    _write_blob(buf, dumps(pload.get("data") or {}))
+    ctxt = pload.get("context") or {}
+    _write_varint(buf, len(ctxt))
+    for k, v in ctxt.items():
+        _write_str(buf, k, _V2_CONTEXT_KEY_IDS)
+        _write_blob(buf, dumps(v))
+    return bytes(buf)
+
+
+def _decode_structured_v2(data: bytes, packed=False) -> dict:
+    loads = unpack if packed else json.loads
+    msg_type, pos = _read_str(data, 0, _V2_MSG_TYPES)
+    raw, pos = _read_blob(data, pos)
+    msg_data = loads(raw)
+    n_ctxt, pos = _read_varint(data, pos)
+    ctxt = {}
+    for _ in range(n_ctxt):
+        k, pos = _read_str(data, pos, _V2_CONTEXT_KEYS)
+        raw, pos = _read_blob(data, pos)
+        ctxt[k] = loads(raw)
+    return {"type": msg_type, "data": msg_data, "context": ctxt}
+
+
+def _payload2obj(payload):
+    """ payload as plain python values, for msgpack encoding """
+    if isinstance(payload, HiveMessage):
+        return payload.as_compact_dict
+    if isinstance(payload, Message):
+        return {"type": payload.msg_type, "data": payload.data, "context": payload.context}
+    if isinstance(payload, (str, bytes)):
+        return json.loads(payload)
+    return payload
+
+
+def _as_mycroft_dict(payload):
+    """ mycroft payloads as dict, None if payload is something else """
+    if isinstance(payload, Message):
+        return {"type": payload.msg_type, "data": payload.data, "context": payload.context}
+    if isinstance(payload, HiveMessage):
+        payload = payload._payload
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return None
+    if isinstance(payload, dict) and isinstance(payload.get("type"), str):
+        return payload
+    return None
+
+
+def _get_bytes_v2(hive_type=HiveMessageType.BUS, payload=None,
+                  compressed=None, hivemeta=None,
+                  binary_type=HiveMindBinaryPayloadType.UNDEFINED,
+                  packed=False, compression_bytes=None) -> bytes:
+    """
+    v2 frame, all fields byte aligned
+
+        0x03                     - v1 compatible preamble, start bit + versioned bit
+        0x02                     - protocol version
+        uint8                    - hive message type
+        uint8                    - flags, see _V2_*
+        varint + bytes           - hivemeta json
+        uint8                    - binary payload type, only for BINARY messages
+        bytes                    - payload until the end of the frame
+    """
+    flags = 0
+    if hive_type == HiveMessageType.BINARY:
+        body = payload
+    else:
+        mycroft = _as_mycroft_dict(payload) \
+            if hive_type in (HiveMessageType.BUS, HiveMessageType.SHARED_BUS) else None
+        if packed:
+            flags |= _V2_PACKED
+        if mycroft is not None:
+            flags |= _V2_STRUCTURED
+            body = _encode_structured_v2(mycroft, packed)
+        elif packed:
+            body = pack(_payload2obj(payload))
+        else:
+            body = _payload2bytes(hive_type, payload, compact=True)
+    meta = cast2bytes(hivemeta) if hivemeta else b""
+
+    if compressed is not False and hive_type != HiveMessageType.BINARY:
+        comp_body = compress_payload(body)
+        comp_meta = compress_payload(meta) if meta else b""
+        if compressed or len(comp_body) + len(comp_meta) < len(body) + len(meta):
+            if compression_bytes is not None:
+                compression_bytes.inc("out", "raw", n=len(body) + len(meta))
+                compression_bytes.inc("out", "zlib", n=len(comp_body) + len(comp_meta))
+            flags |= _V2_COMPRESSED
+            body, meta = comp_body, comp_meta
+    elif compressed and meta:  # binary payloads are passed along raw, only meta is compressed
+        flags |= _V2_COMPRESSED
+        meta = compress_payload(meta)
+
+    buf = bytearray((0x03, 2, _TYPE2INT.get(hive_type, 11), flags))
+    _write_blob(buf, meta)
+    if hive_type == HiveMessageType.BINARY:
+        buf.append(_BIN2INT.get(binary_type, 0))
+    buf += body
+    return bytes(buf)
+
+
+def _decode_bytes_v2(data: bytes, compression_bytes=None) -> HiveMessage:
+    hive_type = _INT2TYPE.get(data[2], HiveMessageType.THIRDPRTY)
+    flags = data[3]
+    compressed = flags & _V2_COMPRESSED
+    meta, pos = _read_blob(data, 4)
+    if meta:
+        meta = json.loads(bytes2str(meta, compressed))
+    else:
+        meta = {}
+    kwargs = {a: meta[a] for a in _HIVE_KWARGS if a in meta}
+
+    if hive_type == HiveMessageType.BINARY:
+        meta["bin_type"] = _BIN2INT.get(data[pos], 0)
+        return HiveMessage(hive_type, data[pos + 1:], meta=meta, **kwargs)
+
+    body = data[pos:]
+    if compressed:
+        raw = decompress_payload(body)
+        if compression_bytes is not None:
+            compression_bytes.inc("in", "zlib", n=len(body))
+            compression_bytes.inc("in", "raw", n=len(raw))
+        body = raw
+    packed = flags & _V2_PACKED
+    if flags & _V2_STRUCTURED:
+        payload = _decode_structured_v2(body, packed)
+    elif packed:
+        payload = unpack(body)
+    else:
+        payload = json.loads(body)
+    return HiveMessage(hive_type, payload, meta=meta, **kwargs)
+
+
+def decode_bitstring(bitstr, compression_bytes=None):
+    """ decode a v1 or v2 frame, compression_bytes: see get_bitstring """
+    if isinstance(bitstr, (bytes, bytearray)) and len(bitstr) > 3 and \
+            bitstr[0] == 0x03 and bitstr[1] == 2:
+        # v2 is byte aligned, no need for bit level parsing
+        return _decode_bytes_v2(bytes(bitstr), compression_bytes)
     s = BitStream(bitstr)
     pad = False
     while not pad:
@@ -99,35 +401,42 @@ def decode_bitstring(bitstr):
     if versioned:
         proto_version = s.read(8).uint
     else:
-        proto_version = PROTOCOL_VERSION
+        proto_version = 1  # unversioned frames are always v1
     if proto_version <= 1:
-        return _decode_bitstring_v1(s)
+        return _decode_bitstring_v1(s, compression_bytes)
+    if proto_version == 2:
+        return _decode_bytes_v2(s.bytes, compression_bytes)
     raise UnsupportedProtocolVersion(f"Max Supported Version: {PROTOCOL_VERSION}")
 
 
-def _decode_bitstring_v1(s):
-    binmap = {e: e.value for e in HiveMindBinaryPayloadType}
-
+def _decode_bitstring_v1(s, compression_bytes=None):
     hive_type = _INT2TYPE.get(s.read(5).uint, 11)
-    compressed = bool(s.read(1))
+    compressed = s.read(1).bool
 
     metalen = s.read(8).uint * 8
     meta = s.read(metalen)
 
     # TODO standardize hivemind meta
-    meta = bytes2str(meta.bytes, compressed)
-    kwargs = {a: meta[a] for a in signature(HiveMessage).parameters if a in meta}
+    meta = json.loads(bytes2str(meta.bytes, compressed) or "{}")
+    kwargs = {a: meta[a] for a in _HIVE_KWARGS if a in meta}
 
     is_bin = hive_type == HiveMessageType.BINARY
     bin_type = HiveMindBinaryPayloadType.UNDEFINED
     if is_bin:
-        bin_type = binmap.get(s.read(4).uint, 0)
+        bin_type = _BIN2INT.get(s.read(4).uint, 0)
 
     payload_len = len(s) - s.pos
     payload = s.read(payload_len)
 
     if not is_bin:
-        payload = bytes2str(payload.bytes, compressed)
+        payload = payload.bytes
+        if compressed:
+            raw = decompress_payload(payload)
+            if compression_bytes is not None:
+                compression_bytes.inc("in", "zlib", n=len(payload))
+                compression_bytes.inc("in", "raw", n=len(raw))
+            payload = raw
+        payload = payload.decode("utf-8")
     else:
         payload = payload.bytes
         meta["bin_type"] = bin_type
@@ -0,0 +1,199 @@
+"""per message latency tracing through the receive and send pipelines
+
+every traced message produces one span with the time spent in each stage
+
+    receive: decrypt -> decode -> dispatch (pyee + handlers)
+    send:    prepare (context injection, local handlers, context delta)
+             -> encode (serialization + compression) -> encrypt -> send
+
+the trace travels across hops as a W3C "traceparent" string in
+message.context (mycroft payloads) or in the payload dict, the same way
+correlation ids do, a message that arrives with a traceparent is always
+traced so a sampled request is followed through the whole hive
+"""
+import json
+import os
+import random
+import time
+from threading import Lock
+from typing import Callable, Optional, Tuple, Union
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.metrics import payload_type, type_label
+from hivemind_bus_client.util import _innermost_payload
+
+TRACE_KEY = "traceparent"
+
+# raw audio has nowhere to carry it, connection setup payloads are left untouched
+_NO_PROPAGATION = (HiveMessageType.BINARY, HiveMessageType.HELLO, HiveMessageType.HANDSHAKE)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def make_traceparent(trace_id: str, span_id: str) -> str:
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def parse_traceparent(value) -> Optional[Tuple[str, str]]:
+    """ (trace_id, parent span_id) or None if value is not a valid traceparent """
+    if not isinstance(value, str):
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def get_traceparent(message) -> Optional[str]:
+    pload = _innermost_payload(message)
+    if isinstance(pload, Message):
+        return pload.context.get(TRACE_KEY)
+    if isinstance(pload, dict):
+        if "type" in pload:
+            return (pload.get("context") or {}).get(TRACE_KEY)
+        return pload.get(TRACE_KEY)
+    return None
+
+
+def set_traceparent(message, traceparent: str):
+    pload = _innermost_payload(message)
+    if isinstance(pload, Message):
+        pload.context[TRACE_KEY] = traceparent
+    elif isinstance(pload, dict):
+        if "type" in pload:
+            # copy, context may be shared with the caller's Message object
+            pload["context"] = dict(pload.get("context") or {}, **{TRACE_KEY: traceparent})
+        else:
+            pload[TRACE_KEY] = traceparent
+    return message
+
+
+class JSONLSink:
+    """ append spans to a file, one json object per line """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, span: dict):
+        line = json.dumps(span)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CallbackSink:
+    def __init__(self, func: Callable[[dict], None]):
+        self.func = func
+
+    def export(self, span: dict):
+        self.func(span)
+
+    def close(self):
+        pass
+
+
+class OpenTelemetrySink:
+    """ re-create spans with an OpenTelemetry tracer, stages become child spans
+
+    requires opentelemetry-api (and an sdk + exporter to actually ship them),
+    OpenTelemetry picks its own span ids, the hivemind ids are kept as attributes
+    """
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetrySink requires 'pip install opentelemetry-api'") from e
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer("hivemind_bus_client")
+
+    def export(self, span: dict):
+        trace = self._trace
+        context = None
+        if span.get("parent_span_id"):
+            parent = trace.SpanContext(trace_id=int(span["trace_id"], 16),
+                                       span_id=int(span["parent_span_id"], 16),
+                                       is_remote=True, trace_flags=trace.TraceFlags(1))
+            context = trace.set_span_in_context(trace.NonRecordingSpan(parent))
+        start = int(span["start"] * 1e9)
+        otel_span = self.tracer.start_span(span["name"], context=context, start_time=start,
+                                           attributes={"hivemind.trace_id": span["trace_id"],
+                                                       "hivemind.span_id": span["span_id"],
+                                                       "hivemind.msg_type": span["msg_type"],
+                                                       "hivemind.payload_type": span["payload_type"]})
+        if span.get("error"):
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR, span["error"]))
+        child_context = trace.set_span_in_context(otel_span)
+        t = start
+        for stage, duration in span["stages"].items():
+            end = t + int(duration * 1e9)
+            self.tracer.start_span(f"{span['name']}.{stage}", context=child_context,
+                                   start_time=t).end(end_time=end)
+            t = end
+        otel_span.end(end_time=start + int(span["duration"] * 1e9))
+
+    def close(self):
+        pass
+
+
+class MessageTracer:
+    """ decides which messages are traced and hands finished spans to a sink
+
+    Arguments:
+        sink: JSONLSink, OpenTelemetrySink, anything with .export(span) or a plain callable
+        sample_rate: fraction of new traces started, messages that already carry
+                     a traceparent are always traced
+    """
+
+    def __init__(self, sink: Union[Callable, JSONLSink, OpenTelemetrySink], sample_rate: float = 1.0):
+        self.sink = sink if hasattr(sink, "export") else CallbackSink(sink)
+        self.sample_rate = sample_rate
+
+    def _start(self, message: HiveMessage, name: str, start: float) -> Optional[dict]:
+        parent = parse_traceparent(get_traceparent(message))
+        if parent is None and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        trace_id, parent_id = parent or (_new_id(16), None)
+        span = {"trace_id": trace_id,
+                "span_id": _new_id(8),
+                "parent_span_id": parent_id,
+                "name": name,
+                # wall clock for exporters, perf_counter for the stage durations
+                "start": time.time() - (time.perf_counter() - start),
+                "_t0": start,
+                "stages": {}}
+        if message.msg_type not in _NO_PROPAGATION:
+            # replies created by Message.reply/response keep the context, continuing the trace
+            set_traceparent(message, make_traceparent(trace_id, span["span_id"]))
+        return span
+
+    def outgoing(self, message: HiveMessage) -> Optional[dict]:
+        """ called before a message is sent, None if it is not traced """
+        return self._start(message, "hivemind.send", time.perf_counter())
+
+    def incoming(self, message: HiveMessage, start: float) -> Optional[dict]:
+        """ called once a received message is decoded, before dispatch """
+        return self._start(message, "hivemind.receive", start)
+
+    def finish(self, span: dict, message: HiveMessage):
+        span["duration"] = time.perf_counter() - span.pop("_t0")
+        span["msg_type"] = type_label(message.msg_type)
+        span["payload_type"] = payload_type(message)
+        try:
+            self.sink.export(span)
+        except Exception as e:
+            LOG.error(f"failed to export trace span: {e}")
+
+    def close(self):
+        self.sink.close()
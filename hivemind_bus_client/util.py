@@ -2,6 +2,7 @@ import json
 import zlib
 from binascii import hexlify
 from binascii import unhexlify
+from copy import copy
 
 from ovos_utils.security import encrypt, decrypt, AES
 
@@ -23,6 +24,20 @@ def serialize_message(message):
         return json.dumps(message.__dict__)
 
 
+def peek_msg_type(raw: str):
+    """ cheaply read the message type from a serialized ovos Message
+
+    Message.serialize always writes "type" as the first key, this avoids
+    a full json.loads when only the type is needed.
+    returns None if the type can not be read without parsing"""
+    if not raw.startswith('{"type": "'):
+        return None
+    end = raw.find('"', 10)
+    if end == -1 or "\\" in raw[10:end]:
+        return None
+    return raw[10:end]
+
+
 def payload2dict(payload):
     """helper to ensure all subobjects of a payload are a dict safe for serialization
     eg. ensure payload is valid to send over mycroft messagebus object """
@@ -101,6 +116,78 @@ def get_mycroft_msg(pload):
     return pload
 
 
+CORRELATION_KEY = "correlation_id"
+
+
+def _innermost_payload(message):
+    """ unwrap nested hivemind messages (CASCADE/QUERY/BROADCAST...)
+    down to the dict of the innermost payload """
+    pload = message
+    while True:
+        if isinstance(pload, HiveMessage):
+            pload = pload._payload
+        elif isinstance(pload, dict) and "msg_type" in pload and "payload" in pload:
+            pload = pload["payload"]
+        else:
+            return pload
+
+
+def _copy_innermost(message: HiveMessage) -> HiveMessage:
+    """ shallow copy of message with every payload down to the innermost one
+    copied too, including its context, so tagging or injecting context into
+    the copy never touches the caller's objects """
+    message = copy(message)
+    parent, pload = message, message._payload
+    while True:
+        if isinstance(pload, HiveMessage):
+            pload = copy(pload)
+        elif isinstance(pload, Message):
+            pload = Message(pload.msg_type, pload.data, dict(pload.context))
+        elif isinstance(pload, dict):
+            pload = dict(pload)
+            if "type" in pload:
+                pload["context"] = dict(pload.get("context") or {})
+        if isinstance(parent, HiveMessage):
+            parent._payload = pload
+        else:
+            parent["payload"] = pload
+        if isinstance(pload, HiveMessage):
+            parent, pload = pload, pload._payload
+        elif isinstance(pload, dict) and "msg_type" in pload and "payload" in pload:
+            parent, pload = pload, pload["payload"]
+        else:
+            return message
+
+
+def set_correlation_id(message, correlation_id: str):
+    """ tag a message so responses to it can be matched
+
+    for mycroft payloads the id goes in message.context,
+    so it survives Message.reply / Message.response"""
+    pload = _innermost_payload(message)
+    if isinstance(pload, Message):
+        pload.context[CORRELATION_KEY] = correlation_id
+    elif isinstance(pload, dict):
+        if "type" in pload:
+            # copy, context may be shared with the caller's Message object
+            pload["context"] = dict(pload.get("context") or {},
+                                    **{CORRELATION_KEY: correlation_id})
+        else:
+            pload[CORRELATION_KEY] = correlation_id
+    return message
+
+
+def get_correlation_id(message):
+    pload = _innermost_payload(message)
+    if isinstance(pload, Message):
+        return pload.context.get(CORRELATION_KEY)
+    if isinstance(pload, dict):
+        if "type" in pload:
+            return (pload.get("context") or {}).get(CORRELATION_KEY)
+        return pload.get(CORRELATION_KEY)
+    return None
+
+
 def encrypt_as_json(key, data):
     if isinstance(data, dict):
         data = json.dumps(data)
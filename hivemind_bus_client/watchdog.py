@@ -0,0 +1,160 @@
+"""per handler timing and a watchdog for handlers that block the dispatch thread
+
+handlers run inline on the thread that received the message, a slow
+skill callback stalls the whole hive link, every handler registered
+through HiveMessageBusClient.on / on_mycroft and the decorators is
+timed (aggregated by handler qualname and message type) and an optional
+watchdog thread logs the stack of handlers running for too long
+"""
+import sys
+import threading
+import time
+import traceback
+from functools import wraps
+from threading import Event, Thread
+from typing import Callable, List, Optional
+
+from ovos_utils.log import LOG
+
+from hivemind_bus_client.metrics import MetricsRegistry, type_label
+
+
+def handler_name(func) -> str:
+    name = getattr(func, "__qualname__", None) or type(func).__qualname__
+    module = getattr(func, "__module__", None)
+    return f"{module}.{name}" if module else name
+
+
+def _outermost(entry: tuple) -> tuple:
+    while entry[3] is not None:
+        entry = entry[3]
+    return entry
+
+
+class HandlerMonitor:
+    """ times message handlers, results are exported with the client metrics
+
+    Arguments:
+        metrics: registry the instruments are added to
+        threshold: seconds a handler may run before the watchdog complains
+    """
+
+    def __init__(self, metrics: MetricsRegistry, threshold: float = 1.0):
+        self.threshold = threshold
+        self.durations = metrics.histogram("hivemind_handler_seconds",
+                                           "time spent in message handlers",
+                                           ("handler", "msg_type"))
+        self.stalls = metrics.counter("hivemind_handler_stalls_total",
+                                      "handlers that ran longer than the watchdog threshold",
+                                      ("handler", "msg_type"))
+        # thread id -> (handler, msg_type, start, entry it interrupted), nested
+        # handlers (a handler emitting a message) push onto the chain
+        self._running = {}
+        self._watchdog: Optional["_Watchdog"] = None
+
+    def wrap(self, func: Callable, msg_type) -> Callable:
+        """ timed version of func, the original is available as wrapper.__wrapped__ """
+        name = handler_name(func)
+        msg_type = type_label(msg_type)
+        running = self._running
+        observe = self.durations.observe
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            ident = threading.get_ident()
+            parent = running.get(ident)
+            start = time.perf_counter()
+            running[ident] = (name, msg_type, start, parent)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start, name, msg_type)
+                if parent is None:
+                    running.pop(ident, None)
+                else:
+                    running[ident] = parent
+
+        return timed
+
+    def top(self, n: int = 10, by: str = "total") -> List[dict]:
+        """ the handlers costing the most, by "total", "avg" or "p99" seconds """
+        stats = []
+        for (name, msg_type), (counts, total, count) in self.durations.collect().items():
+            stats.append({"handler": name, "msg_type": msg_type, "calls": count,
+                          "total": total, "avg": total / count if count else 0,
+                          "p99": self.durations.quantile(counts, count, 0.99) or 0})
+        stats.sort(key=lambda s: s[by], reverse=True)
+        return stats[:n]
+
+    def running(self) -> List[dict]:
+        """ handlers currently executing, innermost first """
+        now = time.perf_counter()
+        result = []
+        for ident, entry in list(self._running.items()):
+            while entry is not None:
+                name, msg_type, start, entry = entry
+                result.append({"thread": ident, "handler": name,
+                               "msg_type": msg_type, "elapsed": now - start})
+        return result
+
+    # watchdog
+    def start_watchdog(self, threshold: Optional[float] = None,
+                       interval: Optional[float] = None):
+        """ check for stalled handlers in a background thread,
+        by default every threshold / 2 seconds """
+        self.stop_watchdog()
+        if threshold is not None:
+            self.threshold = threshold
+        self._watchdog = _Watchdog(self, interval or self.threshold / 2)
+        self._watchdog.start()
+
+    def stop_watchdog(self):
+        if self._watchdog is not None:
+            self._watchdog.stop()
+            self._watchdog = None
+
+    def check(self, _warned=None) -> list:
+        """ warn about handlers running longer than threshold, returns them """
+        warned = _warned if _warned is not None else set()
+        stalled = []
+        now = time.perf_counter()
+        frames = None
+        # only the outermost handler of each thread is reported,
+        # nested handlers are part of its stack anyway
+        outermost = {ident: _outermost(entry) for ident, entry in list(self._running.items())}
+        for ident, entry in outermost.items():
+            name, msg_type, start, _ = entry
+            elapsed = now - start
+            if elapsed < self.threshold or (ident, start) in warned:
+                continue
+            warned.add((ident, start))
+            if frames is None:
+                frames = sys._current_frames()
+            stack = "".join(traceback.format_stack(frames[ident])) if ident in frames else ""
+            self.stalls.inc(name, msg_type)
+            LOG.warning(f"handler {name} for '{msg_type}' is blocking its thread for "
+                        f"{elapsed:.2f}s\n{stack}")
+            stalled.append({"thread": ident, "handler": name, "msg_type": msg_type,
+                            "elapsed": elapsed, "stack": stack})
+        # forget finished handlers
+        warned.intersection_update({(ident, e[2]) for ident, e in outermost.items()})
+        return stalled
+
+
+class _Watchdog(Thread):
+    def __init__(self, monitor: HandlerMonitor, interval: float):
+        super().__init__(daemon=True)
+        self.monitor = monitor
+        self.interval = interval
+        self._stop_event = Event()
+        self._warned = set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.monitor.check(self._warned)
+            except Exception as e:
+                LOG.error(f"handler watchdog failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,139 @@
+import json
+import time
+import unittest
+from threading import Lock, Thread
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.batch import BatchSender, parse_line
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.util import get_correlation_id
+
+
+class _StubBus:
+    """ records what is emitted, optionally answers like a master would """
+
+    def __init__(self, reply_types=(), delay=0.0, fail_on=()):
+        self.reply_types = reply_types  # ovos types to reply with, in order
+        self.delay = delay
+        self.fail_on = fail_on  # ovos message types that fail to send
+        self.emitted = []
+        self.handlers = {}
+        self.sender = None
+        self.max_in_flight = 0
+        self._lock = Lock()
+
+    def on(self, msg_type, func):
+        self.handlers.setdefault(msg_type, []).append(func)
+
+    def remove(self, msg_type, func):
+        self.handlers[msg_type].remove(func)
+
+    def emit(self, message: HiveMessage):
+        if message.payload.msg_type in self.fail_on:
+            raise ConnectionError("socket closed")
+        with self._lock:
+            self.emitted.append(message)
+            if self.sender is not None:
+                self.max_in_flight = max(self.max_in_flight, len(self.sender._pending))
+        if self.reply_types:
+            Thread(target=self._reply, args=(message,), daemon=True).start()
+
+    def _reply(self, message: HiveMessage):
+        time.sleep(self.delay)
+        for reply_type in self.reply_types:
+            reply = HiveMessage(HiveMessageType.BUS, payload=message.payload.reply(reply_type))
+            for func in list(self.handlers.get(HiveMessageType.BUS, [])):
+                func(reply)
+
+
+def _lines(n, msg_type="speak"):
+    return [json.dumps({"type": msg_type, "data": {"i": i}}) for i in range(n)]
+
+
+class TestParseLine(unittest.TestCase):
+    def test_ovos_message(self):
+        message = parse_line('{"type": "speak", "data": {"utterance": "hi"}}')
+        self.assertEqual(message.msg_type, HiveMessageType.BUS)
+        self.assertEqual(message.payload.msg_type, "speak")
+        self.assertEqual(message.payload.data, {"utterance": "hi"})
+        self.assertEqual(message.payload.context, {})
+
+    def test_hive_message(self):
+        message = parse_line('{"msg_type": "escalate", "payload": {"type": "speak", "data": {}}}')
+        self.assertEqual(message.msg_type, HiveMessageType.ESCALATE)
+
+    def test_invalid(self):
+        for line in ("[1, 2]", '{"data": {}}', "not json"):
+            with self.assertRaises(ValueError):
+                parse_line(line)
+
+
+class TestBatchSender(unittest.TestCase):
+    def test_fire_and_forget(self):
+        bus = _StubBus()
+        lines = _lines(3) + ["", "garbage"] + _lines(2)
+        report = BatchSender(bus).run(lines)
+        self.assertEqual(report["sent_total"], 5)
+        self.assertEqual(report["sent"], {"bus": 5})
+        self.assertEqual(report["errors"], {"parse": 1})
+        self.assertEqual(report["failures"][0][0], 5)  # line numbers count blank lines
+        self.assertEqual(bus.handlers, {})
+
+    def test_window(self):
+        bus = _StubBus(reply_types=("speak.reply",), delay=0.02)
+        replies = []
+        sender = BatchSender(bus, window=4, wait_replies=True, reply_timeout=5,
+                             on_reply=lambda lineno, *args: replies.append(lineno))
+        bus.sender = sender
+        report = sender.run(_lines(20))
+        self.assertEqual(report["sent_total"], 20)
+        self.assertEqual(report["replies"], 20)
+        self.assertEqual(report["errors"], {})
+        self.assertEqual(sorted(replies), list(range(1, 21)))
+        self.assertLessEqual(bus.max_in_flight, 4)
+        self.assertGreater(bus.max_in_flight, 1)  # actually pipelined
+        # every request got its own correlation id
+        ids = {get_correlation_id(m) for m in bus.emitted}
+        self.assertEqual(len(ids), 20)
+        self.assertEqual(bus.handlers, {t: [] for t in bus.handlers})  # handlers removed
+
+    def test_reply_type(self):
+        bus = _StubBus(reply_types=("other", "speak.reply", "speak.reply"))
+        types = []
+        sender = BatchSender(bus, window=2, wait_replies=True, reply_type="speak.reply",
+                             on_reply=lambda lineno, request, reply, rtt: types.append(reply.payload.msg_type))
+        report = sender.run(_lines(3))
+        self.assertEqual(report["replies"], 3)  # one per request, the second reply is ignored
+        self.assertEqual(types, ["speak.reply"] * 3)
+
+    def test_timeouts_free_the_window(self):
+        bus = _StubBus()  # never answers
+        sender = BatchSender(bus, window=2, wait_replies=True, reply_timeout=0.1)
+        start = time.monotonic()
+        report = sender.run(_lines(5))
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(report["sent_total"], 5)
+        self.assertEqual(report["replies"], 0)
+        self.assertEqual(report["errors"], {"timeout": 5})
+        self.assertEqual(sender._pending, {})
+
+    def test_send_failure_frees_the_slot(self):
+        bus = _StubBus(reply_types=("speak.reply",), fail_on=("broken",))
+        sender = BatchSender(bus, window=1, wait_replies=True, reply_timeout=30)
+        lines = _lines(1, "broken") + _lines(2) + _lines(1, "broken") + _lines(1)
+        start = time.monotonic()
+        report = sender.run(lines)
+        self.assertLess(time.monotonic() - start, 3)  # did not wait for the reply timeout
+        self.assertEqual(report["sent_total"], 3)
+        self.assertEqual(report["replies"], 3)
+        self.assertEqual(report["errors"], {"send": 2})
+        self.assertEqual([lineno for lineno, _ in report["failures"]], [1, 4])
+
+    def test_window_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            BatchSender(_StubBus(), window=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.capture import TrafficCapture, CaptureReader, IN, OUT, KIND_DECODED
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.packing import unpack
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "traffic.hmcap")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, n=3):
+        capture = TrafficCapture(self.path)
+        for i in range(n):
+            capture.record(OUT, HiveMessage(HiveMessageType.BUS, Message("speak", {"i": i})))
+            capture.record(IN, HiveMessage(HiveMessageType.PING, {"pong": True}))
+        capture.close()
+
+    def _read(self):
+        reader = CaptureReader(self.path)
+        try:
+            return list(reader)
+        finally:
+            reader.close()
+
+    def test_roundtrip(self):
+        self._write()
+        frames = self._read()
+        self.assertEqual(len(frames), 6)
+        self.assertEqual([f.msg_type for f in frames[:2]], ["bus", "ping"])
+        self.assertEqual(frames[0].kind, KIND_DECODED)
+        self.assertEqual(unpack(frames[4].data)["payload"]["data"], {"i": 2})
+
+    def test_index_behind_data(self):
+        self._write()
+        with open(self.path + ".idx", "r+b") as f:
+            f.truncate(os.path.getsize(self.path + ".idx") // 2)
+        self.assertEqual(len(self._read()), 6)
+
+    def test_index_ahead_of_data(self):
+        self._write()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) // 2)
+        frames = self._read()
+        self.assertLess(len(frames), 6)
+        self.assertEqual(frames[0].msg_type, "bus")
+
+    def test_index_missing(self):
+        self._write()
+        os.remove(self.path + ".idx")
+        self.assertEqual(len(self._read()), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
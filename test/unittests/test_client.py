@@ -0,0 +1,74 @@
+import time
+import unittest
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.client import HiveMessageBusClient, HiveResponseCollector
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+
+class TestHandlers(unittest.TestCase):
+    def setUp(self):
+        self.bus = HiveMessageBusClient("key", password="correct horse battery staple zebra")
+
+    def listeners(self, event_name):
+        if event_name in list(HiveMessageType):
+            return self.bus.emitter.listeners(event_name)
+        return self.bus.internal_bus.ee.listeners(event_name)
+
+    def test_remove_handler_registered_for_several_events(self):
+        calls = []
+
+        def handler(message):
+            calls.append(message)
+
+        self.bus.on(HiveMessageType.BROADCAST, handler)
+        self.bus.on(HiveMessageType.PROPAGATE, handler)
+        self.bus.on("speak", handler)
+        self.bus.remove(HiveMessageType.BROADCAST, handler)
+        self.assertEqual(len(self.listeners(HiveMessageType.BROADCAST)), 0)
+        self.assertEqual(len(self.listeners(HiveMessageType.PROPAGATE)), 1)
+        self.assertEqual(len(self.listeners("speak")), 1)
+
+        self.bus.emitter.emit(HiveMessageType.PROPAGATE, HiveMessage(HiveMessageType.PROPAGATE, {}))
+        self.assertEqual(len(calls), 1)
+
+        self.bus.remove("propagate", handler)  # value works too
+        self.bus.remove("speak", handler)
+        self.assertEqual(len(self.listeners(HiveMessageType.PROPAGATE)), 0)
+        self.assertEqual(len(self.listeners("speak")), 0)
+        self.assertFalse([key for key in self.bus._timed_funcs if key[1] is handler])
+
+    def test_remove_unknown_handler(self):
+        self.bus.remove(HiveMessageType.BUS, print)
+        self.bus.remove("speak", print)
+
+    def test_collector_removes_its_handlers(self):
+        types = (HiveMessageType.BUS, HiveMessageType.CASCADE, HiveMessageType.QUERY)
+        collector = HiveResponseCollector(self.bus, "cid")
+        for msg_type in types:
+            self.assertEqual(len(self.listeners(msg_type)), 1)
+        collector.shutdown()
+        for msg_type in types:
+            self.assertEqual(len(self.listeners(msg_type)), 0)
+        self.assertEqual(self.bus._collectors, set())
+
+    def test_collector_timeout_removes_its_handlers(self):
+        HiveResponseCollector(self.bus, "cid", timeout=0.05)
+        deadline = time.monotonic() + 2
+        while self.bus._collectors and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.listeners(HiveMessageType.CASCADE)), 0)
+
+    def test_collector_max_responses(self):
+        collector = HiveResponseCollector(self.bus, "cid", max_responses=2)
+        for i in range(3):
+            message = HiveMessage(HiveMessageType.CASCADE, Message("speak", {"i": i},
+                                                                   {"correlation_id": "cid"}))
+            self.bus.emitter.emit(HiveMessageType.CASCADE, message)
+        self.assertEqual(len(list(collector)), 2)
+        self.assertEqual(len(self.listeners(HiveMessageType.CASCADE)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import socket
+import tempfile
+import unittest
+from threading import Event
+from types import SimpleNamespace
+
+from hivemind_bus_client.daemon import HiveClientDaemon, DaemonError, daemon_request
+from hivemind_bus_client.scripts import _via_daemon
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "unix sockets not supported")
+class TestDaemonSocket(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "hivemind-client.sock")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_no_daemon(self):
+        self.assertIsNone(daemon_request({"op": "status"}, self.path))
+
+    def test_status(self):
+        bus = SimpleNamespace(handshake_event=Event())
+        with HiveClientDaemon(bus, self.path):
+            self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+            response = daemon_request({"op": "status"}, self.path)
+            self.assertTrue(response["ok"])
+            self.assertFalse(response["connected"])
+
+    def test_refuses_regular_files(self):
+        with open(self.path, "w"):
+            pass
+        with self.assertRaises(DaemonError):
+            daemon_request({"op": "status"}, self.path)
+
+    def test_refuses_symlinks(self):
+        bus = SimpleNamespace(handshake_event=Event())
+        link = os.path.join(self.tmp.name, "link.sock")
+        with HiveClientDaemon(bus, self.path):
+            os.symlink(self.path, link)
+            with self.assertRaises(DaemonError):
+                daemon_request({"op": "status"}, link)
+
+    def test_cli_falls_back_to_a_direct_connection(self):
+        os.environ["HIVEMIND_CLIENT_SOCKET"] = self.path
+        self.addCleanup(os.environ.pop, "HIVEMIND_CLIENT_SOCKET")
+        self.assertFalse(_via_daemon(False, (), "bus", "speak", "{}"))  # no daemon
+        # daemon running but not connected to the master
+        bus = SimpleNamespace(handshake_event=Event())
+        with HiveClientDaemon(bus, self.path, handshake_timeout=0.05):
+            with self.assertRaises(DaemonError):
+                daemon_request({"op": "emit", "msg_type": "bus", "payload": {}}, self.path)
+            self.assertFalse(_via_daemon(False, (), "bus", "speak", "{}"))
+        # refused socket path
+        with open(self.path, "w"):
+            pass
+        self.assertFalse(_via_daemon(False, (), "bus", "speak", "{}"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import time
+import unittest
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.dedup import SeenMessagesCache, BloomSeenFilter, message_key
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+
+def _propagate(utterance="hello", **kwargs):
+    inner = HiveMessage(HiveMessageType.BUS, Message("speak", {"utterance": utterance}))
+    return HiveMessage(HiveMessageType.PROPAGATE, inner, **kwargs)
+
+
+class TestMessageKey(unittest.TestCase):
+    def test_msg_id(self):
+        self.assertEqual(message_key(_propagate(meta={"msg_id": "abc"})), "abc")
+        self.assertIsNone(message_key(_propagate(), hash_payload=False))
+
+    def test_route_is_not_part_of_the_hash(self):
+        a = _propagate(route=[{"source": "a", "targets": ["b"]}])
+        b = _propagate(route=[{"source": "c", "targets": ["d"]}])
+        self.assertEqual(message_key(a), message_key(b))
+        self.assertNotEqual(message_key(a), message_key(_propagate("bye")))
+
+
+class TestSeenMessagesCache(unittest.TestCase):
+    def test_duplicates_are_counted(self):
+        cache = SeenMessagesCache()
+        self.assertFalse(cache.check_and_add("a"))
+        self.assertTrue(cache.check_and_add("a"))
+        self.assertTrue(cache.check_and_add("a"))
+        self.assertFalse(cache.check_and_add("b"))
+        self.assertEqual(cache.as_dict(), {"checked": 4, "suppressed": 2, "size": 2})
+
+    def test_lru_eviction(self):
+        cache = SeenMessagesCache(max_size=2)
+        cache.check_and_add("a")
+        cache.check_and_add("b")
+        cache.check_and_add("a")  # a is now the most recent
+        cache.check_and_add("c")  # evicts b
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.check_and_add("a"))
+        self.assertFalse(cache.check_and_add("b"))
+
+    def test_ttl(self):
+        cache = SeenMessagesCache(ttl=0.05)
+        cache.check_and_add("a")
+        self.assertTrue(cache.check_and_add("a"))
+        time.sleep(0.1)
+        self.assertFalse(cache.check_and_add("a"))
+
+    def test_messages_without_id(self):
+        self.assertFalse(SeenMessagesCache().is_duplicate(_propagate()))
+        self.assertFalse(SeenMessagesCache().is_duplicate(_propagate()))
+        cache = SeenMessagesCache(hash_payloads=True)
+        self.assertFalse(cache.is_duplicate(_propagate()))
+        self.assertTrue(cache.is_duplicate(_propagate()))
+        cache = SeenMessagesCache()
+        self.assertFalse(cache.is_duplicate(_propagate(meta={"msg_id": "x"})))
+        self.assertTrue(cache.is_duplicate(_propagate("other", meta={"msg_id": "x"})))
+
+
+class TestBloomSeenFilter(unittest.TestCase):
+    def test_duplicates(self):
+        bloom = BloomSeenFilter(capacity=1000, error_rate=0.001)
+        keys = [f"key-{i}" for i in range(500)]
+        self.assertFalse(any(bloom.check_and_add(k) for k in keys))
+        self.assertTrue(all(bloom.check_and_add(k) for k in keys))
+        self.assertEqual(bloom.suppressed, 500)
+
+    def test_rotation(self):
+        bloom = BloomSeenFilter(capacity=100, ttl=0.05)
+        bloom.check_and_add("a")
+        time.sleep(0.07)
+        self.assertTrue(bloom.check_and_add("a"))  # in the previous filter, re-added
+        time.sleep(0.07)
+        bloom.check_and_add("b")  # rotates, "a" is in previous
+        time.sleep(0.07)
+        bloom.check_and_add("c")  # rotates again, "a" is gone
+        self.assertFalse(bloom.check_and_add("a"))
+
+
+class TestClientDedup(unittest.TestCase):
+    def test_duplicate_propagate_is_dropped(self):
+        bus = HiveMessageBusClient("key", password="correct horse battery staple zebra",
+                                   seen_cache=SeenMessagesCache(hash_payloads=True))
+        handled, raw = [], []
+        bus.on(HiveMessageType.PROPAGATE, handled.append)
+        bus.emitter.on("message", raw.append)
+        frame = json.dumps(_propagate().as_dict)
+        bus.on_message(frame)
+        bus.on_message(frame)
+        bus.on_message(json.dumps(_propagate("bye").as_dict))
+        self.assertEqual(len(handled), 2)
+        self.assertEqual(len(raw), 2)
+        self.assertEqual(bus.seen_cache.suppressed, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
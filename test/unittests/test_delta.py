@@ -0,0 +1,82 @@
+import unittest
+
+from hivemind_bus_client.delta import ContextDeltaCodec, CONTEXT_DELTA_KEY
+
+
+def _context(**kwargs):
+    ctxt = {"source": "skills", "destination": ["master"], "site_id": "kitchen",
+            "platform": "linux", "peer": "node", "skill_id": "weather",
+            "session": {"session_id": "default", "lang": "en-us", "active_skills": []}}
+    ctxt.update(kwargs)
+    return ctxt
+
+
+class TestContextDelta(unittest.TestCase):
+    def setUp(self):
+        self.tx = ContextDeltaCodec(keyframe_interval=3)
+        self.rx = ContextDeltaCodec()
+
+    def roundtrip(self, context):
+        wire = self.tx.encode(context)
+        return wire, self.rx.decode(wire)
+
+    def test_keyframe_then_deltas(self):
+        wire, decoded = self.roundtrip(_context())
+        self.assertTrue(wire[CONTEXT_DELTA_KEY]["base"])
+        self.assertEqual(decoded, _context())
+
+        changed = _context(lang="pt-pt")
+        changed["session"]["lang"] = "pt-pt"
+        del changed["site_id"]
+        wire, decoded = self.roundtrip(changed)
+        self.assertEqual(list(wire), [CONTEXT_DELTA_KEY])  # only the delta is sent
+        delta = wire[CONTEXT_DELTA_KEY]
+        self.assertEqual(delta["set"], {"lang": "pt-pt"})
+        self.assertEqual(delta["patch"], {"session": {"set": {"lang": "pt-pt"}}})
+        self.assertEqual(delta["del"], ["site_id"])
+        self.assertEqual(decoded, changed)
+
+    def test_deltas_are_relative_to_the_baseline(self):
+        self.roundtrip(_context())
+        self.tx.encode(_context(skill_id="lost"))  # never reaches rx
+        wire, decoded = self.roundtrip(_context(lang="de-de"))
+        self.assertEqual(decoded, _context(lang="de-de"))
+
+    def test_new_baseline_version(self):
+        wire, _ = self.roundtrip(_context())
+        v1 = wire[CONTEXT_DELTA_KEY]["v"]
+        for i in range(3):
+            self.roundtrip(_context(n=i))
+        wire, decoded = self.roundtrip(_context(site_id="garage"))
+        self.assertTrue(wire[CONTEXT_DELTA_KEY]["base"])  # keyframe_interval reached
+        self.assertEqual(wire[CONTEXT_DELTA_KEY]["v"], v1 + 1)
+        self.assertEqual(decoded, _context(site_id="garage"))
+        wire, decoded = self.roundtrip(_context(site_id="garage", lang="en-gb"))
+        self.assertEqual(wire[CONTEXT_DELTA_KEY]["v"], v1 + 1)
+        self.assertEqual(decoded, _context(site_id="garage", lang="en-gb"))
+
+    def test_delta_for_unknown_baseline(self):
+        self.tx.encode(_context())  # keyframe lost
+        wire = self.tx.encode(_context(lang="fr-fr"))
+        self.assertEqual(self.rx.decode(wire), {"lang": "fr-fr"})
+        self.assertEqual(self.rx.desyncs, 1)
+
+    def test_decoded_context_does_not_share_the_baseline(self):
+        self.roundtrip(_context())
+        _, decoded = self.roundtrip(_context(lang="it-it"))
+        decoded["session"]["session_id"] = "mutated"
+        _, decoded = self.roundtrip(_context(lang="it-it"))
+        self.assertEqual(decoded["session"]["session_id"], "default")
+
+    def test_plain_context_passes_through(self):
+        self.assertEqual(self.rx.decode(_context()), _context())
+
+    def test_big_changes_send_a_keyframe(self):
+        self.roundtrip(_context())
+        wire, decoded = self.roundtrip({"completely": "different"})
+        self.assertTrue(wire[CONTEXT_DELTA_KEY]["base"])
+        self.assertEqual(decoded, {"completely": "different"})
+
+
+if __name__ == "__main__":
+    unittest.main()
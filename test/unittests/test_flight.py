@@ -0,0 +1,37 @@
+import unittest
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.capture import IN, OUT
+from hivemind_bus_client.flight import FlightRecorder
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+
+def _record(recorder, i):
+    message = HiveMessage(HiveMessageType.BUS, Message(f"msg.{i}"))
+    recorder.record(OUT if i % 2 else IN, message, i, (0.0, 0.0, 0.0))
+
+
+class TestFlightRecorder(unittest.TestCase):
+    def test_keeps_the_last_events_in_order(self):
+        recorder = FlightRecorder(size=4)
+        for i in range(3):
+            _record(recorder, i)
+        self.assertEqual([e["size"] for e in recorder.snapshot()], [0, 1, 2])
+        for i in range(3, 10):
+            _record(recorder, i)
+        self.assertEqual([e["payload_type"] for e in recorder.snapshot()],
+                         ["msg.6", "msg.7", "msg.8", "msg.9"])
+
+    def test_snapshot_does_not_lose_slots(self):
+        recorder = FlightRecorder(size=4)
+        for i in range(10):
+            _record(recorder, i)
+            recorder.snapshot()
+        events = recorder.snapshot()
+        self.assertEqual([e["size"] for e in events], [6, 7, 8, 9])
+        self.assertEqual([e["direction"] for e in events], ["in", "out", "in", "out"])
+
+
+if __name__ == "__main__":
+    unittest.main()
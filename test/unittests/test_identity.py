@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from threading import Event, Thread
+from unittest.mock import patch
+
+from hivemind_bus_client import identity
+from hivemind_bus_client.identity import NodeIdentity, get_handshake, preload_key
+
+
+class _FakeHandShake:
+    """ stands in for poorman_handshake.HandShake, parsing a real key is slow """
+    created = 0
+    release = None
+
+    def __init__(self, path):
+        if _FakeHandShake.release is not None:
+            _FakeHandShake.release.wait(5)
+        _FakeHandShake.created += 1
+        self.path = path
+        self.private_key = object()  # the "parsed" key
+
+
+class _FakeConfig(dict):
+    created = 0
+
+    def __init__(self, path):
+        super().__init__()
+        _FakeConfig.created += 1
+        self.path = path
+        self.reloads = 0
+
+    def reload(self):
+        self.reloads += 1
+
+
+class TestIdentityCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.key = os.path.join(self.tmp, "node.asc")
+        with open(self.key, "w") as f:
+            f.write("not really a key")
+        _FakeHandShake.created = 0
+        _FakeHandShake.release = None
+        _FakeConfig.created = 0
+        identity._keys.clear()
+        identity._identity_file = identity._identity_mtime = None
+        patcher = patch("poorman_handshake.HandShake", _FakeHandShake)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if _FakeHandShake.release is not None:
+            _FakeHandShake.release.set()
+        identity._keys.clear()
+        identity._identity_file = identity._identity_mtime = None
+        shutil.rmtree(self.tmp)
+
+    def touch(self, path):
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_key_is_parsed_once(self):
+        a, b = get_handshake(self.key, timeout=5), get_handshake(self.key, timeout=5)
+        self.assertEqual(_FakeHandShake.created, 1)
+        self.assertIsNot(a, b)  # every client gets its own copy
+        self.assertIs(a.private_key, b.private_key)
+
+    def test_key_is_reloaded_after_mtime_change(self):
+        first = get_handshake(self.key, timeout=5)
+        self.touch(self.key)
+        second = get_handshake(self.key, timeout=5)
+        self.assertEqual(_FakeHandShake.created, 2)
+        self.assertIsNot(first.private_key, second.private_key)
+        get_handshake(self.key, timeout=5)
+        self.assertEqual(_FakeHandShake.created, 2)
+
+    def test_get_handshake_waits_for_preload(self):
+        _FakeHandShake.release = Event()
+        entry = preload_key(self.key)
+        self.assertFalse(entry.ready.is_set())
+        self.assertIs(preload_key(self.key), entry)  # already loading, not started again
+        with self.assertRaises(TimeoutError):
+            get_handshake(self.key, timeout=0.05)
+
+        result = []
+        waiter = Thread(target=lambda: result.append(get_handshake(self.key, timeout=5)))
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(result, [])
+        _FakeHandShake.release.set()
+        waiter.join(5)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(_FakeHandShake.created, 1)
+
+    def test_load_errors_are_raised_and_retried(self):
+        with patch("poorman_handshake.HandShake", side_effect=ValueError("bad key")):
+            with self.assertRaises(ValueError):
+                get_handshake(self.key, timeout=5)
+        get_handshake(self.key, timeout=5)  # failed entries are not cached
+        self.assertEqual(_FakeHandShake.created, 1)
+
+    def test_identity_file_is_shared(self):
+        path = os.path.join(self.tmp, "_identity.json")
+        with open(path, "w") as f:
+            f.write("{}")
+        with patch("json_database.JsonConfigXDG", lambda *args, **kwargs: _FakeConfig(path)):
+            a, b = NodeIdentity(), NodeIdentity()
+            self.assertEqual(_FakeConfig.created, 1)
+            # each identity gets a copy, settings on one do not leak into the other
+            a.password = "secret"
+            self.assertIsNone(b.password)
+            self.assertEqual(identity._identity_file.reloads, 0)
+
+            self.touch(path)
+            NodeIdentity()
+            self.assertEqual(_FakeConfig.created, 1)
+            self.assertEqual(identity._identity_file.reloads, 1)
+
+    def test_preload(self):
+        node = NodeIdentity(_FakeConfig(os.path.join(self.tmp, "_identity.json")))
+        node.private_key = self.key
+        node.preload()
+        identity._keys[self.key].ready.wait(5)
+        self.assertEqual(_FakeHandShake.created, 1)
+        node.private_key = os.path.join(self.tmp, "missing.asc")
+        node.preload()  # nothing to parse yet, the key is generated on connect
+        self.assertNotIn(node.private_key, identity._keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import logging
+import os
+import time
+import unittest
+from typing import Tuple
+from unittest.mock import patch
+
+from ovos_bus_client.message import Message
+from ovos_utils.log import LOG
+
+from hivemind_bus_client import log as hotlog
+from hivemind_bus_client.log import HotLogger, Payload, get_logger, set_log_level
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+class _Counted:
+    """ counts how often it is rendered """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "counted"
+
+
+class TestHotLogger(unittest.TestCase):
+    def setUp(self):
+        self.saved_levels = dict(hotlog._levels)
+        hotlog._levels.clear()
+
+    def tearDown(self):
+        hotlog._levels.clear()
+        hotlog._levels.update(self.saved_levels)
+
+    def logger(self, **kwargs) -> Tuple[HotLogger, _ListHandler]:
+        logger = HotLogger("test", **kwargs)
+        handler = _ListHandler()
+        logger._logger = logging.Logger("hivemind-test")
+        logger._logger.addHandler(handler)
+        set_log_level("test", "DEBUG")
+        return logger, handler
+
+    def test_lazy_formatting(self):
+        logger, handler = self.logger()
+        arg = _Counted()
+        set_log_level("test", "INFO")
+        logger.debug("skipped %s", arg)
+        self.assertEqual(arg.calls, 0)
+        logger.info("written %s", arg)
+        self.assertEqual(arg.calls, 1)
+        self.assertEqual(handler.lines, ["written counted"])
+
+    def test_rate_limit_per_format_string(self):
+        logger, handler = self.logger(burst=2, interval=0.2)
+        arg = _Counted()
+        for i in range(5):
+            logger.info("message %s", arg)
+        logger.info("other %s", 1)
+        self.assertEqual(handler.lines, ["message counted", "message counted", "other 1"])
+        self.assertEqual(arg.calls, 2)  # suppressed lines are not formatted either
+
+        time.sleep(0.25)
+        logger.info("message %s", "again")
+        self.assertEqual(handler.lines[-1], "message again (3 similar lines suppressed)")
+        logger.info("message %s", "again")
+        self.assertEqual(handler.lines[-1], "message again")
+
+    def test_category_levels(self):
+        logger, handler = self.logger()
+        set_log_level("test", "WARNING")
+        self.assertFalse(logger.is_enabled(logging.INFO))
+        logger.info("hidden")
+        logger.warning("shown")
+        self.assertEqual(handler.lines, ["shown"])
+        # no category level, the ovos LOG level applies
+        set_log_level("test", None)
+        with patch.object(LOG, "level", "ERROR"):
+            self.assertEqual(logger.level, logging.ERROR)
+        with patch.object(LOG, "level", "DEBUG"):
+            self.assertTrue(logger.is_enabled(logging.DEBUG))
+
+    def test_levels_from_env(self):
+        env = {"HIVEMIND_LOG_LEVELS": "protocol=DEBUG, client = warning,broken,=INFO"}
+        with patch.dict(os.environ, env):
+            hotlog._load_env_levels()
+        self.assertEqual(hotlog._levels, {"protocol": logging.DEBUG, "client": logging.WARNING})
+        self.assertEqual(get_logger("client").level, logging.WARNING)
+
+    def test_get_logger_is_cached(self):
+        self.assertIs(get_logger("protocol"), get_logger("protocol"))
+
+
+class TestPayload(unittest.TestCase):
+    def test_truncation(self):
+        text = str(Payload("x" * 1000, limit=20))
+        self.assertEqual(len(text), 23)
+        self.assertTrue(text.endswith("..."))
+        self.assertEqual(str(Payload("short")), "'short'")
+        # big containers are abbreviated by reprlib before the limit applies
+        text = str(Payload({"items": list(range(1000))}, limit=10_000))
+        self.assertIn("...", text)
+        self.assertLess(len(text), 200)
+
+    def test_messages(self):
+        message = Message("speak", {"utterance": "hi"})
+        self.assertEqual(str(Payload(message)), "speak data={'utterance': 'hi'}")
+        text = str(Payload(HiveMessage(HiveMessageType.BUS, message)))
+        self.assertTrue(text.startswith("bus {"))
+        self.assertIn("'speak'", text)
+        self.assertEqual(str(Payload(b"12345")), "<5 bytes>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import time
+import unittest
+from threading import Event
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.message import HiveMessageType
+from hivemind_bus_client.mock import MockHiveMaster
+
+PASSWORD = "correct horse battery staple zebra"
+
+
+def _wait(condition, timeout=5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMockHiveMaster(unittest.TestCase):
+    """ the real client against the mock master, end to end over a local port """
+
+    def setUp(self):
+        self.master = None
+        self.client = None
+
+    def tearDown(self):
+        if self.client is not None:
+            self.client.close()
+        if self.master is not None:
+            self.master.stop()
+
+    def connect(self, **kwargs) -> HiveMessageBusClient:
+        self.master = MockHiveMaster(password=PASSWORD, **kwargs).start()
+        self.client = HiveMessageBusClient("key", password=PASSWORD,
+                                           host="ws://127.0.0.1", port=self.master.port)
+        self.client.connect()
+        self.assertTrue(self.client.handshake_event.wait(5))
+        return self.client
+
+    def test_password_handshake(self):
+        client = self.connect()
+        self.assertIsNotNone(client.crypto_key)
+        self.assertTrue(_wait(lambda: self.master.get_stats()["handshakes"] == 1))
+        self.assertEqual(self.master.errors, 0)
+
+    def test_echo(self):
+        client = self.connect(mode="echo")
+        received = []
+        done = Event()
+
+        def handler(message):
+            received.append(message)
+            if len(received) == 2:
+                done.set()
+
+        client.on_mycroft("speak", handler)
+        client.emit_mycroft(Message("speak", {"utterance": "hello"}, {"skill_id": "test"}))
+        # once from the local emit, once more when the master echoes it back
+        self.assertTrue(done.wait(5))
+        echo = received[1]
+        self.assertEqual(echo.data, {"utterance": "hello"})
+        self.assertEqual(echo.context["skill_id"], "test")
+        self.assertEqual(self.master.received["bus"], 1)
+        self.assertTrue(_wait(lambda: self.master.sent["bus"] == 1))
+
+    def test_scripted_response(self):
+        client = self.connect(mode="sink",
+                              responses={"weather.get": Message("weather.reply", {"temp": 21})})
+        reply = client.wait_for_payload_response(Message("weather.get"), "weather.reply",
+                                                 reply_type=HiveMessageType.BUS, timeout=5)
+        self.assertIsNotNone(reply)
+        self.assertEqual(reply.payload.data, {"temp": 21})
+
+    def test_sink(self):
+        client = self.connect(mode="sink")
+        client.emit_mycroft(Message("speak"))
+        self.assertTrue(_wait(lambda: self.master.received["bus"] == 1))
+        self.assertIsNone(client.wait_for_mycroft("speak", timeout=0.3))
+
+    def test_ping(self):
+        client = self.connect(mode="sink", latency=0.05)
+        rtt = client.ping(timeout=5)
+        self.assertIsNotNone(rtt)
+        self.assertGreaterEqual(rtt, 0.05)
+        stats = client.get_ping_stats()
+        self.assertEqual(stats["sent"], 1)
+        self.assertEqual(stats["lost"], 0)
+
+    def test_cascade(self):
+        def answers(message):
+            return [Message("skill.answer", {"node": n}) for n in ("a", "b")]
+
+        client = self.connect(mode="sink", responses={"skill.question": answers})
+        responses = list(client.cascade(Message("skill.question"), timeout=1))
+        self.assertEqual(sorted(r.payload.data["node"] for r in responses), ["a", "b"])
+        self.assertEqual(self.master.received["cascade"], 1)
+        # responses are correlated, a stray reply is not collected
+        collector = client.cascade(Message("skill.question"), timeout=1, max_responses=1)
+        self.master.send(Message("skill.answer", {"node": "stray"}))
+        self.assertEqual(len(list(collector)), 1)
+
+    def test_context_delta(self):
+        client = self.connect(mode="echo", context_delta=True)
+        self.assertIsNotNone(client.context_codec)
+        context = {"session": {"session_id": "s" * 100, "lang": "en-US"}, "source": "test"}
+        for i in range(3):
+            reply = client.wait_for_payload_response(Message("ctx.test", {"i": i}, dict(context)),
+                                                     "ctx.test", reply_type=HiveMessageType.BUS,
+                                                     timeout=5)
+            self.assertIsNotNone(reply)
+            self.assertEqual(reply.payload.data, {"i": i})
+            self.assertEqual(reply.payload.context["session"], context["session"])
+
+    def test_no_context_delta_unless_both_sides_support_it(self):
+        client = self.connect(mode="echo", context_delta=False)
+        self.assertIsNone(client.context_codec)
+
+
+if __name__ == "__main__":
+    unittest.main()
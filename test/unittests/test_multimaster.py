@@ -0,0 +1,119 @@
+import time
+import unittest
+
+from ovos_bus_client.message import Message
+from ovos_utils.fakebus import FakeBus
+
+from hivemind_bus_client.mock import MockHiveMaster
+from hivemind_bus_client.multimaster import HiveMultiMasterClient
+
+PASSWORD = "correct horse battery staple zebra"
+
+
+def _wait(condition, timeout=5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMultiMaster(unittest.TestCase):
+    def setUp(self):
+        self.masters = []
+        self.mm = None
+        self.bus = FakeBus()
+
+    def tearDown(self):
+        if self.mm is not None:
+            self.mm.close()
+        for master in self.masters:
+            master.stop()
+
+    def master(self, **kwargs) -> MockHiveMaster:
+        master = MockHiveMaster(password=PASSWORD, mode="sink", **kwargs).start()
+        self.masters.append(master)
+        return master
+
+    def connect(self, urls, **kwargs) -> HiveMultiMasterClient:
+        self.mm = HiveMultiMasterClient(urls, key="key", password=PASSWORD, **kwargs)
+        self.mm.connect(self.bus)
+        return self.mm
+
+    def received(self, master, msg_type="bus") -> int:
+        return master.received.get(msg_type, 0)
+
+    def test_priority(self):
+        a, b = self.master(), self.master()
+        mm = self.connect([f"127.0.0.1:{a.port}", f"127.0.0.1:{b.port}"])
+        self.assertTrue(_wait(lambda: all(link.healthy for link in mm.links)))
+        self.assertEqual(mm.active.port, a.port)
+        for i in range(5):
+            mm.emit_mycroft(Message("speak", {"i": i}))
+        self.assertTrue(_wait(lambda: self.received(a) == 5))
+        self.assertEqual(self.received(b), 0)
+
+    def test_weighted(self):
+        a, b = self.master(), self.master()
+        mm = self.connect([f"127.0.0.1:{a.port}?weight=1", f"127.0.0.1:{b.port}?weight=4"],
+                          strategy="weighted")
+        self.assertTrue(_wait(lambda: all(link.healthy for link in mm.links)))
+        for i in range(200):
+            mm.emit_mycroft(Message("speak", {"i": i}))
+        self.assertTrue(_wait(lambda: self.received(a) + self.received(b) == 200))
+        self.assertGreater(self.received(a), 0)
+        self.assertGreater(self.received(b), self.received(a) * 2)
+
+    def test_latency(self):
+        slow, fast = self.master(latency=0.1), self.master()
+        mm = self.connect([f"127.0.0.1:{slow.port}", f"127.0.0.1:{fast.port}"],
+                          strategy="latency", ping_interval=0.1)
+        self.assertTrue(_wait(lambda: all(link.srtt is not None for link in mm.links)))
+        self.assertIs(mm.select(), mm.links[1].client)
+        mm.emit_mycroft(Message("speak"))
+        self.assertTrue(_wait(lambda: self.received(fast) == 1))
+        self.assertEqual(self.received(slow), 0)
+
+    def test_failover(self):
+        a, b = self.master(), self.master()
+        switched = []
+        mm = self.connect([f"127.0.0.1:{a.port}", f"127.0.0.1:{b.port}"],
+                          on_failover=lambda old, new: switched.append(time.monotonic()))
+        self.assertTrue(_wait(lambda: all(link.healthy for link in mm.links)))
+        self.assertTrue(_wait(lambda: mm.active.port == a.port))
+        switched.clear()
+        failovers = mm.failovers
+        stopped = time.monotonic()
+        a.stop()
+        self.assertTrue(_wait(lambda: mm.active is not None and mm.active.port == b.port))
+        self.assertLess(switched[0] - stopped, 1.0)
+        self.assertEqual(mm.failovers, failovers + 1)
+        mm.emit_mycroft(Message("speak"))
+        self.assertTrue(_wait(lambda: self.received(b) == 1))
+
+    def test_unreachable_master_at_startup(self):
+        a = self.master()
+        mm = self.connect([f"127.0.0.1:{a.port}", "ws://127.0.0.1:1"], reconnect_delay=0.1)
+        self.assertTrue(_wait(lambda: mm.links[0].healthy))
+        self.assertFalse(mm.links[1].healthy)
+        self.assertEqual(len(self.bus.ee.listeners("hive.send.upstream")), 1)
+        start = time.monotonic()
+        self.bus.emit(Message("hive.send.upstream", {"msg_type": "bus",
+                                                     "payload": Message("speak").serialize()}))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertTrue(_wait(lambda: self.received(a) == 1))
+
+    def test_handle_send_goes_to_one_master(self):
+        a, b = self.master(), self.master()
+        mm = self.connect([f"127.0.0.1:{a.port}", f"127.0.0.1:{b.port}"])
+        self.assertTrue(_wait(lambda: all(link.healthy for link in mm.links)))
+        self.bus.emit(Message("hive.send.upstream", {"msg_type": "bus",
+                                                     "payload": Message("speak").serialize()}))
+        self.assertTrue(_wait(lambda: self.received(a) + self.received(b) == 1))
+        time.sleep(0.2)
+        self.assertEqual(self.received(a) + self.received(b), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
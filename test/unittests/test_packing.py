@@ -0,0 +1,80 @@
+import math
+import unittest
+from unittest.mock import patch
+
+from hivemind_bus_client import packing
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _pure_pack(value) -> bytes:
+    buf = bytearray()
+    packing._pack(buf, value)
+    return bytes(buf)
+
+
+def _pure_unpack(data: bytes):
+    value, pos = packing._unpack(data, 0)
+    assert pos == len(data)
+    return value
+
+
+VALUES = [None, True, False,
+          0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 64 - 1,
+          -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31, -2 ** 31 - 1, -2 ** 63,
+          0.0, 1.5, -2.25, 1e300, math.inf,
+          "", "a", "x" * 31, "x" * 32, "x" * 255, "x" * 256, "y" * 65536, "ünïcödé",
+          b"", b"\x00\xff", b"b" * 256, b"b" * 65536,
+          [], [1, "2", None], list(range(15)), list(range(16)), list(range(70000)),
+          {}, {"a": 1}, {str(i): i for i in range(15)}, {str(i): i for i in range(16)},
+          {"type": "speak", "data": {"utterance": "hi", "nested": [{"x": [1.5, None]}]},
+           "context": {"session": {"session_id": "default"}}}]
+
+
+class TestPurePythonPacker(unittest.TestCase):
+    def test_roundtrip(self):
+        for value in VALUES:
+            with self.subTest(value=repr(value)[:40]):
+                self.assertEqual(_pure_unpack(_pure_pack(value)), value)
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_identical_to_msgpack(self):
+        for value in VALUES:
+            with self.subTest(value=repr(value)[:40]):
+                expected = msgpack.packb(value, use_bin_type=True)
+                self.assertEqual(_pure_pack(value), expected)
+                self.assertEqual(_pure_unpack(expected), value)
+
+    def test_tuples_pack_as_arrays(self):
+        self.assertEqual(_pure_pack((1, 2)), _pure_pack([1, 2]))
+
+    def test_unpackable(self):
+        with self.assertRaises(packing.PackingError):
+            _pure_pack(object())
+        with self.assertRaises(packing.PackingError):
+            _pure_pack(2 ** 64)
+
+
+class TestPackingErrors(unittest.TestCase):
+    def check_errors(self):
+        for value in (object(), 2 ** 64, {1j: 1}):
+            with self.assertRaises(packing.PackingError):
+                packing.pack(value)
+        for data in (b"\x92\x01", b"\x01\x02", b"\xc1", b""):
+            with self.assertRaises(packing.PackingError):
+                packing.unpack(data)
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_msgpack_backend(self):
+        self.check_errors()
+
+    def test_pure_python_backend(self):
+        with patch.object(packing, "_msgpack", None):
+            self.check_errors()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import random
+import time
+import unittest
+from threading import Thread
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.policy import BusSharingPolicy, MessageTypeMatcher
+
+
+class TestMessageTypeMatcher(unittest.TestCase):
+    def test_patterns(self):
+        matcher = MessageTypeMatcher(["speak", "mycroft.audio.*", "gui.*.value.*"])
+        self.assertEqual(matcher.match("speak"), "speak")
+        self.assertIsNone(matcher.match("speak.extra"))
+        self.assertEqual(matcher.match("mycroft.audio.service.play"), "mycroft.audio.*")
+        self.assertIsNone(matcher.match("mycroft.audio"))
+        self.assertEqual(matcher.match("gui.page.value.set"), "gui.*.value.*")
+        self.assertIsNone(matcher.match("gui.page.show"))
+        self.assertIn("speak", matcher)
+        self.assertFalse(MessageTypeMatcher())
+
+    def test_priority(self):
+        matcher = MessageTypeMatcher(["a.*.c", "a.*", "a.b.*", "a.b.c"])
+        self.assertEqual(matcher.match("a.b.c"), "a.b.c")  # exact first
+        self.assertEqual(matcher.match("a.b.d"), "a.b.*")  # then the longest prefix
+        self.assertEqual(matcher.match("a.x.c"), "a.*")  # prefixes before globs
+        self.assertEqual(MessageTypeMatcher(["a.?.c"]).match("a.x.c"), "a.?.c")
+
+    def test_cached_results_stay_correct(self):
+        matcher = MessageTypeMatcher(["x.*"])
+        for _ in range(3):
+            self.assertEqual(matcher.match("x.y"), "x.*")
+            self.assertIsNone(matcher.match("y.x"))
+
+
+class TestBusSharingPolicy(unittest.TestCase):
+    def test_allow_everything_by_default(self):
+        policy = BusSharingPolicy()
+        message = Message("speak", {"utterance": "hi"})
+        self.assertIs(policy.filter(message), message)
+
+    def test_deny_takes_priority(self):
+        policy = BusSharingPolicy(allow=["mycroft.*", "speak"], deny=["mycroft.audio.*"])
+        self.assertTrue(policy.allows_type("speak"))
+        self.assertTrue(policy.allows_type("mycroft.skills.loaded"))
+        self.assertFalse(policy.allows_type("mycroft.audio.play"))
+        self.assertFalse(policy.allows_type("recognizer_loop:utterance"))
+        self.assertIsNone(policy.filter({"type": "mycroft.audio.play", "data": {}}))
+        self.assertEqual(policy.dropped, 1)
+
+    def test_runtime_changes(self):
+        policy = BusSharingPolicy()
+        policy.deny("gui.*")
+        self.assertFalse(policy.allows_type("gui.value.set"))
+        policy.remove_pattern("gui.*")
+        self.assertTrue(policy.allows_type("gui.value.set"))
+        policy.allow("speak")
+        self.assertFalse(policy.allows_type("gui.value.set"))
+
+    def test_rate_limit(self):
+        policy = BusSharingPolicy(rate_limits={"enclosure.*": 2})
+        shared = [policy.filter(Message("enclosure.eyes.blink")) for _ in range(5)]
+        self.assertEqual(sum(m is not None for m in shared), 2)
+        # buckets are per message type
+        self.assertIsNotNone(policy.filter(Message("enclosure.mouth.reset")))
+        self.assertIsNotNone(policy.filter(Message("speak")))
+        time.sleep(0.6)
+        self.assertIsNotNone(policy.filter(Message("enclosure.eyes.blink")))
+        policy.set_rate_limit("enclosure.*", None)
+        self.assertTrue(all(policy.filter(Message("enclosure.eyes.blink")) for _ in range(5)))
+
+    def test_rate_limit_across_threads(self):
+        policy = BusSharingPolicy(rate_limits={"ping": 10})
+        shared = []
+
+        def worker():
+            for _ in range(200):
+                if policy.filter({"type": "ping", "data": {}}) is not None:
+                    shared.append(1)
+
+        threads = [Thread(target=worker) for _ in range(8)]
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - start
+        self.assertLessEqual(len(shared), 10 + int(elapsed * 10) + 1)
+        self.assertEqual(len(shared) + policy.dropped, 1600)
+
+    def test_sampling(self):
+        random.seed(1)
+        policy = BusSharingPolicy(sampling={"mycroft.*": 0.25, "never": 0})
+        shared = sum(policy.filter(Message("mycroft.ready")) is not None for _ in range(2000))
+        self.assertAlmostEqual(shared / 2000, 0.25, delta=0.05)
+        self.assertIsNone(policy.filter(Message("never")))
+        policy.set_sampling("never", None)
+        self.assertIsNotNone(policy.filter(Message("never")))
+
+    def test_max_data_size(self):
+        policy = BusSharingPolicy(max_data_size=20)
+        data = {"small": "x", "big": "x" * 100}
+        shared = policy.filter(Message("speak", data, {"a": 1}))
+        self.assertEqual(shared.data, {"small": "x"})
+        self.assertEqual(shared.context, {"a": 1})
+        shared = policy.filter({"type": "speak", "data": data, "context": {}})
+        self.assertEqual(shared["data"], {"small": "x"})
+        self.assertEqual(data, {"small": "x", "big": "x" * 100})  # caller's data untouched
+        message = Message("speak", {"small": "x"})
+        self.assertIs(policy.filter(message), message)
+
+
+if __name__ == "__main__":
+    unittest.main()
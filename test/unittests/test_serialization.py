@@ -0,0 +1,138 @@
+import unittest
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.metrics import Counter
+from hivemind_bus_client.serialization import get_bitstring, decode_bitstring, \
+    HiveMindBinaryPayloadType
+
+
+def _frame(bitstr) -> bytes:
+    return bitstr if isinstance(bitstr, bytes) else bitstr.bytes
+
+
+def _roundtrip(hive_type, payload, proto_version, compressed, **kwargs) -> HiveMessage:
+    return decode_bitstring(_frame(get_bitstring(hive_type, payload, compressed=compressed,
+                                                 proto_version=proto_version,
+                                                 versioned=proto_version > 1, **kwargs)))
+
+
+class TestFrames(unittest.TestCase):
+    message = Message("speak", {"utterance": "hello " * 20, "n": 1, "ok": True},
+                      {"source": "a", "destination": ["b"], "session": {"session_id": "x"}})
+
+    def test_bus(self):
+        for proto_version in (1, 2):
+            for compressed in (True, False, None):
+                with self.subTest(proto_version=proto_version, compressed=compressed):
+                    decoded = _roundtrip(HiveMessageType.BUS, self.message,
+                                         proto_version, compressed)
+                    self.assertEqual(decoded.msg_type, HiveMessageType.BUS)
+                    self.assertEqual(decoded.payload.msg_type, "speak")
+                    self.assertEqual(decoded.payload.data, self.message.data)
+                    self.assertEqual(decoded.payload.context, self.message.context)
+
+    def test_msgpack_payload(self):
+        for compressed in (True, False):
+            with self.subTest(compressed=compressed):
+                decoded = _roundtrip(HiveMessageType.BUS, self.message, 2, compressed,
+                                     payload_encoding="msgpack")
+                self.assertEqual(decoded.payload.data, self.message.data)
+                self.assertEqual(decoded.payload.context, self.message.context)
+
+    def test_third_party(self):
+        payload = {"some": ["json", 1, None], "nested": {"a": 1.5}}
+        for proto_version in (1, 2):
+            for compressed in (True, False):
+                with self.subTest(proto_version=proto_version, compressed=compressed):
+                    decoded = _roundtrip(HiveMessageType.THIRDPRTY, payload,
+                                         proto_version, compressed)
+                    self.assertEqual(decoded.payload, payload)
+
+    def test_binary(self):
+        audio = bytes(range(256)) * 8
+        for proto_version in (1, 2):
+            for compressed in (True, False):
+                with self.subTest(proto_version=proto_version, compressed=compressed):
+                    decoded = _roundtrip(HiveMessageType.BINARY, audio, proto_version, compressed,
+                                         binary_type=HiveMindBinaryPayloadType.RAW_AUDIO,
+                                         hivemeta={"rate": 16000})
+                    self.assertEqual(decoded.msg_type, HiveMessageType.BINARY)
+                    self.assertEqual(decoded.payload, audio)
+                    self.assertEqual(decoded._meta["bin_type"],
+                                     HiveMindBinaryPayloadType.RAW_AUDIO)
+                    self.assertEqual(decoded._meta["rate"], 16000)
+
+    def test_v2_large_hivemeta(self):
+        # v1 has an 8 bit meta length, v2 a varint
+        meta = {"blob": "x" * 1000, "source_peer": "peer"}
+        for compressed in (True, False):
+            with self.subTest(compressed=compressed):
+                decoded = _roundtrip(HiveMessageType.BUS, self.message, 2, compressed,
+                                     hivemeta=meta)
+                self.assertEqual(decoded._meta["blob"], meta["blob"])
+                self.assertEqual(decoded.source_peer, "peer")
+                self.assertEqual(decoded.payload.data, self.message.data)
+
+    def test_v2_unknown_strings(self):
+        # message types and context keys missing from the id tables are sent literally
+        message = Message("not.in.the.table", {}, {"custom_key": "é", "lang": "en-us"})
+        decoded = _roundtrip(HiveMessageType.BUS, message, 2, False)
+        self.assertEqual(decoded.payload.msg_type, "not.in.the.table")
+        self.assertEqual(decoded.payload.context, message.context)
+
+    def test_compression_bytes(self):
+        for proto_version in (1, 2):
+            with self.subTest(proto_version=proto_version):
+                counter = Counter("compression", labels=("direction", "stage"))
+                frame = _frame(get_bitstring(HiveMessageType.BUS, self.message, compressed=True,
+                                             proto_version=proto_version,
+                                             versioned=proto_version > 1,
+                                             compression_bytes=counter))
+                decode_bitstring(frame, compression_bytes=counter)
+                values = counter.collect()
+                for direction in ("in", "out"):
+                    self.assertGreater(values[(direction, "raw")], values[(direction, "zlib")])
+
+
+class TestRoutes(unittest.TestCase):
+    route = [{"source": "a", "targets": ["b", "c"]},
+             {"source": "b", "targets": ["d"], "ts": 1}]
+
+    def _inner(self):
+        return HiveMessage(HiveMessageType.BUS, Message("speak", {"utterance": "hi"}),
+                           route=self.route)
+
+    def test_dict_and_compact_forms_are_equivalent(self):
+        compact = [["a", ["b", "c"]], ["b", ["d"], {"ts": 1}]]
+        self.assertEqual(HiveMessage(HiveMessageType.BUS, route=compact).route, self.route)
+        self.assertEqual(HiveMessage(HiveMessageType.BUS, route=self.route).compact_route, compact)
+
+    def test_v1_and_json_use_dict_routes(self):
+        for compressed in (True, False):
+            decoded = _roundtrip(HiveMessageType.BROADCAST, self._inner(), 1, compressed)
+            self.assertEqual(decoded._payload["route"], self.route)
+            self.assertEqual(decoded.payload.route, self.route)
+        message = HiveMessage(HiveMessageType.BROADCAST, self._inner())
+        self.assertEqual(message.as_dict["payload"]["route"], self.route)
+
+    def test_v2_uses_compact_routes(self):
+        for encoding in ("json", "msgpack"):
+            decoded = _roundtrip(HiveMessageType.BROADCAST, self._inner(), 2, False,
+                                 payload_encoding=encoding)
+            self.assertEqual(decoded._payload["route"], [["a", ["b", "c"]], ["b", ["d"], {"ts": 1}]])
+            self.assertEqual(decoded.payload.route, self.route)
+
+    def test_compact_route_forwarded_over_v1(self):
+        # received over v2, forwarded to a v1 peer
+        received = _roundtrip(HiveMessageType.BROADCAST, self._inner(), 2, False)
+        decoded = _roundtrip(HiveMessageType.BROADCAST, received.payload.as_dict, 1, False)
+        self.assertEqual(decoded._payload["route"], self.route)
+        forwarded = HiveMessage(HiveMessageType.BROADCAST, received._payload)
+        decoded = _roundtrip(HiveMessageType.PROPAGATE, forwarded, 1, False)
+        self.assertEqual(decoded._payload["payload"]["route"], self.route)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import json
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from ovos_bus_client.message import Message
+
+from hivemind_bus_client.client import HiveMessageBusClient
+from hivemind_bus_client.message import HiveMessage, HiveMessageType
+from hivemind_bus_client.mock import MockHiveMaster
+from hivemind_bus_client.tracing import MessageTracer, CallbackSink, get_traceparent, \
+    set_traceparent, make_traceparent, parse_traceparent, TRACE_KEY
+
+PASSWORD = "correct horse battery staple zebra"
+TRACE_ID, SPAN_ID = "a" * 32, "b" * 16
+
+
+def _wait(condition, timeout=5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class TestTraceparent(unittest.TestCase):
+    def test_parse(self):
+        value = make_traceparent(TRACE_ID, SPAN_ID)
+        self.assertEqual(value, f"00-{TRACE_ID}-{SPAN_ID}-01")
+        self.assertEqual(parse_traceparent(value), (TRACE_ID, SPAN_ID))
+        for invalid in (None, 42, "", "00-abc-def-01", f"00-{TRACE_ID}-{SPAN_ID}"):
+            self.assertIsNone(parse_traceparent(invalid))
+
+    def test_get_and_set(self):
+        value = make_traceparent(TRACE_ID, SPAN_ID)
+        message = HiveMessage(HiveMessageType.BUS, Message("speak"))
+        set_traceparent(message, value)
+        self.assertEqual(message.payload.context[TRACE_KEY], value)
+        self.assertEqual(get_traceparent(message), value)
+        # nested mycroft payload as a dict, the context dict is replaced, not mutated
+        context = {"source": "a"}
+        message = HiveMessage(HiveMessageType.PROPAGATE,
+                              {"msg_type": "bus", "payload": {"type": "speak", "data": {},
+                                                              "context": context}})
+        set_traceparent(message, value)
+        self.assertEqual(get_traceparent(message), value)
+        self.assertEqual(context, {"source": "a"})
+        # anything else carries it in the payload itself
+        message = HiveMessage(HiveMessageType.THIRDPRTY, {"foo": "bar"})
+        set_traceparent(message, value)
+        self.assertEqual(message.payload[TRACE_KEY], value)
+        self.assertIsNone(get_traceparent(HiveMessage(HiveMessageType.THIRDPRTY, {})))
+
+
+class TestMessageTracer(unittest.TestCase):
+    def setUp(self):
+        self.spans = []
+
+    def test_outgoing_starts_a_trace(self):
+        tracer = MessageTracer(self.spans.append)
+        self.assertIsInstance(tracer.sink, CallbackSink)
+        message = HiveMessage(HiveMessageType.BUS, Message("speak"))
+        span = tracer.outgoing(message)
+        self.assertIsNone(span["parent_span_id"])
+        self.assertEqual(parse_traceparent(get_traceparent(message)),
+                         (span["trace_id"], span["span_id"]))
+        tracer.finish(span, message)
+        self.assertEqual(len(self.spans), 1)
+        exported = self.spans[0]
+        self.assertEqual(exported["name"], "hivemind.send")
+        self.assertEqual(exported["msg_type"], "bus")
+        self.assertEqual(exported["payload_type"], "speak")
+        self.assertGreaterEqual(exported["duration"], 0)
+        self.assertNotIn("_t0", exported)
+
+    def test_incoming_continues_the_trace(self):
+        tracer = MessageTracer(self.spans.append, sample_rate=0)
+        message = HiveMessage(HiveMessageType.BUS,
+                              Message("speak", context={TRACE_KEY: make_traceparent(TRACE_ID, SPAN_ID)}))
+        span = tracer.incoming(message, time.perf_counter())
+        self.assertEqual(span["trace_id"], TRACE_ID)
+        self.assertEqual(span["parent_span_id"], SPAN_ID)
+        self.assertNotEqual(span["span_id"], SPAN_ID)
+        # replies made from it are children of this span
+        reply = HiveMessage(HiveMessageType.BUS, message.payload.reply("speak.reply"))
+        self.assertEqual(parse_traceparent(get_traceparent(reply)), (TRACE_ID, span["span_id"]))
+
+    def test_sampling(self):
+        tracer = MessageTracer(self.spans.append, sample_rate=0)
+        message = HiveMessage(HiveMessageType.BUS, Message("speak"))
+        self.assertIsNone(tracer.outgoing(message))
+        self.assertIsNone(tracer.incoming(message, time.perf_counter()))
+        self.assertIsNone(get_traceparent(message))
+        tracer.sample_rate = 1
+        self.assertIsNotNone(tracer.outgoing(message))
+
+    def test_no_propagation_on_binary(self):
+        tracer = MessageTracer(self.spans.append)
+        message = HiveMessage(HiveMessageType.HANDSHAKE, {"pubkey": "..."})
+        self.assertIsNotNone(tracer.outgoing(message))
+        self.assertNotIn(TRACE_KEY, message.payload)
+
+    def test_sink_errors_are_not_raised(self):
+        def broken(span):
+            raise RuntimeError("exporter down")
+
+        tracer = MessageTracer(broken)
+        message = HiveMessage(HiveMessageType.BUS, Message("speak"))
+        tracer.finish(tracer.outgoing(message), message)
+
+
+class TestClientTracing(unittest.TestCase):
+    def setUp(self):
+        self.spans = []
+
+    def test_caller_message_is_not_modified(self):
+        bus = HiveMessageBusClient("key", password=PASSWORD, tracer=MessageTracer(self.spans.append))
+        bus.client = MagicMock()
+        bus.protocol = MagicMock(binarize=False)
+        context = {"skill_id": "test"}
+        message = Message("speak", {"utterance": "hi"}, context)
+        bus._emit_now(HiveMessage(HiveMessageType.BUS, message))
+
+        self.assertIs(message.context, context)
+        self.assertEqual(context, {"skill_id": "test"})
+        sent = json.loads(bus.client.send.call_args[0][0])
+        self.assertEqual(parse_traceparent(sent["payload"]["context"][TRACE_KEY])[1],
+                         self.spans[0]["span_id"])
+        self.assertEqual(set(self.spans[0]["stages"]), {"prepare", "encode", "encrypt", "send"})
+
+        # non BUS messages are copied too
+        pload = {"foo": "bar"}
+        bus._emit_now(HiveMessage(HiveMessageType.THIRDPRTY, pload))
+        self.assertEqual(pload, {"foo": "bar"})
+        self.assertIn(TRACE_KEY, json.loads(bus.client.send.call_args[0][0])["payload"])
+
+    def test_trace_across_the_master(self):
+        master = MockHiveMaster(password=PASSWORD, mode="echo").start()
+        bus = HiveMessageBusClient("key", password=PASSWORD, host="ws://127.0.0.1", port=master.port,
+                                   tracer=MessageTracer(self.spans.append))
+        try:
+            bus.connect()
+            self.assertTrue(bus.handshake_event.wait(5))
+            self.spans.clear()
+            bus.emit_mycroft(Message("speak"))
+            self.assertTrue(_wait(lambda: any(s["name"] == "hivemind.receive" and
+                                              s["payload_type"] == "speak" for s in self.spans)))
+            sent = next(s for s in self.spans if s["name"] == "hivemind.send")
+            received = next(s for s in self.spans if s["name"] == "hivemind.receive")
+            # the echo carries the traceparent of the sent message
+            self.assertEqual(received["trace_id"], sent["trace_id"])
+            self.assertEqual(received["parent_span_id"], sent["span_id"])
+        finally:
+            bus.close()
+            master.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()